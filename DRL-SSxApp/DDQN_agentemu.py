@@ -63,267 +63,57 @@
 
 # ### **Imports**
 
-# Standard library imports
-import os
-import random
-import signal
-import sys
-from collections import deque, namedtuple
+# The Q-network, defined without any training dependencies
+from networks import DDQN_QNetwork
 
-# Third-party imports
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
-import torch.optim as optim
-
-from common import get_state, perform_action
-
-# ### **Hyperparameters and Constants**
-
-device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-print(device)
-
-
-# ### **Hyperparameters and environment-specific constants**
-LR = 1e-4  # Slightly higher learning rate for faster convergence
-BATCH_SIZE = 32  # Larger batch size for more efficient updates
-BUFFER_SIZE = int(1e5)  # Keep buffer size the same if memory allows
-UPDATE_EVERY = 4  # More frequent updates
-TAU = 5e-4  # Faster soft updatesng the target network. Determines how much of the local model's weights are copied to the target network.
-
-# Constants for PRB and DL Bytes mapping and thresholds
-PRB_INC_RATE = 6877  # Determines how many Physical Resource Blocks (PRB) to increase when adjusting PRB allocation.
-# We expect 27,253,551
-DL_BYTES_THRESHOLD = [
-    19922669,
-    6670690,
-    660192,
-]  # Thresholds for different slice types: Embb, Medium, Urllc.
-
-REWARD_PER_EPISODE = []  # List to store rewards for each episode
-EPISODE_MAX_TIMESTEP = 3  # Maximum number of timesteps per episodes
-
-
-# Initialize a counter for unique episodes
-unique_episode_counter = 0
+# The agent, replay buffer and training loop shared by all three models
+from agent_core import Agent, train_agent
 
+# Cached loader for the captured slice data
+from slice_data import load_ue_data
 
 # ### **Q-Network**
 # This class definition implements a Q-Network using PyTorch, which is a type of neural network used in reinforcement learning to approximate the Q-value function.
 
 
-# __init__: Initializes the Q-Network with the given parameters and defines the layers of the network with ReLU activations.
-# forward: Performs a forward pass through the network, taking an input state and returning the predicted Q-values for each action.
-class DDQN_QNetwork(nn.Module):
-    """
-    Q-Network for approximating the Q-value function.
-    The Q-network predicts Q-values for each action given a state.
-    """
-
-    def __init__(
-        self,
-        state_len,
-        action_len,
-        seed,
-        layer1_size=128,
-        layer2_size=128,
-        layer3_size=128,
-        layer4_size=128,
-    ):
-        super(DDQN_QNetwork, self).__init__()
-        self.seed = torch.manual_seed(seed)
-
-        # Define the layers of the Q-network with ReLU activations
-        self.l1 = nn.Linear(state_len, layer1_size)
-        self.l2 = nn.Linear(layer1_size, layer2_size)
-        self.l3 = nn.Linear(layer2_size, layer3_size)
-        self.l4 = nn.Linear(layer3_size, layer4_size)
-        self.l5 = nn.Linear(layer4_size, action_len)
-
-    def forward(self, input_state):
-        # Forward pass through the network
-        x = F.relu(self.l1(input_state))
-        x = F.relu(self.l2(x))
-        x = F.relu(self.l3(x))
-        x = F.relu(self.l4(x))
-        return self.l5(x)
+# The DDQN_QNetwork class itself is defined in `networks.py`.
 
 
 # ### **Agent**
 #
 # The Agent class represents an agent that interacts with an environment and learns from it using a Q-learning approach.
+# DDQN is the shared `Agent` from `agent_core.py` with a DDQN_QNetwork and the double target rule:
+# the local model selects the best action in the next state and the target model evaluates it.
 
 
-# __init__: Initializes the agent with state and action lengths, seed, and DDQN flag.
-# step: Adds an experience to the replay buffer and updates the model.
-# act: Chooses an action using an epsilon-greedy policy.
-# learn: Updates the Q-network based on sampled experiences.
-# soft_update: Updates the target Q-network by interpolating between local and target models.
-
-
-class DDQN:
+class DDQN(Agent):
     """
     Agent that interacts with the environment and learns from it using a Q-learning approach.
     """
 
-    def __init__(self, state_len, action_len, seed, DDQN=True):
-        self.action_len = action_len
-        self.state_len = state_len
-        self.seed = random.seed(seed)
-
-        # Initialize the local and target Q-networks
-        self.qnetwork_local = DDQN_QNetwork(state_len, action_len, seed).to(device)
-        self.qnetwork_target = DDQN_QNetwork(state_len, action_len, seed).to(device)
-        self.optimizer = optim.Adam(self.qnetwork_local.parameters(), lr=LR)
-        self.memory = DDQN_ReplayBuffer(action_len, BUFFER_SIZE, BATCH_SIZE)
-        self.t_step = 0
-        self.DDQN = DDQN
-
-    def step(self, state, action, reward, next_state, done):
-        # Add experience to replay buffer and update the model if necessary
-        self.memory.add(state, action, reward, next_state, done)
-
-        self.t_step = (self.t_step + 1) % UPDATE_EVERY
-        if self.t_step == 0 and len(self.memory) > BATCH_SIZE:
-            experiences = self.memory.sample()
-            self.learn(experiences, 0.99)
-
-    def act(self, state, eps=0.0):
-        # Choose an action using an epsilon-greedy policy
-        state = torch.from_numpy(state).float().unsqueeze(0).to(device)
-        self.qnetwork_local.eval()
-        with torch.no_grad():
-            action_values = self.qnetwork_local(state)
-        self.qnetwork_local.train()
-
-        if random.random() > eps:
-            return np.argmax(action_values.cpu().data.numpy())
-        else:
-            return random.choice(np.arange(self.action_len))
-
-    def learn(self, experiences, gamma):
-        # Update the Q-network based on the sampled experiences
-        states, actions, rewards, next_states, dones = experiences
-
-        # Get the Q-values for the current state using the local model
-        Q_expected = self.qnetwork_local(states).gather(1, actions)
-
-        # Double DQN logic:
-        # 1. Use the local model to select the best action in the next state
-        next_action = self.qnetwork_local(next_states).max(1)[1].unsqueeze(1)
-        # 2. Use the target model to calculate the Q-value for the selected action
-        Q_targets_next = self.qnetwork_target(next_states).gather(1, next_action)
-
-        Q_targets = rewards + (gamma * Q_targets_next * (1 - dones))
-
-        loss = F.mse_loss(Q_expected, Q_targets)
-        self.optimizer.zero_grad()
-        loss.backward()
-        self.optimizer.step()
-
-        # Perform soft update of the target model
-        self.soft_update(self.qnetwork_local, self.qnetwork_target, TAU)
-
-    def soft_update(self, local_model, target_model, tau):
-        for target_param, local_param in zip(
-            target_model.parameters(), local_model.parameters()
-        ):
-            target_param.data.copy_(
-                tau * local_param.data + (1.0 - tau) * target_param.data
-            )
-
-
-# ### **Replay Buffer**
-# the DDQN_ReplayBuffer class is used to store and sample experiences, which are used in reinforcement learning to train an agent
-
-# init: Initializes the buffer with the specified action size, buffer size, and batch size. It also creates a named tuple called Experience to store the state, action, reward, next state, and done information.
-# add: Adds a new experience to the buffer. The experience is represented by a named tuple.
-# sample: Samples a batch of experiences from the buffer. It randomly selects batch_size number of experiences and converts them into torch tensors.
-# len: Returns the number of experiences in the buffer.
-
-
-class DDQN_ReplayBuffer:
-    """
-    Replay Buffer for storing and sampling experiences.
-    """
-
-    def __init__(self, action_size, buffer_size, batch_size):
-        self.action_size = action_size
-        self.memory = deque(maxlen=buffer_size)
-        self.batch_size = batch_size
-        self.experience = namedtuple(
-            "Experience",
-            field_names=["state", "action", "reward", "next_state", "done"],
-        )
-        self.seed = random.random()
-
-    def add(self, state, action, reward, next_state, done):
-        # Add experience to the buffer
-        e = self.experience(state, action, reward, next_state, done)
-        self.memory.append(e)
-
-    def sample(self):
-        # Sample a batch of experiences from the buffer
-        experiences = random.sample(self.memory, k=self.batch_size)
-
-        states = (
-            torch.from_numpy(np.vstack([e.state for e in experiences if e is not None]))
-            .float()
-            .to(device)
-        )
-        actions = (
-            torch.from_numpy(
-                np.vstack([e.action for e in experiences if e is not None])
-            )
-            .long()
-            .to(device)
-        )
-        rewards = (
-            torch.from_numpy(
-                np.vstack([e.reward for e in experiences if e is not None])
-            )
-            .float()
-            .to(device)
-        )
-        next_states = (
-            torch.from_numpy(
-                np.vstack([e.next_state for e in experiences if e is not None])
-            )
-            .float()
-            .to(device)
-        )
-        dones = (
-            torch.from_numpy(
-                np.vstack([e.done for e in experiences if e is not None]).astype(
-                    np.uint8
-                )
-            )
-            .float()
-            .to(device)
+    def __init__(
+        self,
+        state_len,
+        action_len,
+        seed,
+        DDQN=True,
+        prioritized=False,
+        hard_update_every=None,
+    ):
+        super().__init__(
+            state_len,
+            action_len,
+            seed,
+            DDQN_QNetwork,
+            target_rule="double" if DDQN else "vanilla",
+            prioritized=prioritized,
+            hard_update_every=hard_update_every,
         )
-
-        return (states, actions, rewards, next_states, dones)
-
-    def __len__(self):
-        return len(self.memory)
+        self.DDQN = DDQN
 
 
 # ### **Training Function**
-# This is a Deep Q-Network (DQN) training function in Python. It trains an agent to make decisions in an environment with the goal of maximizing a reward signal. The function takes in several parameters that control the training process, such as the number of episodes, maximum timesteps, and exploration rate.
-
-
-# Initializes the agent, environment, and training parameters.
-# Loops through episodes, with each episode consisting of a sequence of timesteps.
-# At each timestep, the agent chooses an action based on the current state and exploration rate.
-# The environment responds with a reward and next state.
-# The agent updates its experience buffer with the current state, action, reward, and next state.
-# The agent updates its Q-network using the experience buffer.
-# The exploration rate is decayed over time to encourage exploitation.
-# The training process is repeated for a specified number of episodes.
-# The trained model is saved to a file.
+# Trains the agent with the shared loop in `agent_core.train_agent`, decaying epsilon every 400 episodes and plotting progress every 350,000 episodes.
 
 
 def run_ddqn(
@@ -336,158 +126,53 @@ def run_ddqn(
     pth_file="checkpoints/DDQN_checkpoint.pth",
     malicious_chance=1000,
     malicious_chance_increase=0.0,
+    env=None,
+    metrics=None,
+    checkpoint_file=None,
+    checkpoint_every=10000,
+    save_buffer=False,
+    resume=False,
 ):
     """
     Train the DQN agent with specified parameters and save checkpoints.
     """
-
-    unique_episode_counter = 0
-
-    eps = eps_start  # Initialize epsilon (exploration rate)
-    df, df_file_len = (
-        create_df()
-    )  # Create the dataframes for each slice and get their lengths
-
-    actions = []
-    rewards = []
-    total_prbs = [[], [], []]
-    dl_bytes = [[], [], []]
-    #  action_prbs = [2897, 965, 96]
-    action_prbs = [
-        2897,
-        965,
-        91,
-    ]  # eMBB, Medium, URLL make the connection between this and 100 RB for 20 Mhz in LTE.
-    total = 0
-
-    total = 0
-    correct = 0
-    reward_averages = list()
-    percentages = list()
-    action_count = [0 for x in range(4)]
-    EPISODE_MAX_TIMESTEP = max_t
-
-    for episode in range(1, n_episodes + 1):
-        done = False
-        temp = [-1] * EPISODE_MAX_TIMESTEP
-        max_t = 0
-        i = 1
-        # assigned PRBs to each slice
-        # action_prbs = [2897, 965, 96]
-        action_prbs = [2897, 965, 91]  # eMBB, Medium, URLLC
-
-        global DL_BYTE_TO_PRB_RATES
-        # number of DL bytes that each slice increases by per PRB
-        DL_BYTE_TO_PRB_RATES = [6877, 6877, 6877]
-
-        next_state = get_state(
-            action_prbs, DL_BYTE_TO_PRB_RATES, malicious_chance
-        )  # Get the initial state from the dataframes
-        while not done and max_t < EPISODE_MAX_TIMESTEP:
-            total += 1
-            state = next_state
-            action = agent.act(
-                np.array(state), eps
-            )  # Choose an action based on the current state
-            action_count[action] += 1
-
-            for i, prb_value in enumerate(total_prbs):
-                total_prbs[i].append(prb_value)
-                dl_bytes[i].append(state[i])
-
-            reward, done, action_prbs = perform_action(
-                action, state, i, action_prbs, DL_BYTES_THRESHOLD
-            )
-            actions.append(action)
-            rewards.append(reward)
-            if reward > 0:
-                correct += 1
-            malicious_chance += malicious_chance_increase
-            next_state = get_state(
-                action_prbs, DL_BYTE_TO_PRB_RATES, malicious_chance
-            )  # Get the initial state from the dataframes
-            agent.step(
-                state, action, reward, next_state, done
-            )  # Update the agent with the experience
-
-            # Update the score with the reward
-            max_t += 1  # Increment the timestep
-            i += 1  # Increment the step counter
-
-        if episode % 400 == 0:  # Decay epsilon every 500 episodes
-            eps = max(eps_end, eps_decay * eps)
-
-        # Store the score and actions
-        actions.append(temp)
-
-        # Update the state lists with the current state
-
-        # Increment the unique episode counter
-        unique_episode_counter += 1
-
-        # Check if 100 unique episodes have been processed
-        if unique_episode_counter >= 1000:
-            avg_reward = sum(rewards[-1000:]) / 1000  # Average of the last 100 rewards
-
-            print(f"\rEpisode {episode}\tAverage Score: {avg_reward:.2f}", end="")
-            reward_averages.append(avg_reward)
-            percentages.append(correct / total)
-
-            # Reset the unique episode counter
-            unique_episode_counter = 0
-        if episode % 350000 == 0:
-            print(f"\rEpisode {episode}\treward: {avg_reward}")
-            print("Percentage: ", correct / total)
-            fig, ax = plt.subplots(1, 3, figsize=(10, 5))
-
-            ax[0].plot(reward_averages, "r")
-            ax[0].set_title("Reward")
-
-            ax[1].plot(percentages, color="g")
-            ax[1].set_title("Percentages")
-
-            ax[2].bar(range(len(action_count)), action_count, color="b")
-            ax[2].set_title("Actions taken")
-
-            action_count = [0 for x in range(4)]
-
-            plt.show()
-
-    # Save the model checkpoint
-    torch.save(agent.qnetwork_local.state_dict(), pth_file)
-    print(f"Model saved to {pth_file}")
-
-    return rewards, (correct, total)
+    return train_agent(
+        agent,
+        n_episodes=n_episodes,
+        max_t=max_t,
+        eps_start=eps_start,
+        eps_end=eps_end,
+        eps_decay=eps_decay,
+        pth_file=pth_file,
+        malicious_chance=malicious_chance,
+        malicious_chance_increase=malicious_chance_increase,
+        eps_decay_every=400,
+        plot_every=350000,
+        env=env,
+        metrics=metrics,
+        checkpoint_file=checkpoint_file,
+        checkpoint_every=checkpoint_every,
+        save_buffer=save_buffer,
+        resume=resume,
+    )
 
 
 # ### **Create Data Frames**
 
 
-# This code reads CSV files from three directories (Embb, Medium, Urllc) into lists of Pandas data frames, calculates the number of data frames and their lengths, and returns the data frames and their lengths.
+# This code loads the CSV files of the three directories (Embb, Medium, Urllc) through the columnar cache in `slice_data.py`, builds lists of Pandas data frames from the memory-mapped cache, calculates the number of data frames and their lengths, and returns the data frames and their lengths.
 def create_df():  # Creates a data frame for each slice
     """
-    Creates data frames for each slice type (eMBB, Medium, UrLLC) by reading in csv files from the respective directories.
+    Creates data frames for each slice type (eMBB, Medium, UrLLC) from the csv files in the respective directories.
     Returns a list of data frames and their corresponding lengths.
     """
-    encoding = "utf-8"
-    # List CSV files from the specified directories for each slice type
-    embbFiles = os.listdir("Slicing_UE_Data/Embb/")
-    mediumFiles = os.listdir("Slicing_UE_Data/Medium/")
-    urllcFiles = os.listdir("Slicing_UE_Data/Urllc/")
-
-    # Read each CSV file into a list of data frames for each slice type
-    dfEmbb = [
-        pd.read_csv(f"Slicing_UE_Data/Embb/{file}", encoding=encoding)
-        for file in embbFiles
-    ]
-    dfMedium = [
-        pd.read_csv(f"Slicing_UE_Data/Medium/{file}", encoding=encoding)
-        for file in mediumFiles
-    ]
-    dfUrllc = [
-        pd.read_csv(f"Slicing_UE_Data/Urllc/{file}", encoding=encoding)
-        for file in urllcFiles
-    ]
+    # Load each slice type's csv files, parsing them only if the cache is stale
+    embbData, mediumData, urllcData = load_ue_data()
+
+    # Build a list of data frames for each slice type
+    dfEmbb = embbData.to_frames()
+    dfMedium = mediumData.to_frames()
+    dfUrllc = urllcData.to_frames()
 
     # Define global variables to store the size of data frames
     global EMBB_DF_SIZE
@@ -499,10 +184,10 @@ def create_df():  # Creates a data frame for each slice
     MEDIUM_DF_SIZE = len(dfMedium)
     URLLC_DF_SIZE = len(dfUrllc)
 
-    # Calculate the length of each data frame in the lists
-    embbFileLen = [len(fileDf) for fileDf in dfEmbb]
-    mediumFileLen = [len(fileDf) for fileDf in dfMedium]
-    urllcFileLen = [len(fileDf) for fileDf in dfUrllc]
+    # The length of each data frame in the lists
+    embbFileLen = embbData.file_lengths
+    mediumFileLen = mediumData.file_lengths
+    urllcFileLen = urllcData.file_lengths
 
     # Compact data frames and their lengths into lists
     df = [dfEmbb, dfMedium, dfUrllc]
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+
+# # `agent_core.py` -- Shared agent engine for the DQN, DDQN and Dueling DQN models
+#
+# The DQN, DDQN and Dueling DQN agents only differ in two places: the network
+# that approximates $Q(s, a)$ and the rule used to bootstrap the target value
+# in `learn()`. Everything else -- the replay buffer, epsilon-greedy action
+# selection, the gradient step, target-network updates, the training loop and
+# checkpointing -- lives here once and is shared by `DQN_agentemu.py`,
+# `DDQN_agentemu.py` and `Dueling_DQN_agentemu.py`.
+
+# ## **Code**
+
+# ### **Imports**
+# Standard library imports
+import os
+import random
+from collections import deque
+
+# Third-party imports
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+
+from checkpoint import load_checkpoint, save_checkpoint
+from common import VectorSliceEnv
+from replay_buffer import PrioritizedReplayBuffer, ReplayBuffer
+from target_update import TargetUpdater
+
+# ### **Hyperparameters and Constants**
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+LR = 1e-4  # Learning rate of the local Q-network
+BATCH_SIZE = 32  # Experiences per learning step
+BUFFER_SIZE = int(1e5)  # Capacity of the replay buffer
+UPDATE_EVERY = 4  # Learn once every UPDATE_EVERY transitions
+TAU = 5e-4  # Share of the local weights blended into the target network
+GAMMA = 0.99  # Discount factor
+
+
+# ### **Target Rules**
+#
+# A target rule computes $\\max_{a'} Q(s', a')$ for a batch of next states,
+# i.e. the bootstrapped part of the TD target
+#
+# $$ y = r + \\gamma \\max_{a'} Q(s', a') (1 - \\text{done}). $$
+#
+# - **vanilla** (DQN): the target network both selects and evaluates the next
+#   action, $\\max_{a'} Q_{\\text{target}}(s', a')$.
+# - **double** (DDQN, Dueling DQN): the local network selects the next action
+#   and the target network evaluates it,
+#   $Q_{\\text{target}}(s', \\arg\\max_{a'} Q_{\\text{local}}(s', a'))$, which
+#   reduces the overestimation bias of the vanilla rule.
+#
+# The dueling head is a property of the network (see `Dueling_QNetwork`), so
+# the Dueling DQN agent combines its network with the double rule.
+def vanilla_target(local_model, target_model, next_states):
+    return target_model(next_states).max(1, keepdim=True)[0]
+
+
+def double_target(local_model, target_model, next_states):
+    next_action = local_model(next_states).argmax(1, keepdim=True)
+    return target_model(next_states).gather(1, next_action)
+
+
+TARGET_RULES = {
+    "vanilla": vanilla_target,
+    "double": double_target,
+}
+
+
+# ### **Agent**
+#
+# The Agent class represents an agent that interacts with an environment and
+# learns from it using a Q-learning approach. `network_class` builds the local
+# and target Q-networks and `target_rule` names one of `TARGET_RULES`.
+#
+# __init__: Initializes the networks, optimizer, replay buffer and target
+# updater.
+# step / step_batch: Add one or a batch of experiences to the replay buffer and
+# learn once every UPDATE_EVERY transitions.
+# act / act_batch: Choose one or a batch of actions with an epsilon-greedy
+# policy.
+# learn: Updates the local Q-network based on sampled experiences.
+# save: Writes the local Q-network to a checkpoint.
+# state_dict / load_state_dict: Both networks, the optimizer, the learning
+# schedule and the RNG states, for resuming a training run (see
+# `checkpoint.py`). The replay buffer's contents are saved separately.
+class Agent:
+
+    def __init__(
+        self,
+        state_len,
+        action_len,
+        seed,
+        network_class,
+        target_rule="vanilla",
+        prioritized=False,
+        hard_update_every=None,
+    ):
+        if target_rule not in TARGET_RULES:
+            raise ValueError(f"Unknown target rule: {target_rule}")
+
+        self.action_len = action_len
+        self.state_len = state_len
+        self.seed = random.seed(seed)
+        self.rng = np.random.default_rng(seed)
+
+        # Initialize the local and target Q-networks
+        self.qnetwork_local = network_class(state_len, action_len, seed).to(device)
+        self.qnetwork_target = network_class(state_len, action_len, seed).to(device)
+        self.optimizer = optim.Adam(self.qnetwork_local.parameters(), lr=LR)
+        if prioritized:
+            self.memory = PrioritizedReplayBuffer(
+                state_len, BUFFER_SIZE, BATCH_SIZE, device, seed
+            )
+        else:
+            self.memory = ReplayBuffer(state_len, BUFFER_SIZE, BATCH_SIZE, device, seed)
+        self.prioritized = prioritized
+        self.target_rule = target_rule
+        self.target_fn = TARGET_RULES[target_rule]
+        self.target_updater = TargetUpdater(
+            self.qnetwork_local, self.qnetwork_target, TAU, hard_update_every
+        )
+        self.t_step = 0
+
+    def step(self, state, action, reward, next_state, done):
+        # Add experience to replay buffer and update the model if necessary
+        self.memory.add(state, action, reward, next_state, done)
+        self._learn_due(1)
+
+    def step_batch(self, states, actions, rewards, next_states, dones):
+        # Add a batch of experiences, e.g. one VectorSliceEnv step
+        self.memory.add_batch(states, actions, rewards, next_states, dones)
+        self._learn_due(len(states))
+
+    def _learn_due(self, num_transitions):
+        # Learn once for every UPDATE_EVERY transitions added
+        self.t_step += num_transitions
+        while self.t_step >= UPDATE_EVERY:
+            self.t_step -= UPDATE_EVERY
+            if len(self.memory) > BATCH_SIZE:
+                self.learn(self.memory.sample(), GAMMA)
+
+    def act(self, state, eps=0.0):
+        # Choose an action using an epsilon-greedy policy
+        if random.random() > eps:
+            return int(self.act_batch(np.asarray(state)[None], 0.0)[0])
+        return random.randrange(self.action_len)
+
+    def act_batch(self, states, eps=0.0):
+        # Choose one action per row of `states` using an epsilon-greedy policy
+        states = torch.from_numpy(np.asarray(states, dtype=np.float32)).to(device)
+        with torch.inference_mode():
+            actions = self.qnetwork_local(states).argmax(1).cpu().numpy()
+        if eps > 0:
+            explore = self.rng.random(len(actions)) < eps
+            actions[explore] = self.rng.integers(
+                0, self.action_len, size=np.count_nonzero(explore)
+            )
+        return actions
+
+    def learn(self, experiences, gamma):
+        # Update the Q-network based on the sampled experiences
+        states, actions, rewards, next_states, dones = experiences[:5]
+
+        # Get the Q-values for the current state using the local model
+        Q_expected = self.qnetwork_local(states).gather(1, actions)
+
+        # Bootstrap the target with the agent's target rule
+        with torch.no_grad():
+            Q_targets_next = self.target_fn(
+                self.qnetwork_local, self.qnetwork_target, next_states
+            )
+        Q_targets = rewards + (gamma * Q_targets_next * (1 - dones))
+
+        if self.prioritized:
+            # Weight each squared TD error by its importance sampling weight
+            # and feed the new TD errors back into the priorities
+            weights, idx = experiences[5:]
+            td_errors = Q_targets - Q_expected
+            loss = (weights * td_errors.pow(2)).mean()
+            self.memory.update_priorities(idx, td_errors.detach().cpu().numpy())
+        else:
+            loss = F.mse_loss(Q_expected, Q_targets)
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+
+        # Update the target model
+        self.target_updater.update()
+
+    def save(self, pth_file):
+        # Save the model checkpoint
+        torch.save(self.qnetwork_local.state_dict(), pth_file)
+        print(f"Model saved to {pth_file}")
+
+    def state_dict(self):
+        return {
+            "qnetwork_local": self.qnetwork_local.state_dict(),
+            "qnetwork_target": self.qnetwork_target.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "t_step": self.t_step,
+            "target_updates": self.target_updater.calls,
+            "random": random.getstate(),
+            "rng": self.rng.bit_generator.state,
+            "torch_rng": torch.get_rng_state(),
+            "memory": self.memory.state_dict(),
+        }
+
+    def load_state_dict(self, state, memory=True):
+        # With memory=False the replay buffer is left empty, e.g. when its
+        # contents were not saved
+        self.qnetwork_local.load_state_dict(state["qnetwork_local"])
+        self.qnetwork_target.load_state_dict(state["qnetwork_target"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.t_step = state["t_step"]
+        self.target_updater.calls = state["target_updates"]
+        random.setstate(state["random"])
+        self.rng.bit_generator.state = state["rng"]
+        torch.set_rng_state(state["torch_rng"])
+        if memory:
+            self.memory.load_state_dict(state["memory"])
+
+
+# ### **Training Function**
+#
+# Trains `agent` for `n_episodes` episodes and saves its local Q-network to
+# `pth_file`. Unless an `env` such as a TraceSliceEnv is passed in, the
+# environment is a VectorSliceEnv with `num_envs` copies: with
+# the default of one copy every episode plays out exactly like the original
+# `get_state`/`perform_action` loop, while larger values pick all actions with
+# one forward pass and add each step's transitions to the replay buffer in one
+# call. Learning still happens once every UPDATE_EVERY transitions.
+#
+# Epsilon decays by `eps_decay` every `eps_decay_every` episodes. The average
+# reward of the last 1000 transitions is printed every 1000 episodes and the
+# reward, accuracy and action histograms are plotted every `plot_every`
+# episodes.
+#
+# If a MetricsWriter is passed as `metrics`, the reward, action and state of
+# every transition are streamed to it instead of being kept in memory.
+#
+# With a `checkpoint_file`, the full training state is written to it every
+# `checkpoint_every` episodes (see `checkpoint.py`), including the replay
+# buffer if `save_buffer` is set. With `resume` and an existing checkpoint,
+# training continues from it and `metrics` drops the rows logged after it.
+#
+# Returns the reward of every transition (None when they went to `metrics`)
+# and (correct, total), where correct counts the transitions with a positive
+# reward. A resumed run without `metrics` only returns the rewards of the
+# transitions since the checkpoint.
+def train_agent(
+    agent,
+    n_episodes=1500,
+    max_t=3,
+    eps_start=1.0,
+    eps_end=0.01,
+    eps_decay=0.995,
+    pth_file="checkpoint.pth",
+    malicious_chance=1000,
+    malicious_chance_increase=0.0,
+    eps_decay_every=400,
+    plot_every=300000,
+    num_envs=1,
+    seed=None,
+    env=None,
+    metrics=None,
+    checkpoint_file=None,
+    checkpoint_every=10000,
+    save_buffer=False,
+    resume=False,
+):
+    if env is None:
+        env = VectorSliceEnv(
+            num_envs,
+            max_t=max_t,
+            malicious_chance=malicious_chance,
+            malicious_chance_increase=malicious_chance_increase,
+            seed=seed,
+        )
+    num_envs = env.num_envs
+
+    eps = eps_start  # Initialize epsilon (exploration rate)
+    rewards = [] if metrics is None else None
+    recent_rewards = deque(maxlen=1000)
+    total = 0
+    correct = 0
+    reward_averages = []
+    percentages = []
+    action_count = np.zeros(agent.action_len, dtype=np.int64)
+    episode = 0
+
+    if resume and checkpoint_file and os.path.exists(checkpoint_file):
+        progress = load_checkpoint(checkpoint_file, agent, env)
+        episode = progress["episode"]
+        eps = progress["eps"]
+        total = progress["total"]
+        correct = progress["correct"]
+        reward_averages = progress["reward_averages"]
+        percentages = progress["percentages"]
+        action_count[:] = progress["action_count"]
+        recent_rewards.extend(progress["recent_rewards"])
+        if metrics is not None:
+            metrics.truncate(progress["metrics_rows"])
+        print(f"Resumed from {checkpoint_file} at episode {episode}")
+
+    while episode < n_episodes:
+        states = env.states.copy()
+        actions = agent.act_batch(states, eps)
+        next_states, step_rewards, dones, finished = env.step(actions)
+        agent.step_batch(states, actions, step_rewards, next_states, dones)
+
+        if metrics is None:
+            rewards.extend(step_rewards.tolist())
+        else:
+            metrics.write(step_rewards, actions, states)
+        recent_rewards.extend(step_rewards.tolist())
+        total += num_envs
+        correct += int(np.count_nonzero(step_rewards > 0))
+        action_count += np.bincount(actions, minlength=agent.action_len)
+
+        checkpoint_due = False
+        for _ in range(int(np.count_nonzero(finished))):
+            episode += 1
+            if checkpoint_file and episode % checkpoint_every == 0:
+                checkpoint_due = True
+            if episode % eps_decay_every == 0:
+                eps = max(eps_end, eps_decay * eps)
+
+            if episode % 1000 == 0:
+                avg_reward = sum(recent_rewards) / 1000
+                print(f"\rEpisode {episode}\tAverage Score: {avg_reward:.2f}", end="")
+                reward_averages.append(avg_reward)
+                percentages.append(correct / total)
+
+            if episode % plot_every == 0:
+                print(f"\rEpisode {episode}\treward: {avg_reward}")
+                print("Percentage: ", correct / total)
+                plot_progress(reward_averages, percentages, action_count)
+                action_count[:] = 0
+
+            if episode >= n_episodes:
+                break
+
+        # Checkpoint between steps, once every finished episode is counted
+        if checkpoint_due:
+            if metrics is not None:
+                metrics.flush()
+            progress = {
+                "episode": episode,
+                "eps": eps,
+                "total": total,
+                "correct": correct,
+                "reward_averages": reward_averages,
+                "percentages": percentages,
+                "action_count": action_count.copy(),
+                "recent_rewards": list(recent_rewards),
+                "metrics_rows": len(metrics) if metrics is not None else 0,
+            }
+            save_checkpoint(checkpoint_file, agent, env, progress, save_buffer)
+
+    agent.save(pth_file)
+    if metrics is not None:
+        metrics.flush()
+
+    return rewards, (correct, total)
+
+
+def plot_progress(reward_averages, percentages, action_count):
+    # matplotlib is only needed when a plot is due
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(1, 3, figsize=(10, 5))
+
+    ax[0].plot(reward_averages, "r")
+    ax[0].set_title("Reward")
+
+    ax[1].plot(percentages, color="g")
+    ax[1].set_title("Percentages")
+
+    ax[2].bar(range(len(action_count)), action_count, color="b")
+    ax[2].set_title("Actions taken")
+
+    plt.show()
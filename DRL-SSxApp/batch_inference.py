@@ -0,0 +1,138 @@
+import numpy as np
+import torch
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+# Number of states scored per forward pass in the batched inference paths
+INFERENCE_CHUNK_SIZE = 65536
+
+
+# ### **Batched Greedy Actions**
+#
+# Scores a whole (num_states, 3) matrix of states with `model` and returns the
+# greedy action for each row. The states are pushed through the network in
+# chunks of `chunk_size` rows under `torch.inference_mode`, so the PyTorch
+# dispatch overhead is paid once per chunk instead of once per episode.
+#
+# Dueling_QNetwork subtracts the mean advantage of the whole batch rather than
+# of each row, which shifts every Q-value of a chunk by the same constant. The
+# argmax of each row, and therefore the selected action, is unaffected.
+def greedy_actions(model, states, chunk_size=INFERENCE_CHUNK_SIZE):
+    states = np.asarray(states, dtype=np.float32)
+    actions = np.empty(len(states), dtype=np.int64)
+    with torch.inference_mode():
+        for start in range(0, len(states), chunk_size):
+            chunk = torch.from_numpy(states[start : start + chunk_size]).to(device)
+            actions[start : start + chunk_size] = model(chunk).argmax(1).cpu().numpy()
+    return actions
+
+
+# ### **Attack Scenario Scoring**
+#
+# Vectorized scoring used by the batched `run_inference_epoch` of the attack
+# scenario scripts. `states` is the (num_episodes, 3) matrix of DL bytes,
+# `is_mal` the matching boolean matrix of malicious slices and
+# `selected_actions` the greedy action of each episode. A slice's DL bytes
+# count towards the throughput unless it is malicious and was not secured
+# (action 3). An episode is also wrong if the agent secures a slice when none
+# is malicious, or fails to secure one that is.
+#
+# Returns the accuracy, the average throughput per episode, the average
+# throughput of each slice and whether each slice meets 90% of its threshold.
+THRESHOLD_VALUES = np.array([19922669, 6670690, 660192])  # eMBB, MMTC, URLLC
+
+
+def score_attack_episodes(states, is_mal, selected_actions):
+    num_episodes = len(states)
+    secured = (selected_actions == 3)[:, None]
+    any_mal = is_mal.any(axis=1)
+
+    counted = ~is_mal | secured
+    slice_throughput = np.where(counted, states, 0).sum(axis=0)
+    incorrect_actions = np.count_nonzero(is_mal & ~secured)
+    incorrect_actions += np.count_nonzero(
+        ((selected_actions >= 3) & ~any_mal) | ((selected_actions != 3) & any_mal)
+    )
+
+    accuracy = 1 - (incorrect_actions / num_episodes)
+    avg_throughput = float(slice_throughput.sum() / num_episodes)
+    avg_slice_throughput = (slice_throughput / num_episodes).tolist()
+    threshold_status = (
+        ((slice_throughput / num_episodes) > THRESHOLD_VALUES * 0.9)
+        .astype(int)
+        .tolist()
+    )
+    return accuracy, avg_throughput, avg_slice_throughput, threshold_status
+
+
+# ### **DL-Byte CDF Simulation**
+#
+# Monte Carlo engine behind `plot_cdf_from_state`. Every epoch starts from the
+# base PRB allocation and DL byte rates and then takes `num_samples` steps. At
+# each step one slice may turn malicious (a 1 in `malicious_chance + 1`
+# chance), which multiplies its rate by 10. The total DL bytes of the slices
+# that are neither malicious nor above 1e8 are recorded. The model then picks
+# an action: actions 0-2 add 15 PRBs to a slice that has more than 50, and
+# action 3+ zeroes a slice.
+#
+# All epochs advance in lockstep: the PRBs, rates and malicious flags are
+# (num_epochs, 3) arrays, each step scores every epoch's state with one
+# batched forward pass, and the recorded totals are counted with `np.unique`.
+# Epochs are simulated in chunks of `chunk_epochs` so memory stays bounded for
+# millions of epochs.
+#
+# Returns the sorted distinct non-zero totals and how often each occurred.
+CDF_BASE_ACTION_PRBS = np.array([2897, 965, 91], dtype=np.int64)  # eMBB, Medium, URLLC
+CDF_BASE_DL_RATES = np.array([6877, 6877, 6877], dtype=np.int64)
+
+
+def simulate_dl_byte_totals(
+    model,
+    num_epochs=10000,
+    num_samples=4,
+    malicious_chance=8,
+    seed=None,
+    chunk_epochs=1 << 20,
+):
+    rng = np.random.default_rng(seed)
+    values = []
+    counts = []
+    for start in range(0, num_epochs, chunk_epochs):
+        n = min(chunk_epochs, num_epochs - start)
+        rows = np.arange(n)
+        action_prbs = np.tile(CDF_BASE_ACTION_PRBS, (n, 1))
+        dl_rates = np.tile(CDF_BASE_DL_RATES, (n, 1))
+        is_mal = np.zeros((n, 3), dtype=bool)
+        totals = []
+
+        for _ in range(num_samples):
+            hit = rows[
+                rng.integers(0, malicious_chance + 1, size=n) == malicious_chance
+            ]
+            index = rng.integers(0, 3, size=hit.size)
+            dl_rates[hit, index] *= 10
+            is_mal[hit, index] = True
+
+            states = dl_rates * action_prbs
+            counted = ~is_mal & (states < 1e8)
+            total_dl_bytes = np.where(counted, states, 0).sum(axis=1)
+            totals.append(total_dl_bytes[total_dl_bytes > 0])
+
+            selected_actions = greedy_actions(model, states)
+            grow = rows[selected_actions < 3]
+            grow_slice = selected_actions[grow]
+            allowed = action_prbs[grow, grow_slice] > 50
+            action_prbs[grow[allowed], grow_slice[allowed]] += 15
+            secure = rows[selected_actions >= 3]
+            action_prbs[secure, selected_actions[secure] - 3] = 0
+
+        chunk_values, chunk_counts = np.unique(
+            np.concatenate(totals), return_counts=True
+        )
+        values.append(chunk_values)
+        counts.append(chunk_counts)
+
+    # Merge the histograms of all chunks
+    values, inverse = np.unique(np.concatenate(values), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+    return values, counts
@@ -0,0 +1,85 @@
+import os
+import shutil
+
+import torch
+
+# ### **Training Checkpoints**
+#
+# `Agent.save` only writes the local Q-network, once training is over, so a
+# killed run has to start again from episode zero. A training checkpoint holds
+# everything `train_agent` needs to carry on where it stopped:
+#
+# - the local and target networks, the optimizer, the learning schedule and
+#   the Python, NumPy and torch RNG states (`Agent.state_dict`),
+# - the environment's episodes in progress and its RNG (`env.state_dict`),
+# - the training loop's progress: episode, epsilon, accuracy counters and the
+#   running averages.
+#
+# The replay buffer is optional. With `save_buffer=True` its arrays are
+# written as `.npy` files to a directory next to the checkpoint and read back
+# through a memory map, so even a full buffer loads in well under a second.
+# Without it the resumed run starts with an empty buffer and refills it before
+# learning again.
+#
+# Checkpoints are written atomically. The buffer goes to a new directory named
+# after the episode, the checkpoint itself to a temporary file that then
+# replaces the previous one, and only then are older buffer directories
+# removed. A crash at any point leaves the last complete checkpoint usable.
+CHECKPOINT_VERSION = 1
+
+
+def _buffer_dirs(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    prefix = f"{os.path.basename(path)}.buffer-"
+    return [
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith(prefix)
+    ]
+
+
+def save_checkpoint(path, agent, env, progress, save_buffer=False):
+    # Atomically write the full training state to `path`
+    buffer_dir = None
+    if save_buffer:
+        buffer_dir = f"{path}.buffer-{progress['episode']}"
+        tmp_dir = f"{buffer_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        agent.memory.save(tmp_dir)
+        shutil.rmtree(buffer_dir, ignore_errors=True)
+        os.replace(tmp_dir, buffer_dir)
+
+    checkpoint = {
+        "version": CHECKPOINT_VERSION,
+        "agent": agent.state_dict(),
+        "env": env.state_dict(),
+        "progress": progress,
+        "buffer": os.path.basename(buffer_dir) if buffer_dir else None,
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        torch.save(checkpoint, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    # Drop buffers of earlier checkpoints
+    for directory in _buffer_dirs(path):
+        if buffer_dir is None or directory != os.path.abspath(buffer_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def load_checkpoint(path, agent, env):
+    # Restore `agent` and `env` from `path` and return the training progress
+    checkpoint = torch.load(path, map_location="cpu", weights_only=False)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version in {path}")
+
+    buffer = checkpoint["buffer"]
+    agent.load_state_dict(checkpoint["agent"], memory=buffer is not None)
+    if buffer is not None:
+        directory = os.path.dirname(os.path.abspath(path))
+        agent.memory.load(os.path.join(directory, buffer))
+    env.load_state_dict(checkpoint["env"])
+    return checkpoint["progress"]
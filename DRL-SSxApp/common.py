@@ -75,3 +75,152 @@ def perform_action(action, state, i, action_prbs, DL_BYTES_THRESHOLD):
             reward += 0
 
     return reward, done, action_prbs
+
+
+# ### **Vectorized Slice Environment**
+#
+# VectorSliceEnv steps `num_envs` independent copies of the environment above
+# at once. PRB allocations, DL-byte-to-PRB rates and malicious flags are held
+# as (num_envs, 3) NumPy arrays, so one call to `step` replaces a Python loop
+# of `perform_action`/`get_state` pairs. The semantics match the scalar
+# functions: every state draw gives each environment a 1 in
+# `malicious_chance + 1` chance of one slice's rate growing tenfold, actions
+# 0-2 add 15 PRBs to a slice (minus 5 for every slice over its threshold) and
+# earn the DL bytes of every slice within its threshold, and action 3+ zeroes
+# a slice and earns the largest DL byte value if that slice was malicious.
+#
+# Episodes end when an environment's PRBs sum to zero (`dones`) or after
+# `max_t` timesteps. Finished environments are reset automatically; `step`
+# returns the next states from before the reset so that they can be stored in
+# the replay buffer, while `states` holds the observations for the next step.
+
+# Default allocation and environment constants shared by the training loops.
+BASE_ACTION_PRBS = [2897, 965, 91]  # eMBB, Medium, URLLC
+BASE_DL_BYTE_TO_PRB_RATES = [6877, 6877, 6877]
+DL_BYTES_THRESHOLD = [19922669, 6670690, 660192]  # eMBB, Medium, URLLC
+
+
+class VectorSliceEnv:
+
+    def __init__(
+        self,
+        num_envs,
+        max_t=4,
+        malicious_chance=1000,
+        malicious_chance_increase=0.0,
+        dl_bytes_threshold=DL_BYTES_THRESHOLD,
+        seed=None,
+    ):
+        self.num_envs = num_envs
+        self.max_t = max_t
+        self.malicious_chance = malicious_chance
+        self.malicious_chance_increase = malicious_chance_increase
+        self.dl_bytes_threshold = np.asarray(dl_bytes_threshold, dtype=np.int64)
+        self.rng = np.random.default_rng(seed)
+
+        self.action_prbs = np.empty((num_envs, 3), dtype=np.int64)
+        self.dl_byte_to_prb_rates = np.empty((num_envs, 3), dtype=np.int64)
+        self.malicious = np.zeros((num_envs, 3), dtype=bool)
+        self.timesteps = np.zeros(num_envs, dtype=np.int64)
+        self.states = np.empty((num_envs, 3), dtype=np.int64)
+        self._rows = np.arange(num_envs)
+        self.reset()
+
+    def reset(self, mask=None):
+        # Reset the environments selected by `mask` (all of them by default)
+        # and draw their initial states.
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        self.action_prbs[mask] = BASE_ACTION_PRBS
+        self.dl_byte_to_prb_rates[mask] = BASE_DL_BYTE_TO_PRB_RATES
+        self.malicious[mask] = False
+        self.timesteps[mask] = 0
+        self.states[mask] = self._draw_states(mask)
+        return self.states.copy()
+
+    def state_dict(self):
+        # Everything needed to continue the current episodes, e.g. after
+        # resuming a training run.
+        return {
+            "malicious_chance": self.malicious_chance,
+            "rng": self.rng.bit_generator.state,
+            "action_prbs": self.action_prbs.copy(),
+            "dl_byte_to_prb_rates": self.dl_byte_to_prb_rates.copy(),
+            "malicious": self.malicious.copy(),
+            "timesteps": self.timesteps.copy(),
+            "states": self.states.copy(),
+        }
+
+    def load_state_dict(self, state):
+        self.malicious_chance = state["malicious_chance"]
+        self.rng.bit_generator.state = state["rng"]
+        for name in (
+            "action_prbs",
+            "dl_byte_to_prb_rates",
+            "malicious",
+            "timesteps",
+            "states",
+        ):
+            getattr(self, name)[:] = state[name]
+
+    def _draw_states(self, mask):
+        # Vectorized `get_state` for the environments selected by `mask`.
+        rows = self._rows[mask]
+        self._draw_malicious(rows)
+        return self._observe(rows)
+
+    def _draw_malicious(self, rows):
+        # Give each of `rows` its chance of one slice's rate growing tenfold.
+        malicious_chance = self.malicious_chance
+        if malicious_chance < 100:
+            malicious_chance = 10000
+        chance = self.rng.integers(0, int(malicious_chance) + 1, size=rows.size)
+        hit = rows[chance == malicious_chance]
+        if hit.size:
+            slices = self.rng.integers(0, 3, size=hit.size)
+            self.dl_byte_to_prb_rates[hit, slices] *= 10
+            self.malicious[hit, slices] = True
+
+    def _observe(self, rows):
+        # DL bytes of each slice of `rows`.
+        return self.dl_byte_to_prb_rates[rows] * self.action_prbs[rows]
+
+    def step(self, actions):
+        # Vectorized `perform_action` followed by `get_state`.
+        # Returns (next_states, rewards, dones, finished), where `finished`
+        # marks the environments that were reset after this step.
+        actions = np.asarray(actions, dtype=np.int64)
+        states = self.states
+        over = states > self.dl_bytes_threshold
+
+        dones = self.action_prbs.sum(axis=1) == 0
+        live = ~dones
+        increase = live & (actions < 3)
+        secure = live & (actions >= 3)
+
+        rewards = np.zeros(self.num_envs, dtype=np.int64)
+
+        # Actions 0-2: grow the chosen slice, shrink slices over threshold.
+        rows = self._rows[increase]
+        self.action_prbs[rows, actions[rows]] += 15
+        self.action_prbs[rows] -= 5 * over[rows]
+        rewards[rows] = np.where(over[rows], 0, states[rows]).sum(axis=1)
+
+        # Actions 3+: secure the slice and reward catching a malicious one.
+        rows = self._rows[secure]
+        slices = actions[rows] - 3
+        self.action_prbs[rows, slices] = 0
+        rewards[rows] = np.where(
+            over[rows, slices], states[rows].max(axis=1), 0
+        )
+
+        self.malicious_chance += self.malicious_chance_increase
+        next_states = self._draw_states(np.ones(self.num_envs, dtype=bool))
+        self.states = next_states.copy()
+        self.timesteps += 1
+
+        finished = dones | (self.timesteps >= self.max_t)
+        if finished.any():
+            self.reset(finished)
+
+        return next_states, rewards, dones, finished
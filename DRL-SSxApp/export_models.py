@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+# # `export_models.py` -- TorchScript, ONNX and NumPy export of the trained Q-networks
+#
+# Writes a TorchScript module (`export/<model>.pt`), an ONNX graph
+# (`export/<model>.onnx`) and a flat `.npz` of the weights
+# (`export/<model>.npz`, served by `numpy_policy.py` without torch) for every
+# checkpoint in `pth/`, for the low-latency backends of `policy_runtime.py`.
+# Each artifact is loaded back and scored on the same states as the eager
+# model; an artifact whose Q-values are not within `--tolerance` (relative to
+# the largest Q-value) of the eager ones is deleted again and the command
+# fails.
+#
+# The TorchScript module is scripted rather than traced, so the Dueling
+# network's mean over the advantages is kept as an op instead of being baked
+# in for one batch size, and then frozen and optimized for inference. The ONNX
+# graph has a dynamic batch dimension. ONNX export needs the `onnx` package
+# and its parity check `onnxruntime`; without them the ONNX graph is
+# skipped.
+#
+# With `--benchmark` the per-decision latency of every available backend is
+# measured afterwards.
+#
+# Example:
+#
+# ```bash
+# python3 export_models.py --model_types DQN DDQN Dueling --benchmark
+# ```
+
+import argparse
+import inspect
+import os
+import sys
+import warnings
+
+import numpy as np
+import torch
+
+from networks import CHECKPOINTS, NETWORKS, load_network
+from numpy_policy import save_npz
+from policy_runtime import (
+    EXPORT_DIR,
+    INPUT_NAME,
+    OUTPUT_NAME,
+    available_backends,
+    build_policy,
+    decision_latencies,
+    export_paths,
+    onnxruntime,
+)
+
+try:
+    import onnx
+except ImportError:
+    onnx = None
+
+
+def parse():
+    """
+    Reads in CLI arguments
+    Returns argparse arguments object
+    """
+    parser = argparse.ArgumentParser(
+        description="Export the DQN, DDQN and Dueling DQN models to TorchScript, ONNX and NumPy")
+    parser.add_argument(
+        "--model_types",
+        type=str,
+        nargs="+",
+        default=list(NETWORKS),
+        help="Types of model to export. Options: DQN, DDQN, Dueling")
+    parser.add_argument(
+        "--export_dir",
+        type=str,
+        default=EXPORT_DIR,
+        help="Directory the artifacts are written to")
+    parser.add_argument(
+        "--num_states",
+        type=int,
+        default=10000,
+        help="Number of states the parity check scores")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-4,
+        help="Largest allowed Q-value difference, relative to the largest Q-value")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the parity check states")
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Measure the per-decision latency of every backend after exporting")
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=10000,
+        help="Number of decisions timed per backend")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of threads torch and onnxruntime may use")
+    return parser.parse_args()
+
+
+def parity_states(num_states, seed=None):
+    # The base state of the inference scenarios followed by states whose DL
+    # bytes per slice are spread log-uniformly over 1 to 1e10, which covers a
+    # slice being multiplied by 10 several times over
+    rng = np.random.default_rng(seed)
+    states = np.power(10.0, rng.uniform(0, 10, size=(num_states, 3)))
+    states[0] = [6877 * 2897, 6877 * 965, 6877 * 91]
+    return states.astype(np.float32)
+
+
+def export_torchscript(network, ts_file):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        module = torch.jit.optimize_for_inference(
+            torch.jit.freeze(torch.jit.script(network))
+        )
+        torch.jit.save(module, ts_file)
+
+
+def export_onnx(network, onnx_file):
+    kwargs = dict()
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        torch.onnx.export(
+            network,
+            (torch.zeros(1, 3),),
+            onnx_file,
+            input_names=[INPUT_NAME],
+            output_names=[OUTPUT_NAME],
+            dynamic_axes={INPUT_NAME: {0: "batch"}, OUTPUT_NAME: {0: "batch"}},
+            opset_version=17,
+            **kwargs,
+        )
+    onnx.checker.check_model(onnx.load(onnx_file))
+
+
+def check_parity(expected, policy, states, tolerance):
+    # Largest relative Q-value difference and share of matching greedy actions
+    q_values = policy.q_values(states)
+    scale = max(1.0, float(np.abs(expected).max()))
+    error = float(np.abs(q_values - expected).max()) / scale
+    agreement = float(np.mean(q_values.argmax(1) == expected.argmax(1)))
+    return error <= tolerance, error, agreement
+
+
+def export_model(args, model_type, states):
+    # Export one model; returns False if an artifact failed its parity check
+    network = load_network(model_type, "cpu", CHECKPOINTS[model_type])
+    with torch.inference_mode():
+        expected = network(torch.from_numpy(states)).numpy()
+    paths = export_paths(model_type, args.export_dir)
+
+    exported = ["torchscript", "numpy"]
+    export_torchscript(network, paths["torchscript"])
+    save_npz(network.state_dict(), paths["numpy"])
+    if onnx is not None:
+        export_onnx(network, paths["onnx"])
+        exported.append("onnx")
+    else:
+        print(f"{model_type}: onnx is not installed, skipping the ONNX export")
+
+    ok = True
+    for backend in exported:
+        if backend == "onnx" and onnxruntime is None:
+            print(f"{model_type} {backend}: onnxruntime is not installed, parity not checked")
+            continue
+        policy = build_policy(model_type, backend, args.export_dir, threads=args.threads)
+        passed, error, agreement = check_parity(expected, policy, states, args.tolerance)
+        print(f"{model_type} {backend}: max relative error {error:.2e}, "
+              f"greedy action agreement {agreement:.2%} -> {paths[backend]}")
+        if not passed:
+            print(f"{model_type} {backend}: parity check failed, removing {paths[backend]}")
+            os.remove(paths[backend])
+            ok = False
+    return ok
+
+
+def benchmark(args):
+    print(f"\nPer-decision latency in microseconds ({args.repeats} decisions, "
+          f"{args.threads} thread(s))")
+    print(f"{'Model':<10}{'Backend':<14}{'p50':>10}{'p99':>10}{'mean':>10}")
+    for model_type in args.model_types:
+        for backend in reversed(available_backends(model_type, args.export_dir)):
+            policy = build_policy(model_type, backend, args.export_dir, threads=args.threads)
+            us = decision_latencies(policy, repeats=args.repeats) * 1e6
+            print(f"{model_type:<10}{backend:<14}{np.percentile(us, 50):>10.1f}"
+                  f"{np.percentile(us, 99):>10.1f}{us.mean():>10.1f}")
+
+
+def main():
+
+    args = parse()
+    for model_type in args.model_types:
+        if model_type not in NETWORKS:
+            raise ValueError(f"Unknown model type: {model_type}")
+    torch.set_num_threads(args.threads)
+    os.makedirs(args.export_dir, exist_ok=True)
+
+    states = parity_states(args.num_states, args.seed)
+    ok = True
+    for model_type in args.model_types:
+        ok = export_model(args, model_type, states) and ok
+
+    if args.benchmark:
+        benchmark(args)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    rc = main()
+    sys.exit(rc)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+# # `inference.py` -- Inference-only entry point for the DQN, DDQN and Dueling DQN models
+#
+# Loads a trained checkpoint and measures how accurately it detects malicious
+# slices, like `model_inference.py --operation inference`, but imports nothing
+# beyond torch, NumPy and the network definitions in `networks.py`. The
+# training modules, pandas, matplotlib and scipy are never loaded, which keeps
+# the start-up cost of many short-lived evaluation jobs low.
+#
+# With `--quantize` the model's `nn.Linear` layers are dynamically quantized
+# to int8 and both versions are scored on the same seeded scenario. The
+# quantized state_dict is only written (to `export/<model>_int8.pth`, where
+# `policy_runtime.py` picks it up) if its accuracy is at most
+# `--accuracy_tolerance` below the float32 model's. The per-decision and
+# batched latency and the size of the weights of both versions are reported.
+#
+# Example:
+#
+# ```bash
+# python3 inference.py --model_type DDQN --num_episodes 300000 --batched
+# python3 inference.py --model_type DDQN --quantize --batched --accuracy_tolerance 0.001
+# ```
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import torch
+
+from batch_inference import greedy_actions
+from model_registry import get_model
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+def parse():
+    """
+    Reads in CLI arguments
+    Returns argparse arguments object
+    """
+    parser = argparse.ArgumentParser(
+        description="Run an inference on DQN DDQN and Dueling DQN models")
+    parser.add_argument(
+        "--model_type",
+        type=str,
+        default="DQN",
+        help="Type of model to use. Options: DQN, DDQN, Dueling")
+    parser.add_argument(
+        "--pth_file",
+        type=str,
+        default=None,
+        help="Checkpoint to load instead of the model type's default in pth/")
+    parser.add_argument(
+        "--num_episodes",
+        type=int,
+        default=300000,
+        help="The number of episodes to run")
+    parser.add_argument("--malicious_chance",
+                    type=int,
+                    default=100,
+                    help="The chance of any UE to become malicious in one timestep (1/malicious_chance chance)")
+    parser.add_argument("--batched",
+                    action="store_true",
+                    help="Generate all inference states up front and score them in large batches")
+    parser.add_argument("--seed",
+                    type=int,
+                    default=None,
+                    help="Seed of the inference scenario")
+    parser.add_argument("--quantize",
+                    action="store_true",
+                    help="Quantize the model to int8 and save it if it passes the accuracy gate")
+    parser.add_argument("--accuracy_tolerance",
+                    type=float,
+                    default=0.001,
+                    help="Largest accuracy drop the quantized model may have")
+    parser.add_argument("--export_dir",
+                    type=str,
+                    default="export",
+                    help="Directory the quantized model is written to")
+    return parser.parse_args()
+
+
+# Malicious events after which a slice's DL byte rate saturates in the batched
+# scenario; 6877 * 2897 * 10**20 is about 2e27, while float32 reaches 3.4e38
+# and the networks' hidden layers overflow from about 1e32
+MAX_MALICIOUS_EVENTS = 20
+
+
+def get_action(agent, state):
+    with torch.no_grad():
+        action_values = agent(state)
+    return np.argmax(action_values.cpu().data.numpy())
+
+def run_inference_epoch(agent, num_episodes, malicious_chance, batched=False, seed=None):
+    if batched:
+        return run_inference_epoch_batched(agent, num_episodes, malicious_chance, seed)
+    rng = random if seed is None else random.Random(seed)
+    action_prbs = [2897, 965, 91]  # eMBB, Medium, URLLC
+    global DL_BYTE_TO_PRB_RATES
+    DL_BYTE_TO_PRB_RATES = [6877, 6877, 6877]
+    is_mal = False
+    incorrect_actions = 0
+    for i in range(num_episodes):
+        if rng.randint(0,int(malicious_chance)) == malicious_chance:
+            is_mal = True
+            DL_BYTE_TO_PRB_RATES[rng.randint(0,2)] *= 10
+        state = [DL_BYTE_TO_PRB_RATES[0] * action_prbs[0],
+                DL_BYTE_TO_PRB_RATES[1] * action_prbs[1],
+                DL_BYTE_TO_PRB_RATES[2] * action_prbs[2]]
+        np_state = np.array(state, dtype=np.int64)
+        state = torch.from_numpy(np_state).float().unsqueeze(0).to(device)
+        selected_action = get_action(agent, state)
+        if selected_action >= 3 and not is_mal:
+            incorrect_actions += 1
+        elif selected_action < 3 and is_mal:
+            incorrect_actions += 1
+            is_mal = False
+    return 1 - (incorrect_actions / num_episodes)
+
+
+def run_inference_epoch_batched(agent, num_episodes, malicious_chance, seed=None):
+    """
+    Vectorized run_inference_epoch. The states never depend on the selected
+    actions, so all of them are generated up front as one (num_episodes, 3)
+    matrix and scored with batched forward passes.
+
+    A slice's rate stops growing after MAX_MALICIOUS_EVENTS malicious events,
+    which keeps long runs' states finite in float32 and inside the range the
+    networks score without overflowing. The sequential path cannot get that
+    far: its int64 states overflow after about 12 events.
+    """
+    rng = np.random.default_rng(seed)
+    action_prbs = np.array([2897, 965, 91], dtype=np.float64)  # eMBB, Medium, URLLC
+    episodes = np.arange(num_episodes)
+
+    # The DL byte rates are never reset, so every malicious event multiplies
+    # its slice's rate by 10 for the rest of the run
+    hits = rng.integers(0, int(malicious_chance) + 1, size=num_episodes) == malicious_chance
+    slices = rng.integers(0, 3, size=num_episodes)
+    mal_counts = np.zeros((num_episodes, 3), dtype=np.float64)
+    mal_counts[episodes[hits], slices[hits]] = 1
+    np.cumsum(mal_counts, axis=0, out=mal_counts)
+    np.minimum(mal_counts, MAX_MALICIOUS_EVENTS, out=mal_counts)
+    states = 6877 * np.power(10.0, mal_counts) * action_prbs
+
+    selected_actions = greedy_actions(agent, states)
+
+    # A slice stays flagged from its malicious event until the first action
+    # below 3, which clears the flag after being counted as incorrect
+    last_mal = np.maximum.accumulate(np.where(hits, episodes, -1))
+    last_low = np.maximum.accumulate(np.where(selected_actions < 3, episodes, -1))
+    last_low_before = np.concatenate(([-1], last_low[:-1]))
+    is_mal = last_mal > last_low_before
+
+    incorrect = ((selected_actions >= 3) & ~is_mal) | ((selected_actions < 3) & is_mal)
+    return 1 - (np.count_nonzero(incorrect) / num_episodes)
+
+
+def inference(args):
+    # Also runs `model_inference.py --operation inference`, which has no
+    # quantization options
+    if getattr(args, "quantize", False):
+        return quantize(args)
+    agent = get_model(args.model_type, device, args.pth_file)
+    print(run_inference_epoch(agent, args.num_episodes, args.malicious_chance,
+                              batched=args.batched, seed=args.seed))
+    return 0
+
+
+def weights_size(model):
+    # Bytes of the serialized state_dict
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def batch_latency(model, batch_size=4096, repeats=20):
+    # Median seconds to score one batch of `batch_size` states
+    states = torch.rand(batch_size, 3) * 1e8
+    timings = []
+    with torch.inference_mode():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(states)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def quantize(args):
+    # policy_runtime is only imported here, so plain inference runs never
+    # load it or try onnxruntime
+    from policy_runtime import TorchPolicy, decision_latencies, export_paths, quantize_network
+
+    # The quantized kernels only run on the CPU
+    if device.type != "cpu":
+        print("--quantize needs the CPU device")
+        return 1
+    seed = 0 if args.seed is None else args.seed
+    model = get_model(args.model_type, device, args.pth_file)
+    quantized = quantize_network(model)
+
+    report = {}
+    for name, agent in (("float32", model), ("int8", quantized)):
+        try:
+            accuracy = run_inference_epoch(agent, args.num_episodes, args.malicious_chance,
+                                           batched=args.batched, seed=seed)
+        except RuntimeError as e:
+            # Dynamic quantization cannot pick a scale for non-finite
+            # activations, which long scenarios reach once a slice has been
+            # multiplied by 10 too often
+            print(f"The {name} model cannot score this scenario ({e}), "
+                  "try fewer --num_episodes or a larger --malicious_chance")
+            return 1
+        report[name] = {
+            "accuracy": accuracy,
+            "decision_us": np.median(decision_latencies(TorchPolicy(args.model_type, agent))) * 1e6,
+            "batch_ms": batch_latency(agent) * 1e3,
+            "weights_kb": weights_size(agent) / 1024,
+        }
+    print(f"{'':<10}{'accuracy':>12}{'decision (us)':>16}{'batch 4096 (ms)':>18}{'weights (KB)':>15}")
+    for name, row in report.items():
+        print(f"{name:<10}{row['accuracy']:>12.6f}{row['decision_us']:>16.1f}"
+              f"{row['batch_ms']:>18.2f}{row['weights_kb']:>15.1f}")
+    fp32, int8 = report["float32"], report["int8"]
+    print(f"Decision speedup {fp32['decision_us'] / int8['decision_us']:.2f}x, "
+          f"batch speedup {fp32['batch_ms'] / int8['batch_ms']:.2f}x, "
+          f"weights {fp32['weights_kb'] / int8['weights_kb']:.2f}x smaller")
+
+    drop = fp32["accuracy"] - int8["accuracy"]
+    if drop > args.accuracy_tolerance:
+        print(f"Accuracy drops by {drop:.6f} (tolerance {args.accuracy_tolerance}), "
+              "not saving the quantized model")
+        return 1
+    os.makedirs(args.export_dir, exist_ok=True)
+    pth_file = export_paths(args.model_type, args.export_dir)["int8"]
+    torch.save(quantized.state_dict(), pth_file)
+    print(f"Quantized model saved to {pth_file}")
+    return 0
+
+
+def main():
+
+    args = parse()
+    return inference(args)
+
+
+if __name__ == "__main__":
+    rc = main()
+    sys.exit(rc)
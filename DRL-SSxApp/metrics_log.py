@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+
+# ### **Training Metrics Log**
+#
+# Keeping every reward of a training run in a Python list costs memory that
+# grows with the run (1.2M entries at 300k episodes of 4 steps) and loses
+# everything if the run crashes before the list is written out.
+#
+# MetricsWriter instead buffers the reward, action and per-slice state of each
+# transition in fixed-size NumPy arrays and appends every full buffer to one
+# file as a `.npy` record, i.e. a standard `.npy` header followed by the raw
+# chunk. Records of one log all share the structured dtype returned by
+# `metrics_dtype`, and a record is only written once its chunk is complete,
+# so memory stays at one chunk however long the run is.
+#
+# Each record is flushed and synced to disk when it is written. If the run
+# dies, at most the rows of the current chunk are lost. A record cut short by
+# the crash is skipped by the readers, and a writer opened with `mode="a"`
+# truncates it before appending. A resumed training run also calls
+# `truncate` to drop the rows logged after its checkpoint.
+#
+# `iter_chunks` yields the records one at a time, `load_metrics` concatenates
+# them and `export_rewards_csv` writes the reward column in the single-column
+# CSV layout of the old `*_episode_rewards.csv` files, chunk by chunk.
+CHUNK_SIZE = 65536
+NUM_SLICES = 3
+
+
+def metrics_dtype(num_slices=NUM_SLICES):
+    return np.dtype(
+        [
+            ("reward", np.int64),
+            ("action", np.int64),
+            ("state", np.int64, (num_slices,)),
+        ]
+    )
+
+
+def _read_record(f):
+    # Read one `.npy` record from `f`, or return None at the end of the file
+    # or at a truncated record
+    try:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    except ValueError:
+        return None
+    count = int(np.prod(shape))
+    data = f.read(count * dtype.itemsize)
+    if len(data) < count * dtype.itemsize:
+        return None
+    return np.frombuffer(data, dtype=dtype, count=count).reshape(shape)
+
+
+def _complete_length(path, max_rows=None):
+    # Byte length and row count of the complete records at the start of
+    # `path`, stopping once `max_rows` rows are covered
+    end = 0
+    rows = 0
+    with open(path, "rb") as f:
+        while max_rows is None or rows < max_rows:
+            chunk = _read_record(f)
+            if chunk is None:
+                break
+            end = f.tell()
+            rows += len(chunk)
+    return end, rows
+
+
+class MetricsWriter:
+    # Append-only, chunked log of the transitions of a training run
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE, num_slices=NUM_SLICES, mode="w"):
+        if mode not in ("w", "a"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.path = path
+        self.dtype = metrics_dtype(num_slices)
+        self.buffer = np.zeros(chunk_size, dtype=self.dtype)
+        self.size = 0
+        self.rows_written = 0
+
+        if mode == "a" and os.path.exists(path):
+            # Drop a record left incomplete by a crash
+            self._truncate(None)
+        self.file = open(path, "ab" if mode == "a" else "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        # Rows written so far, including those still buffered
+        return self.rows_written + self.size
+
+    def write(self, rewards, actions, states):
+        # Add one row per transition, e.g. one VectorSliceEnv step
+        rewards = np.atleast_1d(rewards)
+        actions = np.atleast_1d(actions)
+        states = np.reshape(states, (len(rewards), -1))
+        start = 0
+        while start < len(rewards):
+            n = min(len(rewards) - start, len(self.buffer) - self.size)
+            rows = slice(self.size, self.size + n)
+            self.buffer["reward"][rows] = rewards[start : start + n]
+            self.buffer["action"][rows] = actions[start : start + n]
+            self.buffer["state"][rows] = states[start : start + n]
+            self.size += n
+            start += n
+            if self.size == len(self.buffer):
+                self.flush()
+
+    def _truncate(self, rows):
+        end, self.rows_written = _complete_length(self.path, rows)
+        with open(self.path, "r+b") as f:
+            f.truncate(end)
+
+    def truncate(self, rows):
+        # Drop everything after the first `rows` rows, e.g. the rows logged
+        # after the checkpoint a run resumes from. `rows` must fall on the
+        # end of a record, as it does when it is taken right after `flush`.
+        self.file.close()
+        self.size = 0
+        self._truncate(rows)
+        if self.rows_written != rows:
+            raise ValueError(f"{self.path} has no record boundary at row {rows}")
+        self.file = open(self.path, "ab")
+
+    def flush(self):
+        # Append the buffered rows as one record and sync it to disk
+        if self.size == 0:
+            return
+        np.lib.format.write_array(self.file, self.buffer[: self.size])
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.rows_written += self.size
+        self.size = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+
+def iter_chunks(path):
+    # Yield the complete records of a metrics log in order
+    with open(path, "rb") as f:
+        while True:
+            chunk = _read_record(f)
+            if chunk is None:
+                return
+            yield chunk
+
+
+def load_metrics(path):
+    # Every row of a metrics log as one structured array
+    chunks = list(iter_chunks(path))
+    if not chunks:
+        return np.zeros(0, dtype=metrics_dtype())
+    return np.concatenate(chunks)
+
+
+def export_rewards_csv(path, csv_path):
+    # Write the reward column of a metrics log as a one-column CSV
+    with open(csv_path, "w") as f:
+        f.write("Reward\n")
+        for chunk in iter_chunks(path):
+            np.savetxt(f, chunk["reward"], fmt="%d")
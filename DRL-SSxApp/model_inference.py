@@ -1,16 +1,14 @@
-from DQN_agentemu import DQN, DQN_QNetwork, run_dqn
-from DDQN_agentemu import DDQN, DDQN_QNetwork, run_ddqn
-from Dueling_DQN_agentemu import DQN_Dueling, Dueling_QNetwork, run_dueling
-from collections import defaultdict
 import argparse
+import os
 import sys
-import pandas as pd
 import torch
 import numpy as np
-from common import get_state
-import random
-import matplotlib.pyplot as plt
-from scipy.stats import relfreq
+# Inference only needs torch, NumPy and the networks. The training modules,
+# pandas and matplotlib are imported by the operations that use them.
+from model_registry import get_model
+from batch_inference import simulate_dl_byte_totals
+from inference import inference
+from metrics_log import MetricsWriter, export_rewards_csv
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
@@ -31,6 +29,11 @@ def parse():
         type=str,
         default="DQN",
         help="Type of model to use. Options: DQN, DDQN, Dueling")
+    parser.add_argument(
+        "--pth_file",
+        type=str,
+        default=None,
+        help="Checkpoint to load instead of the model type's default in pth/")
     parser.add_argument(
         "--num_episodes",
         type=int,
@@ -45,166 +48,236 @@ def parse():
                     type=float,
                     default=0,
                     help="The rate of increase of the malicious chance (malicious_chance+=malicious_chance_increase)")
-    return parser.parse_args()
+    parser.add_argument("--prioritized",
+                    action="store_true",
+                    help="Train with prioritized experience replay instead of uniform sampling")
+    parser.add_argument("--batched",
+                    action="store_true",
+                    help="Generate all inference states up front and score them in large batches")
+    parser.add_argument("--seed",
+                    type=int,
+                    default=None,
+                    help="Seed of the inference scenario")
+    parser.add_argument("--num_actors",
+                    type=int,
+                    default=0,
+                    help="Train with this many parallel actor processes feeding one learner (0 trains on a single thread)")
+    parser.add_argument("--cdf_epochs",
+                    type=int,
+                    default=10000,
+                    help="The number of Monte Carlo epochs simulated by the cdf operation")
+    parser.add_argument("--trace_env",
+                    action="store_true",
+                    help="Train on DL bytes replayed from the captured UE traces instead of the synthetic environment")
+    parser.add_argument("--resume",
+                    action="store_true",
+                    help="Continue training from the model's last training checkpoint, if there is one")
+    parser.add_argument("--checkpoint_every",
+                    type=int,
+                    default=10000,
+                    help="Write a training checkpoint every this many episodes")
+    parser.add_argument("--save_buffer",
+                    action="store_true",
+                    help="Include the replay buffer in training checkpoints")
+    args = parser.parse_args()
+
+    # The parallel actors run the synthetic environment, and run_parallel
+    # neither writes nor resumes training checkpoints
+    if args.operation == "train" and args.num_actors > 0:
+        unsupported = [flag for flag, used in (
+            ("--resume", args.resume),
+            ("--trace_env", args.trace_env),
+            ("--save_buffer", args.save_buffer),
+            ("--checkpoint_every", args.checkpoint_every != parser.get_default("checkpoint_every")),
+        ) if used]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} cannot be combined with --num_actors")
+    return args
+
+
+def save_rewards(rewards, metrics, csv_file):
+    # Write the rewards of a training run to `csv_file`. Single-threaded runs
+    # stream their transitions to `metrics` and return no reward list;
+    # parallel runs have no `metrics`.
+    if metrics is not None:
+        metrics.close()
+    if rewards is None:
+        export_rewards_csv(metrics.path, csv_file)
+    else:
+        import pandas as pd
+        rewards_df = pd.DataFrame(rewards, columns=["Reward"])
+        rewards_df.to_csv(csv_file, index=False)
 
 
 def train(args):
+    from parallel_training import run_parallel
+
+    # Full training state, written periodically so that --resume can pick up
+    # a killed run
+    checkpoint_file = f"{args.model_type}_training_state.pt"
+    # Only a run that really resumes from a checkpoint continues its metrics
+    # log, under the same condition train_agent resumes on
+    resuming = args.resume and os.path.exists(checkpoint_file)
+
+    # Rewards, actions and states of every transition, appended to disk in
+    # chunks while the agent trains. Parallel runs return their rewards
+    # instead, so they leave the metrics log of earlier runs alone.
+    metrics = None
+    if args.num_actors == 0:
+        metrics = MetricsWriter(f"reward_data/{args.model_type}_metrics.npy",
+                                mode="a" if resuming else "w")
+
+    env = None
+    if args.trace_env:
+        from trace_env import TraceSliceEnv
+        env = TraceSliceEnv(
+            1,
+            max_t=4,
+            malicious_chance=args.malicious_chance,
+            malicious_chance_increase=args.malicious_chance_increase)
+
     if args.model_type == "DQN":
+        from DQN_agentemu import DQN, run_dqn
         state_size = 3
         action_size = 4  # Actions: Increase PRB, Decrease PRB, Secure Slice
 
 # Initialize the agent
-        agent = DQN(state_size, action_size, seed=0, DDQN=False)
+        agent = DQN(state_size, action_size, seed=0, DDQN=False, prioritized=args.prioritized)
 
 # With 1000 max_t mathematically every slice should become malicious in every
 # episode at some point
-        rewards, percent = run_dqn(
-            agent,
-            n_episodes=args.num_episodes,
-            max_t=4,
-            eps_start=1.0,
-            eps_end=0.01,
-            eps_decay=0.99,
-            pth_file='DQNcheckpoint.pth',
-            malicious_chance=args.malicious_chance,
-            malicious_chance_increase=args.malicious_chance_increase
-        )
+        if args.num_actors > 0:
+            rewards, percent = run_parallel(
+                agent,
+                n_episodes=args.num_episodes,
+                max_t=4,
+                pth_file='DQNcheckpoint.pth',
+                malicious_chance=args.malicious_chance,
+                malicious_chance_increase=args.malicious_chance_increase,
+                num_actors=args.num_actors
+            )
+        else:
+            rewards, percent = run_dqn(
+                agent,
+                n_episodes=args.num_episodes,
+                max_t=4,
+                eps_start=1.0,
+                eps_end=0.01,
+                eps_decay=0.99,
+                pth_file='DQNcheckpoint.pth',
+                malicious_chance=args.malicious_chance,
+                malicious_chance_increase=args.malicious_chance_increase,
+                env=env,
+                metrics=metrics,
+                checkpoint_file=checkpoint_file,
+                checkpoint_every=args.checkpoint_every,
+                save_buffer=args.save_buffer,
+                resume=args.resume
+            )
 
 # Print test results
         print("Tests correct: " + str(percent[0]))
         print("Tests incorrect: " + str(percent[1]))
 
         # Save rewards to CSV after training
-        rewards_df = pd.DataFrame(rewards, columns=["Reward"])
-        rewards_df.to_csv("reward_data/DQN_episode_rewards.csv", index=False)
+        save_rewards(rewards, metrics, "reward_data/DQN_episode_rewards.csv")
         print("Rewards saved to episode_rewards.csv")
     elif args.model_type == "DDQN":
+        from DDQN_agentemu import DDQN, run_ddqn
 # Define the state size and action size for the agen10100,t
         state_size = 3
         action_size = 4  # Actions: Increase PRB, Decrease PRB, Secure Slice
 
 # Initialize the agent
-        agent = DDQN(state_size, action_size, seed=0, DDQN=True)
+        agent = DDQN(state_size, action_size, seed=0, DDQN=True, prioritized=args.prioritized)
 
 # With 1000 max_t mathematically every slice should become malicious in every episode at some point
-        rewards, percent = run_ddqn(
-            agent,
-            n_episodes=args.num_episodes,
-            max_t=4,
-            eps_start=1.0,
-            eps_end=0.01,
-            eps_decay=0.99,
-            pth_file='checkpoint.pth',
-            malicious_chance=args.malicious_chance,
-            malicious_chance_increase=args.malicious_chance_increase
-        )
+        if args.num_actors > 0:
+            rewards, percent = run_parallel(
+                agent,
+                n_episodes=args.num_episodes,
+                max_t=4,
+                pth_file='checkpoint.pth',
+                malicious_chance=args.malicious_chance,
+                malicious_chance_increase=args.malicious_chance_increase,
+                num_actors=args.num_actors
+            )
+        else:
+            rewards, percent = run_ddqn(
+                agent,
+                n_episodes=args.num_episodes,
+                max_t=4,
+                eps_start=1.0,
+                eps_end=0.01,
+                eps_decay=0.99,
+                pth_file='checkpoint.pth',
+                malicious_chance=args.malicious_chance,
+                malicious_chance_increase=args.malicious_chance_increase,
+                env=env,
+                metrics=metrics,
+                checkpoint_file=checkpoint_file,
+                checkpoint_every=args.checkpoint_every,
+                save_buffer=args.save_buffer,
+                resume=args.resume
+            )
 
 # Print test results
         print("Tests correct: " + str(percent[0]))
         print("Tests incorrect: " + str(percent[1]))
 
         # Save rewards to CSV after training
-        rewards_df = pd.DataFrame(rewards, columns=["Reward"])
-        rewards_df.to_csv("reward_data/DDQN_episode_rewards.csv", index=False)
+        save_rewards(rewards, metrics, "reward_data/DDQN_episode_rewards.csv")
         print("Rewards saved to episode_rewards.csv")
 
     elif args.model_type == "Dueling":
+        from Dueling_DQN_agentemu import DQN_Dueling, run_dueling
 
 # Define the state size and action size for the agen10100,t
         state_size = 3
         action_size = 4  # Actions: Increase PRB, Decrease PRB, Secure Slice
 
 # Initialize the agent
-        agent = DQN_Dueling(state_size, action_size, seed=0, DDQN=True)
+        agent = DQN_Dueling(state_size, action_size, seed=0, DDQN=True, prioritized=args.prioritized)
 
 # With 1000 max_t mathematically every slice should become malicious in every episode at some point
-        rewards, percent = run_dueling(
-            agent,
-            n_episodes=args.num_episodes,
-            max_t=4,
-            eps_start=1.0,
-            eps_end=0.01,
-            eps_decay=0.99,
-            pth_file='checkpoint.pth',
-            malicious_chance=args.malicious_chance,
-            malicious_chance_increase=args.malicious_chance_increase
-        )
+        if args.num_actors > 0:
+            rewards, percent = run_parallel(
+                agent,
+                n_episodes=args.num_episodes,
+                max_t=4,
+                pth_file='checkpoint.pth',
+                malicious_chance=args.malicious_chance,
+                malicious_chance_increase=args.malicious_chance_increase,
+                num_actors=args.num_actors
+            )
+        else:
+            rewards, percent = run_dueling(
+                agent,
+                n_episodes=args.num_episodes,
+                max_t=4,
+                eps_start=1.0,
+                eps_end=0.01,
+                eps_decay=0.99,
+                pth_file='checkpoint.pth',
+                malicious_chance=args.malicious_chance,
+                malicious_chance_increase=args.malicious_chance_increase,
+                env=env,
+                metrics=metrics,
+                checkpoint_file=checkpoint_file,
+                checkpoint_every=args.checkpoint_every,
+                save_buffer=args.save_buffer,
+                resume=args.resume
+            )
 
 # Print test results
         print("Tests correct: " + str(percent[0]))
         print("Tests incorrect: " + str(percent[1]))
 
         # Save rewards to CSV after training
-        rewards_df = pd.DataFrame(rewards, columns=["Reward"])
-        rewards_df.to_csv("reward_data/Dueling_episode_rewards.csv", index=False)
+        save_rewards(rewards, metrics, "reward_data/Dueling_episode_rewards.csv")
         print("Rewards saved to episode_rewards.csv")
     return 0
 
-def get_action(agent, state):
-    with torch.no_grad():
-        action_values = agent(state)
-    return np.argmax(action_values.cpu().data.numpy())
-
-def run_inference_epoch(agent, num_episodes, malicious_chance):
-    action_prbs = [2897, 965, 91]  # eMBB, Medium, URLLC
-    global DL_BYTE_TO_PRB_RATES
-    DL_BYTE_TO_PRB_RATES = [6877, 6877, 6877]
-    is_mal = False
-    incorrect_actions = 0
-    for i in range(num_episodes):
-        if random.randint(0,int(malicious_chance)) == malicious_chance:
-            is_mal = True
-            DL_BYTE_TO_PRB_RATES[random.randint(0,2)] *= 10
-        state = [DL_BYTE_TO_PRB_RATES[0] * action_prbs[0],
-                DL_BYTE_TO_PRB_RATES[1] * action_prbs[1],
-                DL_BYTE_TO_PRB_RATES[2] * action_prbs[2]]
-        np_state = np.array(state, dtype=np.int64)
-        state = torch.from_numpy(np_state).float().unsqueeze(0).to(device)
-        selected_action = get_action(agent, state)
-        if selected_action >= 3 and not is_mal:
-            incorrect_actions += 1
-        elif selected_action < 3 and is_mal:
-            incorrect_actions += 1
-            is_mal = False
-    return 1 - (incorrect_actions / num_episodes)
-
-
-def inference(args):
-    state_size = 3
-    action_size = 4
-    if args.model_type == "DQN":
-
-        agent = DQN_QNetwork(state_size, action_size, seed=0)
-        state_dict = torch.load("pth/DQNcheckpoint.pth", map_location=device)
-        agent.load_state_dict(state_dict)
-        agent.eval()
-
-        print(run_inference_epoch(agent, args.num_episodes, args.malicious_chance))
-
-
-    if args.model_type == "DDQN":
-
-        agent = DDQN_QNetwork(state_size, action_size, seed=0)
-        state_dict = torch.load("pth/DDQNcheckpoint.pth", map_location=device)
-        agent.load_state_dict(state_dict)
-        agent.eval()
-
-        action_prbs = [2897, 965, 91]  # eMBB, Medium, URLLC
-        print(run_inference_epoch(agent, args.num_episodes, args.malicious_chance))
-
-    if args.model_type == "Dueling":
-
-        agent = Dueling_QNetwork(state_size, action_size, seed=0)
-        state_dict = torch.load("pth/Dueling_DQNcheckpoint.pth", map_location=device)
-        agent.load_state_dict(state_dict)
-        agent.eval()
-
-
-        action_prbs = [2897, 965, 91]  # eMBB, Medium, URLLC
-        print(run_inference_epoch(agent, args.num_episodes, args.malicious_chance))
-
-    return 0
-
 """
 def plot_cdf_from_state(state, model, num_bins=25):
     # Ensure the model is in evaluation mode and no gradients are calculated
@@ -240,74 +313,32 @@ def plot_cdf_from_state(state, model, num_bins=25):
     return cdf, bin_edges
 """
 
-def plot_cdf_from_state(model):
+def plot_cdf_from_state(model, num_epochs=10000):
     """
-    Compute and plot the CDF of Q-values for a given state and model using relfreq.
+    Compute and plot the CDF of the total DL bytes of the non-malicious slices
+    while the model allocates PRBs.
 
     Parameters:
         model (torch.nn.Module): The pretrained model (assumes it outputs Q-values).
+        num_epochs (int): The number of Monte Carlo epochs to simulate.
     """
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
     model.eval()
 
-# Constants
-    malicious_chance = 8
-    num_samples = 4
-    num_epochs = 10000
-    base_action_prbs = [2897, 965, 91]  # eMBB, Medium, URLLC
-    base_dl_rates = [6877, 6877, 6877]  # Base DL byte-to-PRB rates
-
-# To store total DL bytes
-    dl_byte_totals = defaultdict(int)
-
-# Simulate state data
-    for epoch in range(num_epochs):
-        dl_rates = base_dl_rates.copy()
-        is_mal = [False,False,False]
-        action_prbs = base_action_prbs.copy()
-        for _ in range(num_samples):
-            if random.randint(0, malicious_chance) == malicious_chance:
-                index = random.randint(0, 2)
-                dl_rates[index] *= 10
-                is_mal[index] = True
-            
-            # Compute state
-            state = [dl_rates[0] * action_prbs[0],
-                        dl_rates[1] * action_prbs[1],
-                        dl_rates[2] * action_prbs[2]]
-            
-            total_dl_bytes = 0
-            for i in range(3):
-                total_dl_bytes += state[i] if not is_mal[i] and state[i] < 1e8 else 0
-
-            if total_dl_bytes > 0:
-                dl_byte_totals[total_dl_bytes] += 1
-
-            # Create tensor for model input
-            np_state = np.array(state, dtype=np.float32)
-            state_tensor = torch.from_numpy(np_state).unsqueeze(0).to(device)
-
-            selected_action = get_action(model, state_tensor)
-            if selected_action < 3:
-                if action_prbs[selected_action] > 50:
-                    action_prbs[selected_action] += 15
-            else:
-                action_prbs[selected_action - 3] = 0
-
-
-# Extract values and frequencies
-    dl_byte_totals[0] = 10
-    total_dl_values = np.array(list(dl_byte_totals.keys()))
-    counts = np.array(list(dl_byte_totals.values()))
+# Simulate all epochs in lockstep and count the distinct total DL bytes
+    total_dl_values, counts = simulate_dl_byte_totals(
+        model, num_epochs=num_epochs, num_samples=4, malicious_chance=8)
+
+# Anchor the CDF at zero DL bytes
+    total_dl_values = np.concatenate(([0], total_dl_values))
+    counts = np.concatenate(([10], counts))
 
 # Compute frequencies and CDF
     frequencies = counts / counts.sum()
     cdf = np.cumsum(frequencies)
 
-# Sort for proper plotting
-    sorted_indices = np.argsort(total_dl_values)
-    total_dl_values = total_dl_values[sorted_indices]
-    #cdf = cdf[sorted_indices]
-
 # Plotting
     plt.figure(figsize=(10, 6))
     plt.plot(total_dl_values, cdf, label="CDF", color="blue", linewidth=2)
@@ -331,40 +362,8 @@ def plot_cdf_from_state(model):
     return cdf, total_dl_values
 
 def calc_cdf(args):
-    state_size = 3
-    action_size = 4
-    if args.model_type == "DQN":
-
-        agent = DQN_QNetwork(state_size, action_size, seed=0)
-        state_dict = torch.load("pth/DQNcheckpoint.pth", map_location=device)
-        agent.load_state_dict(state_dict)
-        agent.eval()
-
-        state = torch.rand(state_size) * 2 - 1
-        print(plot_cdf_from_state(agent))
-
-
-    if args.model_type == "DDQN":
-
-        agent = DDQN_QNetwork(state_size, action_size, seed=0)
-        state_dict = torch.load("pth/DDQNcheckpoint.pth", map_location=device)
-        agent.load_state_dict(state_dict)
-        agent.eval()
-
-        state = torch.rand(state_size) * 2 - 1
-        print(plot_cdf_from_state(agent))
-
-    if args.model_type == "Dueling":
-
-        agent = Dueling_QNetwork(state_size, action_size, seed=0)
-        state_dict = torch.load("pth/Dueling_DQNcheckpoint.pth", map_location=device)
-        agent.load_state_dict(state_dict)
-        agent.eval()
-
-
-        state = torch.rand(state_size) * 2 - 1
-        print(plot_cdf_from_state(agent))
-
+    agent = get_model(args.model_type, device, args.pth_file)
+    print(plot_cdf_from_state(agent, num_epochs=args.cdf_epochs))
     return 0
 
 
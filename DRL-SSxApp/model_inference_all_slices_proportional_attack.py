@@ -1,16 +1,12 @@
-from DQN_agentemu import DQN, DQN_QNetwork, run_dqn
-from DDQN_agentemu import DDQN, DDQN_QNetwork, run_ddqn
-from Dueling_DQN_agentemu import DQN_Dueling, Dueling_QNetwork, run_dueling
-from collections import defaultdict
 import argparse
 import sys
-import pandas as pd
 import torch
 import numpy as np
-from common import get_state
+# Inference only needs torch, NumPy and the networks. The training modules,
+# pandas and matplotlib are imported by the operations that use them.
+from model_registry import get_model
+from batch_inference import greedy_actions, score_attack_episodes, simulate_dl_byte_totals
 import random
-import matplotlib.pyplot as plt
-from scipy.stats import relfreq
 import os
 import time
 
@@ -33,6 +29,11 @@ def parse():
         type=str,
         default="DQN",
         help="Type of model to use. Options: DQN, DDQN, Dueling")
+    parser.add_argument(
+        "--pth_file",
+        type=str,
+        default=None,
+        help="Checkpoint to load instead of the model type's default in pth/")
     parser.add_argument(
         "--num_episodes",
         type=int,
@@ -47,11 +48,21 @@ def parse():
                     type=float,
                     default=0,
                     help="The rate of increase of the malicious chance (malicious_chance+=malicious_chance_increase)")
+    parser.add_argument("--batched",
+                    action="store_true",
+                    help="Generate all inference states up front and score them in large batches")
+    parser.add_argument("--cdf_epochs",
+                    type=int,
+                    default=10000,
+                    help="The number of Monte Carlo epochs simulated by the cdf operation")
     return parser.parse_args()
 
 
 def train(args):
+    import pandas as pd
+
     if args.model_type == "DQN":
+        from DQN_agentemu import DQN, run_dqn
         state_size = 3
         action_size = 4  # Actions: Increase PRB, Decrease PRB, Secure Slice
 
@@ -81,6 +92,7 @@ def train(args):
         rewards_df.to_csv("reward_data/DQN_episode_rewards.csv", index=False)
         print("Rewards saved to episode_rewards.csv")
     elif args.model_type == "DDQN":
+        from DDQN_agentemu import DDQN, run_ddqn
 # Define the state size and action size for the agen10100,t
         state_size = 3
         action_size = 4  # Actions: Increase PRB, Decrease PRB, Secure Slice
@@ -111,6 +123,7 @@ def train(args):
         print("Rewards saved to episode_rewards.csv")
 
     elif args.model_type == "Dueling":
+        from Dueling_DQN_agentemu import DQN_Dueling, run_dueling
 
 # Define the state size and action size for the agen10100,t
         state_size = 3
@@ -148,7 +161,9 @@ def get_action(agent, state):
     return np.argmax(action_values.cpu().data.numpy())
 
 
-def run_inference_epoch(agent, num_episodes, malicious_chance):
+def run_inference_epoch(agent, num_episodes, malicious_chance, batched=False):
+    if batched:
+        return run_inference_epoch_batched(agent, num_episodes, malicious_chance)
     action_prbs = [2897, 965, 91]  # eMBB, Medium, URLLC
     base_dl_rates = [6877, 6877, 6877]
     incorrect_actions = 0
@@ -170,11 +185,19 @@ def run_inference_epoch(agent, num_episodes, malicious_chance):
 
     malicious_episodes = random.sample(range(num_episodes), num_malicious_episodes)
 
+    # Slice attacked in each episode (-1 if none), so the loop below does an
+    # O(1) lookup instead of scanning malicious_episodes every episode.
+    # Malicious episodes take their slice from the end of malicious_slice_idx
+    # in episode order.
+    episode_slice = [-1] * num_episodes
+    for episode, slice_idx in zip(sorted(malicious_episodes), reversed(malicious_slice_idx)):
+        episode_slice[episode] = slice_idx
+
     for episode in range(num_episodes):
         DL_BYTE_TO_PRB_RATES = base_dl_rates.copy()  # Resetting the rates for each episode
         is_mal = [False, False, False]  # Maliciousness for each of the 3 slices
-        if episode in malicious_episodes:
-            slice_idx = malicious_slice_idx.pop()
+        slice_idx = episode_slice[episode]
+        if slice_idx >= 0:
             DL_BYTE_TO_PRB_RATES[slice_idx] *= 10
             is_mal[slice_idx] = True
         state = [
@@ -214,43 +237,53 @@ def run_inference_epoch(agent, num_episodes, malicious_chance):
     return accuracy, avg_throughput, avg_slice_throughput
 
 
+def run_inference_epoch_batched(agent, num_episodes, malicious_chance, seed=None):
+    """
+    Vectorized run_inference_epoch. Episodes are independent, so every state is
+    generated up front as one (num_episodes, 3) matrix, scored with batched
+    forward passes and evaluated with vectorized comparisons.
+    """
+    rng = np.random.default_rng(seed)
+    action_prbs = np.array([2897, 965, 91], dtype=np.int64)  # eMBB, Medium, URLLC
+    base_dl_rates = np.array([6877, 6877, 6877], dtype=np.int64)
+
+    num_malicious_episodes = int(num_episodes * (malicious_chance / 100))
+
+    # what each slice will get, plus the extra leftover
+    mal_per_slice = num_malicious_episodes // 3
+    extra_mal = num_malicious_episodes % 3
+    malicious_slice_idx = np.concatenate((
+        np.repeat(np.arange(3), mal_per_slice),
+        rng.choice(3, size=extra_mal, replace=False)))
+    rng.shuffle(malicious_slice_idx)
+
+    malicious_episodes = rng.choice(num_episodes, size=num_malicious_episodes, replace=False)
+
+    is_mal = np.zeros((num_episodes, 3), dtype=bool)
+    is_mal[malicious_episodes, malicious_slice_idx] = True
+    states = np.where(is_mal, 10, 1) * base_dl_rates * action_prbs
+
+    selected_actions = greedy_actions(agent, states)
+    accuracy, avg_throughput, avg_slice_throughput, _ = score_attack_episodes(
+        states, is_mal, selected_actions)
+    return accuracy, avg_throughput, avg_slice_throughput
+
+
 
 
 
 
 def inference(args):
-    state_size = 3
-    action_size = 4
+    import pandas as pd
+
+    # Load the checkpoint once and reuse it for every malicious chance
+    agent = get_model(args.model_type, device, args.pth_file)
 
     results = []
 
     for malicious_chance in range(0, 101, 10):
-        if args.model_type == "DQN":
-            agent = DQN_QNetwork(state_size, action_size, seed=0)
-            state_dict = torch.load("pth/DQNcheckpoint.pth", map_location=device)
-            agent.load_state_dict(state_dict)
-            agent.eval()
-            
-            accuracy, avg_throughput = run_inference_epoch(agent, args.num_episodes, malicious_chance)
-            results.append(["DQN", malicious_chance, args.num_episodes, avg_throughput, accuracy])
-
-        elif args.model_type == "DDQN":
-            agent = DDQN_QNetwork(state_size, action_size, seed=0)
-            state_dict = torch.load("pth/DDQNcheckpoint.pth", map_location=device)
-            agent.load_state_dict(state_dict)
-            agent.eval()
-            
-            accuracy, avg_throughput = run_inference_epoch(agent, args.num_episodes, malicious_chance)
-            results.append(["DDQN", malicious_chance, args.num_episodes, avg_throughput, accuracy])
-
-        elif args.model_type == "Dueling":
-            agent = Dueling_QNetwork(state_size, action_size, seed=0)
-            state_dict = torch.load("pth/Dueling_DQNcheckpoint.pth", map_location=device)
-            agent.load_state_dict(state_dict)
-            agent.eval()
-            
-            accuracy, avg_throughput= run_inference_epoch(agent, args.num_episodes, malicious_chance)
-            results.append(["Dueling", malicious_chance, args.num_episodes, avg_throughput, accuracy])
+        accuracy, avg_throughput, _ = run_inference_epoch(agent, args.num_episodes, malicious_chance, batched=args.batched)
+        results.append([args.model_type, malicious_chance, args.num_episodes, avg_throughput, accuracy])
 
 
     csv_filename = f"{args.model_type}_results.csv"  # Unique filename for each model type
@@ -296,74 +329,32 @@ def plot_cdf_from_state(state, model, num_bins=25):
     return cdf, bin_edges
 """
 
-def plot_cdf_from_state(model):
+def plot_cdf_from_state(model, num_epochs=10000):
     """
-    Compute and plot the CDF of Q-values for a given state and model using relfreq.
+    Compute and plot the CDF of the total DL bytes of the non-malicious slices
+    while the model allocates PRBs.
 
     Parameters:
         model (torch.nn.Module): The pretrained model (assumes it outputs Q-values).
+        num_epochs (int): The number of Monte Carlo epochs to simulate.
     """
-    model.eval()
+    import matplotlib.pyplot as plt
+    import pandas as pd
 
-# Constants
-    malicious_chance = 8
-    num_samples = 4
-    num_epochs = 10000
-    base_action_prbs = [2897, 965, 91]  # eMBB, Medium, URLLC
-    base_dl_rates = [6877, 6877, 6877]  # Base DL byte-to-PRB rates
-
-# To store total DL bytes
-    dl_byte_totals = defaultdict(int)
-
-# Simulate state data
-    for epoch in range(num_epochs):
-        dl_rates = base_dl_rates.copy()
-        is_mal = [False,False,False]
-        action_prbs = base_action_prbs.copy()
-        for _ in range(num_samples):
-            if random.randint(0, malicious_chance) == malicious_chance:
-                index = random.randint(0, 2)
-                dl_rates[index] *= 10
-                is_mal[index] = True
-            
-            # Compute state
-            state = [dl_rates[0] * action_prbs[0],
-                        dl_rates[1] * action_prbs[1],
-                        dl_rates[2] * action_prbs[2]]
-            
-            total_dl_bytes = 0
-            for i in range(3):
-                total_dl_bytes += state[i] if not is_mal[i] and state[i] < 1e8 else 0
-
-            if total_dl_bytes > 0:
-                dl_byte_totals[total_dl_bytes] += 1
-
-            # Create tensor for model input
-            np_state = np.array(state, dtype=np.float32)
-            state_tensor = torch.from_numpy(np_state).unsqueeze(0).to(device)
-
-            selected_action = get_action(model, state_tensor)
-            if selected_action < 3:
-                if action_prbs[selected_action] > 50:
-                    action_prbs[selected_action] += 15
-            else:
-                action_prbs[selected_action - 3] = 0
+    model.eval()
 
+# Simulate all epochs in lockstep and count the distinct total DL bytes
+    total_dl_values, counts = simulate_dl_byte_totals(
+        model, num_epochs=num_epochs, num_samples=4, malicious_chance=8)
 
-# Extract values and frequencies
-    dl_byte_totals[0] = 10
-    total_dl_values = np.array(list(dl_byte_totals.keys()))
-    counts = np.array(list(dl_byte_totals.values()))
+# Anchor the CDF at zero DL bytes
+    total_dl_values = np.concatenate(([0], total_dl_values))
+    counts = np.concatenate(([10], counts))
 
 # Compute frequencies and CDF
     frequencies = counts / counts.sum()
     cdf = np.cumsum(frequencies)
 
-# Sort for proper plotting
-    sorted_indices = np.argsort(total_dl_values)
-    total_dl_values = total_dl_values[sorted_indices]
-    #cdf = cdf[sorted_indices]
-
 # Plotting
     plt.figure(figsize=(10, 6))
     plt.plot(total_dl_values, cdf, label="CDF", color="blue", linewidth=2)
@@ -387,40 +378,8 @@ def plot_cdf_from_state(model):
     return cdf, total_dl_values
 
 def calc_cdf(args):
-    state_size = 3
-    action_size = 4
-    if args.model_type == "DQN":
-
-        agent = DQN_QNetwork(state_size, action_size, seed=0)
-        state_dict = torch.load("pth/DQNcheckpoint.pth", map_location=device)
-        agent.load_state_dict(state_dict)
-        agent.eval()
-
-        state = torch.rand(state_size) * 2 - 1
-        print(plot_cdf_from_state(agent))
-
-
-    if args.model_type == "DDQN":
-
-        agent = DDQN_QNetwork(state_size, action_size, seed=0)
-        state_dict = torch.load("pth/DDQNcheckpoint.pth", map_location=device)
-        agent.load_state_dict(state_dict)
-        agent.eval()
-
-        state = torch.rand(state_size) * 2 - 1
-        print(plot_cdf_from_state(agent))
-
-    if args.model_type == "Dueling":
-
-        agent = Dueling_QNetwork(state_size, action_size, seed=0)
-        state_dict = torch.load("pth/Dueling_DQNcheckpoint.pth", map_location=device)
-        agent.load_state_dict(state_dict)
-        agent.eval()
-
-
-        state = torch.rand(state_size) * 2 - 1
-        print(plot_cdf_from_state(agent))
-
+    agent = get_model(args.model_type, device, args.pth_file)
+    print(plot_cdf_from_state(agent, num_epochs=args.cdf_epochs))
     return 0
 
 
@@ -0,0 +1,97 @@
+# # `model_registry.py` -- In-process cache of the loaded Q-networks
+#
+# Every entry point used to build its network and `torch.load` the checkpoint
+# on each call, and a long-running process (a sweep, the policy server) would
+# keep doing so. The registry loads each checkpoint once and hands out the
+# same eval-mode module to every caller that asks for it.
+#
+# Entries are keyed by (model type, checkpoint path, device). Each entry
+# remembers the modification time of the file it was loaded from, and `get`
+# compares it with the file on disk, at most once every `check_interval`
+# seconds. When a new checkpoint has landed the module is loaded again and
+# replaces the cached one; callers holding the old module keep a working
+# model. A checkpoint that cannot be read yet, e.g. because it is still being
+# written or is briefly missing while it is replaced, is retried on the next
+# check while the old module stays in use.
+#
+# The modules are shared, so callers must not train or modify them in place.
+
+import os
+import pickle
+import threading
+import time
+
+import torch
+
+from networks import CHECKPOINTS, load_network
+
+
+class RegistryEntry:
+
+    def __init__(self, model, mtime, version, checked):
+        self.model = model
+        self.mtime = mtime
+        self.version = version
+        self.checked = checked
+
+
+class ModelRegistry:
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self.entries = dict()
+        self.lock = threading.Lock()
+        self.loads = 0
+
+    def key(self, model_type, pth_file, device):
+        if pth_file is None:
+            pth_file = CHECKPOINTS[model_type]
+        return model_type, os.path.abspath(pth_file), str(torch.device(device))
+
+    def get(self, model_type, pth_file=None, device="cpu"):
+        # Shared eval-mode module of `model_type`, reloaded if its checkpoint
+        # has changed on disk
+        key = self.key(model_type, pth_file, device)
+        entry = self.entries.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked < self.check_interval:
+            return entry.model
+
+        with self.lock:
+            entry = self.entries.get(key)
+            try:
+                mtime = os.stat(key[1]).st_mtime_ns
+                if entry is not None and entry.mtime == mtime:
+                    entry.checked = now
+                    return entry.model
+                model = load_network(model_type, device, key[1])
+            except (OSError, RuntimeError, EOFError, pickle.UnpicklingError):
+                if entry is None:
+                    raise
+                print(f"Could not reload {key[1]}, keeping version {entry.version}")
+                entry.checked = now
+                return entry.model
+            version = 1 if entry is None else entry.version + 1
+            self.entries[key] = RegistryEntry(model, mtime, version, now)
+            self.loads += 1
+            return model
+
+    def version(self, model_type, pth_file=None, device="cpu"):
+        # How often the checkpoint has been loaded, 0 if it never was
+        entry = self.entries.get(self.key(model_type, pth_file, device))
+        return 0 if entry is None else entry.version
+
+    def evict(self, model_type=None):
+        # Drop the cached modules of `model_type`, or of every model
+        with self.lock:
+            for key in list(self.entries):
+                if model_type is None or key[0] == model_type:
+                    del self.entries[key]
+
+
+# Registry shared by everything in the process
+REGISTRY = ModelRegistry()
+
+
+def get_model(model_type, device="cpu", pth_file=None):
+    return REGISTRY.get(model_type, pth_file, device)
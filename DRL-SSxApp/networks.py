@@ -0,0 +1,184 @@
+# # `networks.py` -- Q-network definitions for the DQN, DDQN and Dueling DQN models
+#
+# The networks only depend on torch, so the inference entry points can build
+# and load a model without importing the training code (replay buffers,
+# training loops, plotting) of the `*_agentemu.py` modules.
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# ### **DQN Q-Network**
+#
+# This class definition implements a Q-Network using PyTorch, which is a type of
+# neural network used in reinforcement learning to approximate the Q-value
+# function.
+#
+# Args:
+#     state_len (int): Length of the input state vector.
+#     action_len (int): Number of possible actions (output size).
+#     seed (int): Seed for reproducibility of results.
+#     layer1_size (int, optional): Number of neurons in the first hidden layer. Default is 128.
+#     layer2_size (int, optional): Number of neurons in the second hidden layer. Default is 128.
+#     layer3_size (int, optional): Number of neurons in the third hidden layer. Default is 128.
+#     layer4_size (int, optional): Number of neurons in the fourth hidden layer. Default is 128.
+
+
+class DQN_QNetwork(nn.Module):
+
+    # Q-Network for approximating the Q-value function.
+    # The Q-network predicts Q-values for each action given a state.
+
+    def __init__(
+        self,
+        state_len,
+        action_len,
+        seed,
+        layer1_size=128,
+        layer2_size=128,
+        layer3_size=128,
+        layer4_size=128,
+    ):
+        super(DQN_QNetwork, self).__init__()
+        self.seed = torch.manual_seed(seed)
+
+        # Define the layers of the Q-network with ReLU activations
+        self.l1 = nn.Linear(state_len, layer1_size)
+        self.l2 = nn.Linear(layer1_size, layer2_size)
+        self.l3 = nn.Linear(layer2_size, layer3_size)
+        self.l4 = nn.Linear(layer3_size, layer4_size)
+        self.l5 = nn.Linear(layer4_size, action_len)
+
+    # Define the layers of the Q-network with ReLU activations
+    #
+    # ReLU (Rectified Linear Unit) is applied to the output of each layer in
+    # the neural network. Its mathematical form is:
+    #
+    #  \\\[ f(x) = \\max(0, x)\\\]
+    #
+    # where:
+    #
+    # - \\( x \\) is the input to the activation function.
+    # - The output is \\( x \\) if \\( x > 0 \\), otherwise, it is \\( 0
+    #   \\).
+
+    def forward(self, input_state):
+        # Forward pass through the network
+        x = F.relu(self.l1(input_state))
+        x = F.relu(self.l2(x))
+        x = F.relu(self.l3(x))
+        x = F.relu(self.l4(x))
+        return self.l5(x)
+
+
+# ### **DDQN Q-Network**
+#
+# __init__: Initializes the Q-Network with the given parameters and defines the layers of the network with ReLU activations.
+# forward: Performs a forward pass through the network, taking an input state and returning the predicted Q-values for each action.
+class DDQN_QNetwork(nn.Module):
+    """
+    Q-Network for approximating the Q-value function.
+    The Q-network predicts Q-values for each action given a state.
+    """
+
+    def __init__(
+        self,
+        state_len,
+        action_len,
+        seed,
+        layer1_size=128,
+        layer2_size=128,
+        layer3_size=128,
+        layer4_size=128,
+    ):
+        super(DDQN_QNetwork, self).__init__()
+        self.seed = torch.manual_seed(seed)
+
+        # Define the layers of the Q-network with ReLU activations
+        self.l1 = nn.Linear(state_len, layer1_size)
+        self.l2 = nn.Linear(layer1_size, layer2_size)
+        self.l3 = nn.Linear(layer2_size, layer3_size)
+        self.l4 = nn.Linear(layer3_size, layer4_size)
+        self.l5 = nn.Linear(layer4_size, action_len)
+
+    def forward(self, input_state):
+        # Forward pass through the network
+        x = F.relu(self.l1(input_state))
+        x = F.relu(self.l2(x))
+        x = F.relu(self.l3(x))
+        x = F.relu(self.l4(x))
+        return self.l5(x)
+
+
+# ### **Dueling Q-Network**
+#
+# __init__: Initializes the Q-Network with the given parameters and defines the layers of the network with ReLU activations.
+# forward: Performs a forward pass through the network, taking an input state and returning the predicted Q-values for each action.
+# Updated Q-Network for Dueling DQN
+class Dueling_QNetwork(nn.Module):
+    """
+    Dueling Q-Network for approximating the Q-value function.
+    This network has separate streams for state-value and advantage functions.
+    """
+
+    def __init__(self, state_len, action_len, seed, layer1_size=128, layer2_size=128):
+        super(Dueling_QNetwork, self).__init__()
+        self.seed = torch.manual_seed(seed)
+
+        # Common feature extraction layers
+        self.l1 = nn.Linear(state_len, layer1_size)
+        self.l2 = nn.Linear(layer1_size, layer2_size)
+
+        # Separate streams for value and advantage
+        self.value_stream = nn.Sequential(
+            nn.Linear(layer2_size, 128),
+            nn.ReLU(),
+            nn.Linear(128, 1),  # Outputs a single value
+        )
+        self.advantage_stream = nn.Sequential(
+            nn.Linear(layer2_size, 128),
+            nn.ReLU(),
+            nn.Linear(128, action_len),  # Outputs advantages for each action
+        )
+
+    def forward(self, input_state):
+        # Forward pass through the common layers
+        x = F.relu(self.l1(input_state))
+        x = F.relu(self.l2(x))
+
+        # Forward pass through the value and advantage streams
+        value = self.value_stream(x)
+        advantage = self.advantage_stream(x)
+
+        # Combine value and advantage to get Q-values
+        q_values = value + (advantage - advantage.mean())
+        return q_values
+
+
+# ### **Checkpoints**
+#
+# The network class and trained checkpoint of every model type.
+NETWORKS = {
+    "DQN": DQN_QNetwork,
+    "DDQN": DDQN_QNetwork,
+    "Dueling": Dueling_QNetwork,
+}
+
+CHECKPOINTS = {
+    "DQN": "pth/DQNcheckpoint.pth",
+    "DDQN": "pth/DDQNcheckpoint.pth",
+    "Dueling": "pth/Dueling_DQNcheckpoint.pth",
+}
+
+
+def load_network(model_type, device="cpu", pth_file=None, state_size=3, action_size=4):
+    # Build a `model_type` network, load its checkpoint and put it in eval mode
+    if model_type not in NETWORKS:
+        raise ValueError(f"Unknown model type: {model_type}")
+    if pth_file is None:
+        pth_file = CHECKPOINTS[model_type]
+    network = NETWORKS[model_type](state_size, action_size, seed=0)
+    network.load_state_dict(torch.load(pth_file, map_location=device))
+    network.to(device)
+    network.eval()
+    return network
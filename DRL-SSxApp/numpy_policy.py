@@ -0,0 +1,138 @@
+# # `numpy_policy.py` -- Torch-free NumPy forward pass of the trained Q-networks
+#
+# The deployed networks are tiny, 3 inputs through a few 128-wide layers to 4
+# actions, but importing torch alone takes seconds and hundreds of MB per
+# process. `export_models.py` dumps every checkpoint's weights to a flat
+# `export/<model>.npz`, and this module serves them with nothing but NumPy,
+# so a serving process starts in milliseconds.
+#
+# Both architectures of `networks.py` are implemented exactly:
+#
+# - `mlp` (DQN_QNetwork, DDQN_QNetwork): l1..l4 with ReLU, then l5.
+# - `dueling` (Dueling_QNetwork): l1, l2 with ReLU, then a value and an
+#   advantage stream. The first layers of both streams read the same input,
+#   so they are fused into one 128 -> 256 matmul. As in the torch module the
+#   advantage mean is taken over the whole batch, unless `row_mean` is set;
+#   then it is taken per state, so every state's Q-values are the ones it
+#   would get if it was scored alone.
+#
+# Weights are stored transposed and contiguous, and every layer writes into an
+# activation buffer that is allocated once for `max_batch` rows (and grown if
+# a larger batch comes in), so a forward pass does not allocate beyond its
+# result.
+
+import numpy as np
+
+MLP_LAYERS = ("l1", "l2", "l3", "l4", "l5")
+DUELING_LAYERS = (
+    "l1",
+    "l2",
+    "value_stream.0",
+    "value_stream.2",
+    "advantage_stream.0",
+    "advantage_stream.2",
+)
+
+
+def architecture_of(weights):
+    # "dueling" or "mlp", from the parameter names of a state_dict or .npz
+    return "dueling" if "value_stream.0.weight" in weights else "mlp"
+
+
+def save_npz(state_dict, npz_file):
+    # Flat float32 copy of a Q-network state_dict (tensors or arrays)
+    arrays = {
+        name: np.asarray(
+            value.detach().cpu().numpy() if hasattr(value, "detach") else value,
+            dtype=np.float32,
+        )
+        for name, value in state_dict.items()
+    }
+    np.savez(npz_file, architecture=np.array(architecture_of(arrays)), **arrays)
+
+
+class NumpyPolicy:
+
+    backend = "numpy"
+
+    def __init__(self, model_type, npz_file, max_batch=1, row_mean=False):
+        self.model_type = model_type
+        self.row_mean = row_mean
+        with np.load(npz_file) as weights:
+            self.architecture = str(weights["architecture"])
+            layers = MLP_LAYERS if self.architecture == "mlp" else DUELING_LAYERS
+            params = {
+                name: (
+                    np.ascontiguousarray(weights[f"{name}.weight"].T),
+                    weights[f"{name}.bias"].copy(),
+                )
+                for name in layers
+            }
+
+        if self.architecture == "mlp":
+            self.layers = [params[name] for name in MLP_LAYERS]
+        else:
+            # Fuse the first layers of the value and advantage streams
+            value, advantage = params["value_stream.0"], params["advantage_stream.0"]
+            self.layers = [
+                params["l1"],
+                params["l2"],
+                (
+                    np.ascontiguousarray(np.concatenate([value[0], advantage[0]], 1)),
+                    np.concatenate([value[1], advantage[1]]),
+                ),
+            ]
+            self.value_width = value[1].size
+            self.value_head = params["value_stream.2"]
+            self.advantage_head = params["advantage_stream.2"]
+        self.state_len = self.layers[0][0].shape[0]
+        self.allocate(max_batch)
+
+    def allocate(self, max_batch):
+        self.max_batch = max_batch
+        self.inputs = np.empty((max_batch, self.state_len), dtype=np.float32)
+        self.buffers = [
+            np.empty((max_batch, bias.size), dtype=np.float32)
+            for _, bias in self.layers
+        ]
+        if self.architecture == "dueling":
+            self.value = np.empty((max_batch, 1), dtype=np.float32)
+            self.advantage = np.empty(
+                (max_batch, self.advantage_head[1].size), dtype=np.float32
+            )
+
+    def forward(self, n):
+        # Q-values of the first `n` rows of `self.inputs`, in a new array
+        x = self.inputs[:n]
+        last = len(self.layers) - 1
+        for i, (weight, bias) in enumerate(self.layers):
+            out = self.buffers[i][:n]
+            np.matmul(x, weight, out=out)
+            out += bias
+            if i < last or self.architecture == "dueling":
+                np.maximum(out, 0, out=out)
+            x = out
+        if self.architecture == "mlp":
+            return x.copy()
+
+        value = self.value[:n]
+        advantage = self.advantage[:n]
+        np.matmul(x[:, : self.value_width], self.value_head[0], out=value)
+        value += self.value_head[1]
+        np.matmul(x[:, self.value_width :], self.advantage_head[0], out=advantage)
+        advantage += self.advantage_head[1]
+        if self.row_mean:
+            return value + (advantage - advantage.mean(1, keepdims=True))
+        return value + (advantage - advantage.mean())
+
+    def q_values(self, states):
+        states = np.asarray(states, dtype=np.float32)
+        n = len(states)
+        if n > self.max_batch:
+            self.allocate(n)
+        self.inputs[:n] = states
+        return self.forward(n)
+
+    def __call__(self, state):
+        self.inputs[0] = state
+        return int(self.forward(1)[0].argmax())
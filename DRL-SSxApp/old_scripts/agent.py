@@ -101,28 +101,28 @@ class KpiEvm:
         setup_env(self.iperf_i)
 
         self.slice = "fast"
+        slice_info = self.conf_i.get_slice(self.slice)
         self.ues = list()
-        self.ues += [ue for ue in self.conf_i.get_slice(self.slice)["ues"]]
+        self.ues += [ue for ue in slice_info["ues"]]
         print("Ues Detected: ", self.ues)
         self.sla = 10.00
         print("SLA: ", self.sla)
-        self.prbs = self.conf_i.get_slice(self.slice)["allocation_policy"]["share"]
+        self.prbs = slice_info["allocation_policy"]["share"]
         self.previous_tp = [0 for _ in range(len(self.namespaces))]
         self.reset()
 
     def get_current_reward(self):
         print("Reward: ", end="")
         reward = 0
-        current_tp = list()
+        current_tp = self.iperf_i.get_readings()
         for i in range(len(self.namespaces)):
-            current_tp.append(self.iperf_i.get_reading(self.namespaces[i]))
             if self.previous_tp[i] > current_tp[i]:
                 reward -= 10
             elif self.previous_tp[i] <= current_tp[i]:
                 reward += 10
 
-        for namespace in self.namespaces:
-            if self.iperf_i.get_reading(namespace) > self.sla:
+        for tp in current_tp:
+            if tp > self.sla:
                 reward -= 100
 
         self.previous_tp = current_tp
@@ -147,7 +147,7 @@ class KpiEvm:
                 ue_ids.append(ue_name)
                 state += [np.int64(int(value)) for value in kpm.values()]
         state.append(self.prbs)
-        state += [self.iperf_i.get_reading(namespace) for namespace in self.namespaces]
+        state += self.iperf_i.get_readings()
         print(GREEN + str(state) + ENDC)
         return state
 
@@ -157,7 +157,8 @@ class KpiEvm:
     def restart(self):
         # This function should be run to reset the interfaces after the env is restarted
         print(RED + "Restarting KpiEvm" + ENDC)
-        self.prbs = self.conf_i.get_slice(self.slice)["allocation_policy"]["share"]
+        slice_info = self.conf_i.get_slice(self.slice, cached=False)
+        self.prbs = slice_info["allocation_policy"]["share"]
         self.previous_tp = [0 for _ in range(len(self.namespaces))]
 
     def step(self, act):
@@ -178,11 +179,10 @@ class KpiEvm:
             self.conf_i.reallocate_prbs(self.prbs, self.slice)
 
         elif act == 3:
+            current_tp = self.iperf_i.get_readings()
             largest = 0
             for i in range(len(self.namespaces)):
-                if self.iperf_i.get_reading(
-                    self.namespaces[i]
-                ) > self.iperf_i.get_reading(self.namespaces[largest]):
+                if current_tp[i] > current_tp[largest]:
                     largest = i
             # XXX: a temporary workaround
             namespace_to_imsi = {
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import random
+import re
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from kpm_stream import SERVER_HOST, SERVER_PORT, KpmStreamClient
+from xapp_interface import ConfInterface, IperfInterface
+
+NAMESPACE_TO_IMSI = {
+    "ue1": "001010123456789",
+    "ue2": "001010123456780",
+    "ue3": "001010123456781",
+}
+STAGES = ("state", "inference", "actuation", "tick")
+# Valid range of a slice's proportional share (src/restserver.cc)
+MIN_SHARE = 0
+MAX_SHARE = 1024
+PRB_STEP = 10
+
+
+# Real-time control loop for the live agent.
+#
+# KpiEvm.step runs action, REST call, KPM read, iperf read and reward one
+# after the other, so one slow component stalls the loop and its cadence
+# drifts away from the E2 KPM reporting interval. ControlLoop instead makes a
+# decision on a fixed period, normally the KPM interval, on an asyncio event
+# loop:
+#
+# - KPM reports and iperf readings are collected in the background
+#   (KpmStreamClient, IperfCollector), so reading the state is a snapshot of
+#   the latest values; reports that arrived since the last tick are
+#   coalesced into the newest one per UE.
+# - A tick without a KPM report newer than the previous decision is skipped,
+#   as is a tick whose snapshot is older than `max_age`.
+# - The REST call of an action runs as a task while the loop waits for the
+#   next tick, so actuation overlaps with collecting the next state. If it is
+#   still running at the next tick, that tick is skipped rather than queueing
+#   a second action.
+# - Ticks that are missed because the loop fell behind are dropped instead of
+#   run back to back, so decisions stay aligned to the period.
+#
+# Actions 1 and 2 move the slice's share by PRB_STEP within the valid share
+# range. Action 3, moving the UE with the largest throughput to the secure
+# slice, is commented out in KpiEvm.step and is likewise a no-op here unless
+# `move_ues` is set; every UE is moved at most once.
+#
+# The latency of every stage (state, inference, actuation) and of the whole
+# tick, and how late each tick started, are kept for the last `history`
+# ticks; `stats` summarizes them.
+class ControlLoop:
+
+    def __init__(
+        self,
+        policy,
+        kpm,
+        conf,
+        iperf=None,
+        period=1.024,
+        slice_name="fast",
+        secure_slice="secure_slice",
+        namespaces=("ue1", "ue2", "ue3"),
+        max_age=None,
+        history=10000,
+        move_ues=False,
+    ):
+        self.policy = policy
+        self.kpm = kpm
+        self.conf = conf
+        self.iperf = iperf
+        self.period = period
+        self.slice_name = slice_name
+        self.secure_slice = secure_slice
+        self.namespaces = list(namespaces)
+        self.max_age = 2 * period if max_age is None else max_age
+        self.move_ues = move_ues
+        self.moved = set()
+        self.prbs = None
+
+        self.latency = {stage: deque(maxlen=history) for stage in STAGES}
+        self.lateness = deque(maxlen=history)
+        self.counts = {
+            "ticks": 0,
+            "decisions": 0,
+            "stale": 0,
+            "busy": 0,
+            "missed": 0,
+            "failed": 0,
+        }
+        self.last_report = 0.0
+        self.actuation = None
+
+    def throughputs(self):
+        # Without an iperf collector the state's iperf part is 0, as if no UE
+        # had traffic; the KPMs and PRB share are still live
+        if self.iperf is None:
+            return [0.0] * len(self.namespaces)
+        return [self.iperf.reading(namespace) for namespace in self.namespaces]
+
+    def build_state(self, kpms):
+        # Same layout as KpiEvm.get_current_state: the KPMs of every UE in
+        # UE order, the slice's PRB share and the iperf readings
+        state = list()
+        for ue_name in sorted(kpms):
+            state += [int(value) for value in kpms[ue_name].values()]
+        state.append(self.prbs)
+        state += self.throughputs()
+        return np.asarray(state, dtype=np.float32)
+
+    async def actuate(self, action, throughputs):
+        # Apply an action as in KpiEvm.step
+        start = time.perf_counter()
+        ok = True
+        if action in (1, 2):
+            step = PRB_STEP if action == 1 else -PRB_STEP
+            prbs = min(MAX_SHARE, max(MIN_SHARE, self.prbs + step))
+            if prbs != self.prbs:
+                ok = await self.conf.reallocate_prbs_async(prbs, self.slice_name)
+                if ok:
+                    self.prbs = prbs
+        elif action == 3 and self.move_ues:
+            ok = await self.move_largest(throughputs)
+        if not ok:
+            self.counts["failed"] += 1
+        self.latency["actuation"].append(time.perf_counter() - start)
+
+    async def move_largest(self, throughputs):
+        # Move the not yet moved UE with the largest throughput
+        candidates = [
+            i
+            for i, namespace in enumerate(self.namespaces)
+            if NAMESPACE_TO_IMSI.get(namespace) not in self.moved | {None}
+        ]
+        if not candidates:
+            return True
+        largest = max(candidates, key=lambda i: throughputs[i])
+        imsi = NAMESPACE_TO_IMSI[self.namespaces[largest]]
+        ok = await self.conf.move_ue(imsi, self.slice_name, self.secure_slice)
+        if ok:
+            self.moved.add(imsi)
+        return ok
+
+    async def tick(self):
+        tick_start = time.perf_counter()
+        self.counts["ticks"] += 1
+        if self.actuation is not None and not self.actuation.done():
+            self.counts["busy"] += 1
+            return
+
+        # State: the latest report of every UE, if any of them is new
+        received = self.kpm.received
+        newest = max(received.values(), default=0.0)
+        if newest <= self.last_report or time.time() - newest > self.max_age:
+            self.counts["stale"] += 1
+            return
+        self.last_report = newest
+        throughputs = self.throughputs()
+        state = self.build_state(self.kpm.snapshot())
+        self.latency["state"].append(time.perf_counter() - tick_start)
+
+        start = time.perf_counter()
+        action = int(self.policy(state))
+        self.latency["inference"].append(time.perf_counter() - start)
+
+        self.actuation = asyncio.ensure_future(self.actuate(action, throughputs))
+        self.counts["decisions"] += 1
+        self.latency["tick"].append(time.perf_counter() - tick_start)
+
+    async def run(self, num_ticks=None):
+        if self.prbs is None:
+            slice_info = await self.conf.get_slice_async(self.slice_name, False)
+            if slice_info is None:
+                raise RuntimeError(f"Could not read slice {self.slice_name}")
+            self.prbs = int(slice_info["allocation_policy"]["share"])
+
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        ticks = 0
+        while num_ticks is None or ticks < num_ticks:
+            now = loop.time()
+            if now < next_tick:
+                await asyncio.sleep(next_tick - now)
+            self.lateness.append(loop.time() - next_tick)
+            await self.tick()
+            ticks += 1
+
+            # Drop the ticks the loop has already fallen behind on
+            next_tick += self.period
+            behind = loop.time() - next_tick
+            if behind > 0:
+                missed = int(behind // self.period) + 1
+                self.counts["missed"] += missed
+                next_tick += missed * self.period
+        if self.actuation is not None:
+            await self.actuation
+
+    def stats(self):
+        # Per-stage latency percentiles in milliseconds and the tick counts
+        summary = dict(self.counts)
+        for name, values in list(self.latency.items()) + [("lateness", self.lateness)]:
+            if values:
+                ms = np.asarray(values) * 1e3
+                summary[name] = {
+                    "p50": float(np.percentile(ms, 50)),
+                    "p99": float(np.percentile(ms, 99)),
+                    "max": float(ms.max()),
+                }
+        return summary
+
+
+# Greedy policy of a live agent checkpoint: the state_dict of agent.py's
+# QNetwork, Linear layers l1, l2, ... with ReLU in between, as `dqn` saves it.
+# The forward pass runs in NumPy, so torch is only needed to read the file.
+class CheckpointPolicy:
+
+    def __init__(self, pth_file):
+        import torch
+
+        state_dict = torch.load(pth_file, map_location="cpu")
+        names = set()
+        for key in state_dict:
+            match = re.fullmatch(r"(l\d+)\.(weight|bias)", key)
+            if match is None:
+                raise ValueError(f"{pth_file} is not a QNetwork state_dict ({key})")
+            names.add(match.group(1))
+        self.layers = [
+            (
+                state_dict[f"{name}.weight"].numpy().T.copy(),
+                state_dict[f"{name}.bias"].numpy().copy(),
+            )
+            for name in sorted(names, key=lambda name: int(name[1:]))
+        ]
+        self.state_len = self.layers[0][0].shape[0]
+
+    def __call__(self, state):
+        if len(state) != self.state_len:
+            raise ValueError(
+                f"State has {len(state)} values, the policy expects {self.state_len}"
+            )
+        x = np.asarray(state, dtype=np.float32)
+        for i, (weight, bias) in enumerate(self.layers):
+            x = x @ weight + bias
+            if i < len(self.layers) - 1:
+                x = np.maximum(x, 0)
+        return int(x.argmax())
+
+
+def random_policy(state):
+    return random.randrange(4)
+
+
+def parse():
+    """
+    Reads in CLI arguments
+    Returns argparse arguments object
+    """
+    parser = argparse.ArgumentParser(
+        description="Run the real-time control loop and report its latency"
+    )
+    parser.add_argument(
+        "--pth_file",
+        type=str,
+        default="test.pth",
+        help="Live agent checkpoint (QNetwork state_dict) to take decisions with",
+    )
+    parser.add_argument(
+        "--random_policy",
+        action="store_true",
+        help="Take random actions instead of loading --pth_file",
+    )
+    parser.add_argument(
+        "--move_ues",
+        action="store_true",
+        help="Let action 3 move the UE with the largest throughput to the secure slice",
+    )
+    parser.add_argument(
+        "--no_iperf",
+        action="store_true",
+        help="Do not start iperf3 clients in the UE namespaces; the iperf part of "
+        "the state stays 0",
+    )
+    parser.add_argument(
+        "--xapp", type=str, default=SERVER_HOST, help="Address of the northbound API"
+    )
+    parser.add_argument(
+        "--rest_port", type=int, default=8000, help="Port of the northbound API"
+    )
+    parser.add_argument(
+        "--kpm_port", type=int, default=SERVER_PORT, help="Port of the KPM reports"
+    )
+    parser.add_argument(
+        "--period", type=float, default=1.024, help="Seconds between two decisions"
+    )
+    parser.add_argument(
+        "--num_ticks", type=int, default=100, help="The number of ticks to run"
+    )
+    return parser.parse_args()
+
+
+def main():
+
+    args = parse()
+    try:
+        policy = (
+            random_policy if args.random_policy else CheckpointPolicy(args.pth_file)
+        )
+    except (OSError, ValueError) as e:
+        print(f"Could not load the policy: {e}")
+        return 1
+    namespaces = list(NAMESPACE_TO_IMSI)
+    # The iperf3 clients of the UEs, started and read as the live agent does
+    iperf = None
+    if not args.no_iperf:
+        iperf = IperfInterface(namespaces)
+        try:
+            iperf.start()
+        except OSError as e:
+            iperf.stop()
+            print(f"Could not start the iperf3 clients: {e} (see --no_iperf)")
+            return 1
+    kpm = KpmStreamClient(args.xapp, args.kpm_port)
+    kpm.start()
+    conf = ConfInterface(args.xapp, port=args.rest_port)
+    control = ControlLoop(
+        policy,
+        kpm,
+        conf,
+        None if iperf is None else iperf.collector,
+        period=args.period,
+        namespaces=namespaces,
+        move_ues=args.move_ues,
+    )
+    kpm.wait_for_report()
+    try:
+        if iperf is not None and not iperf.collector.wait_for_readings(
+            namespaces, timeout=10 * args.period
+        ):
+            print("Not every UE reported an iperf reading yet, using 0 until it does")
+        asyncio.run(control.run(args.num_ticks))
+    except RuntimeError as e:
+        print(e)
+        return 1
+    finally:
+        kpm.stop()
+        conf.close()
+        if iperf is not None:
+            iperf.stop()
+    for name, value in control.stats().items():
+        print(f"{name}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    rc = main()
+    sys.exit(rc)
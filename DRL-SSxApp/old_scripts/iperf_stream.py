@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+
+MBYTE = 1024 * 1024
+
+
+# Background collector for the iperf3 clients started by IperfInterface.
+#
+# Each client runs with `--json-stream`, which prints one JSON event per line
+# ("start", one "interval" per `-i` period, "end"). A daemon thread per
+# namespace reads those lines as they arrive and publishes the transfer of the
+# latest interval, in MBytes as in iperf3's text output, together with its bit
+# rate and receive time.
+#
+# The table of latest values is replaced by a new dict on every update, so
+# readers get a consistent snapshot in O(1) without taking a lock and never
+# wait for iperf output.
+class IperfCollector:
+
+    def __init__(self):
+        self.latest = dict()
+        self.threads = dict()
+        self.ready = dict()
+
+    def snapshot(self):
+        # {namespace: (MBytes, bits per second, receive time)}
+        return self.latest
+
+    def reading(self, namespace, default=0.0):
+        # MBytes transferred in the latest interval of `namespace`
+        value = self.latest.get(namespace)
+        return default if value is None else value[0]
+
+    def wait_for_readings(self, namespaces, timeout=None):
+        # Block until every namespace in `namespaces` has reported once
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for namespace in namespaces:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+            ready = self.ready.setdefault(namespace, threading.Event())
+            if not ready.wait(remaining):
+                return False
+        return True
+
+    def parse(self, line):
+        # (MBytes, bits per second) of an interval event, else None
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(event, dict) or event.get("event") != "interval":
+            return None
+        total = event.get("data", {}).get("sum", {})
+        if "bytes" not in total:
+            return None
+        return total["bytes"] / MBYTE, total.get("bits_per_second", 0.0)
+
+    def publish(self, namespace, reading):
+        latest = dict(self.latest)
+        latest[namespace] = reading + (time.time(),)
+        self.latest = latest
+        self.ready[namespace].set()
+
+    def collect(self, namespace, stream):
+        # Read the JSON events of one iperf3 client until its output ends
+        for line in stream:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", "replace")
+            reading = self.parse(line)
+            if reading is not None:
+                self.publish(namespace, reading)
+
+    def watch(self, namespace, stream):
+        # Start collecting `stream` (e.g. a Popen stdout) in a daemon thread,
+        # dropping the readings of an earlier stream of the same namespace
+        latest = dict(self.latest)
+        latest.pop(namespace, None)
+        self.latest = latest
+        self.ready.setdefault(namespace, threading.Event()).clear()
+        thread = threading.Thread(
+            target=self.collect, args=(namespace, stream), daemon=True
+        )
+        thread.start()
+        self.threads[namespace] = thread
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import threading
+import time
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 3000
+ACK_MESSAGE = b"KPM recieved"
+
+
+# Background client for the KPM reports the xApp sends on port 3000
+# (`ue_data_to_DRL` in src/nexran.cc). Each report is one JSON object,
+# {"<ue>": {"dl_bytes": "...", ...}}, and the sender waits for an ACK.
+#
+# The client keeps reading from one connection for as long as the xApp keeps
+# it open and reconnects right away when it is closed, as the current xApp
+# does after every report. Incoming bytes are buffered and decoded as a
+# stream of JSON objects, either back to back or one per line, so reports
+# larger than one `recv` are reassembled instead of failing to parse.
+#
+# Every report replaces the latest one of its UE in `latest`, which is swapped
+# for a new dict on each update so other threads can read it without a lock,
+# and is put on a bounded asyncio queue that drops the oldest report when
+# full. `start` runs the client on its own event loop in a daemon thread for
+# synchronous callers such as KpmInterface.
+class KpmStreamClient:
+
+    def __init__(
+        self,
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        queue_size=64,
+        reconnect_delay=0.05,
+        max_buffer=1 << 20,
+    ):
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.reconnect_delay = reconnect_delay
+        self.max_buffer = max_buffer
+        self.latest = dict()
+        self.received = dict()
+        self.reports_received = 0
+        self.queue = None
+        self.decoder = json.JSONDecoder()
+        self.first_report = threading.Event()
+        self.loop = None
+        self.task = None
+        self.thread = None
+
+    def snapshot(self):
+        # Latest KPMs of every UE; never blocks
+        return self.latest
+
+    def wait_for_report(self, timeout=None):
+        # Block until the first report arrived
+        return self.first_report.wait(timeout)
+
+    async def get(self):
+        # Next report from the queue, as (ue, kpms, receive time)
+        return await self.queue.get()
+
+    def decode(self, buffer, final=False):
+        # Split `buffer` into complete JSON objects and the unparsed rest.
+        # With `final` the rest can never be completed and is dropped.
+        messages = list()
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos == len(buffer):
+                return messages, ""
+            try:
+                message, pos = self.decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if final or len(buffer) - pos > self.max_buffer:
+                    print(f"Dropping malformed KPM data: {buffer[pos:pos + 80]!r}")
+                    return messages, ""
+                return messages, buffer[pos:]
+            messages.append(message)
+
+    def publish(self, message):
+        now = time.time()
+        latest = dict(self.latest)
+        received = dict(self.received)
+        for ue_name, kpms in message.items():
+            latest[ue_name] = kpms
+            received[ue_name] = now
+            if self.queue.full():
+                self.queue.get_nowait()
+            self.queue.put_nowait((ue_name, kpms, now))
+        self.received = received
+        self.latest = latest
+        self.reports_received += 1
+        self.first_report.set()
+
+    async def read_connection(self, reader, writer):
+        buffer = ""
+        while True:
+            data = await reader.read(65536)
+            messages, buffer = self.decode(
+                buffer + data.decode("utf-8", "replace"), final=not data
+            )
+            for message in messages:
+                if isinstance(message, dict):
+                    self.publish(message)
+                writer.write(ACK_MESSAGE)
+            if not data:
+                return
+            if messages:
+                await writer.drain()
+
+    async def run(self):
+        self.queue = asyncio.Queue(self.queue_size)
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            try:
+                await self.read_connection(reader, writer)
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                writer.close()
+
+    def serve(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.loop.close()
+
+    def start(self):
+        # Run the client in a daemon thread
+        if self.thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.task = self.loop.create_task(self.run())
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(timeout=1)
+        self.thread = None
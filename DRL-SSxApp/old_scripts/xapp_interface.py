@@ -1,12 +1,11 @@
-import socket
-import json
+import asyncio
 import requests
-import time
+import requests.adapters
 import subprocess
-import re
-
-SERVER_HOST = "127.0.0.1"
-SERVER_PORT = 3000
+import time
+from concurrent.futures import ThreadPoolExecutor
+from iperf_stream import IperfCollector
+from kpm_stream import SERVER_HOST, SERVER_PORT, KpmStreamClient
 
 
 class KpmInterface:
@@ -14,136 +13,172 @@ class KpmInterface:
     def __init__(self):
         self.current_state = list()
         self.current_ue = ""
+        # KPM reports are read in the background; get_kpms only returns the
+        # latest report of every UE
+        self.client = KpmStreamClient(SERVER_HOST, SERVER_PORT)
+        self.client.start()
 
     def get_kpms(self):
         print("Getting KPM: ", end="")
-        recieved_data = list()
-        start = time.time()
-        recieved_data = list()
-        while not recieved_data:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((SERVER_HOST, SERVER_PORT))
-                data = None
-                while True:
-                    time.sleep(0.1),
-                    data = s.recv(1024)
-                    if not data or data == b"":
-                        break
-                    else:
-                        print(data)
-                        recieved_data.append(json.loads(data))
-                        response_message = "KPM recieved"
-                        s.sendall(response_message.encode())
-                s.close()
-
-        print(recieved_data, time.time() - start)
+        self.client.wait_for_report()
+        latest = self.client.snapshot()
+        recieved_data = [{ue_name: latest[ue_name]} for ue_name in sorted(latest)]
+        print(recieved_data)
         return recieved_data
 
 
+# Client for the xApp's northbound REST API (etc/northbound-openapi.json).
+#
+# All calls go through one requests.Session, so connections to the xApp are
+# pooled and kept alive instead of paying a TCP handshake per action, and
+# every call has a timeout. A failed or timed out call counts as an error
+# response. Reads of the slice and UE lists and of single slices are cached
+# for `cache_ttl` seconds; any write clears the cache.
+#
+# The *_async variants run the same calls on a thread pool sharing the
+# session, so that e.g. several PRB reallocations or UE rebinds can be issued
+# concurrently with asyncio.gather (see `reallocate_many` and `move_ue`).
 class ConfInterface:
 
-    def __init__(self):
+    def __init__(self, xapp=None, port=8000, timeout=2.0, cache_ttl=0.5, pool_size=8):
         self.ues = []
         self.slices = []
+        if xapp is None:
+            xapp = self.find_xapp()
+        self.xapp = xapp
+        print("xapp: ", self.xapp)
+        self.url = f"http://{self.xapp}:{port}/v1"
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache = dict()
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size
+        )
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    @staticmethod
+    def find_xapp():
         command = "sudo kubectl get svc -n ricxapp --field-selector metadata.name=service-ricxapp-drl-ss-rmr -o jsonpath='{.items[0].spec.clusterIP}'"
         result = subprocess.run(
             command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
         if result.stderr:
             raise ValueError(f"Error occured with kubectl: {result.stderr}")
-        self.xapp = result.stdout.decode("utf-8")
-        print("xapp: ", self.xapp)
-
-    def get_slice(self, item):
-        response = requests.get(f"http://{self.xapp}:8000/v1/slices/{item}")
-        if response.status_code != 200:
-            print(response.text)
+        return result.stdout.decode("utf-8").strip()
+
+    def request(self, method, path, **kwargs):
+        # Returns the response, or None if the xApp could not be reached
+        if method != "GET":
+            self.cache.clear()
+        try:
+            return self.session.request(
+                method, f"{self.url}{path}", timeout=self.timeout, **kwargs
+            )
+        except requests.RequestException as e:
+            print(f"{method} {path} failed: {e}")
             return None
-        else:
-            return response.json()
 
-    def get_slices(self):
-        response = requests.get(f"http://{self.xapp}:8000/v1/slices")
-        if response.status_code != 200:
+    def get_json(self, path, cached=True):
+        now = time.monotonic()
+        if cached and path in self.cache:
+            expires, value = self.cache[path]
+            if now < expires:
+                return value
+        response = self.request("GET", path)
+        if response is None or response.status_code != 200:
+            if response is not None:
+                print(response.text)
             return None
-        else:
-            return response.json()
+        value = response.json()
+        self.cache[path] = (now + self.cache_ttl, value)
+        return value
 
-    def get_ues(self):
-        response = requests.get(f"http://{self.xapp}:8000/v1/ues")
-        if response.status_code != 200:
-            return None
-        else:
-            return response.json()
+    def ok(self, response):
+        # Any 2xx, e.g. 201 Created or 204 No Content from a POST or PUT
+        return response is not None and 200 <= response.status_code < 300
 
-    def create_slice(prbs, slice_name):
-        headers = {"Content-type": "application/json"}
+    def get_slice(self, item, cached=True):
+        return self.get_json(f"/slices/{item}", cached)
+
+    def get_slices(self, cached=True):
+        return self.get_json("/slices", cached)
+
+    def get_ues(self, cached=True):
+        return self.get_json("/ues", cached)
+
+    def create_slice(self, prbs, slice_name):
         payload = {
             "name": slice_name,
             "allocation_policy": {"type": "proportional", "share": prbs},
         }
-        response = requests.post(
-            f"http://{self.xapp}:8000/v1/slices", headers=headers, json=payload
-        )
-
-        if response.status_code != 200:
-            return False
-        else:
-            return True
+        return self.ok(self.request("POST", "/slices", json=payload))
 
     def bind_slice_to_eNB(self, nodeb, slice_name):
-        response = requests.post(
-            f"http://{self.xapp}:8000/v1/nodebs/{nodeb}/slices/{slice_name}"
-        )
-        if response.status == 200:
-            return True
-        else:
-            return False
+        return self.ok(self.request("POST", f"/nodebs/{nodeb}/slices/{slice_name}"))
 
     def create_ue(self, imsi):
-        headers = {"Content-type": "application/json"}
-        payload = {"imsi": imsi}
-        response = requests.post(
-            f"http://{self.xapp}:8000/v1/ues", headers=headers, json=payload
-        )
-        if response.status == 200:
-            return True
-        else:
-            return False
+        return self.ok(self.request("POST", "/ues", json={"imsi": imsi}))
 
     def bind_ue_to_slice(self, imsi, slice_name):
-        response = requests.post(
-            f"http://{self.xapp}:8000/v1/slices/{slice_name}/ues/{imsi}"
-        )
-        if response.status_code == 200:
-            return True
-        else:
-            return False
+        return self.ok(self.request("POST", f"/slices/{slice_name}/ues/{imsi}"))
 
     def unbind_ue(self, imsi, slice_name):
-        response = requests.delete(
-            f"http://{self.xapp}:8000/v1/slices/{slice_name}/ues/{imsi}"
-        )
-
-        if response.status_code == 200:
+        response = self.request("DELETE", f"/slices/{slice_name}/ues/{imsi}")
+        if self.ok(response):
             return True
-        print(response.text)
+        if response is not None:
+            print(response.text)
         return False
 
     def reallocate_prbs(self, prbs, slice_name):
-        headers = {"Content-type": "application/json"}
         payload = {
             "name": slice_name,
             "allocation_policy": {"type": "proportional", "share": str(prbs)},
         }
-        response = requests.put(
-            f"http://{self.xapp}:8000/v1/slices", headers=headers, json=payload
+        return self.ok(self.request("PUT", f"/slices/{slice_name}", json=payload))
+
+    async def run_async(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def get_slice_async(self, item, cached=True):
+        return await self.run_async(self.get_slice, item, cached)
+
+    async def reallocate_prbs_async(self, prbs, slice_name):
+        return await self.run_async(self.reallocate_prbs, prbs, slice_name)
+
+    async def bind_ue_to_slice_async(self, imsi, slice_name):
+        return await self.run_async(self.bind_ue_to_slice, imsi, slice_name)
+
+    async def unbind_ue_async(self, imsi, slice_name):
+        return await self.run_async(self.unbind_ue, imsi, slice_name)
+
+    async def reallocate_many(self, allocations):
+        # Reallocate {slice_name: prbs} concurrently; returns one result each
+        return await asyncio.gather(
+            *(
+                self.reallocate_prbs_async(prbs, slice_name)
+                for slice_name, prbs in allocations.items()
+            )
         )
 
-        if response.status_code != 200:
+    async def move_ue(self, imsi, from_slice, to_slice):
+        # Unbind a UE and bind it to another slice, e.g. the secure slice
+        if not await self.unbind_ue_async(imsi, from_slice):
             return False
-        else:
-            return True
+        return await self.bind_ue_to_slice_async(imsi, to_slice)
+
+    async def move_ues(self, imsis, from_slice, to_slice):
+        return await asyncio.gather(
+            *(self.move_ue(imsi, from_slice, to_slice) for imsi in imsis)
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
 
 
 class IperfInterface:
@@ -151,7 +186,9 @@ class IperfInterface:
     def __init__(self, namespaces):
         self.processes = dict()
         self.commands = dict()
-        self.pattern = re.compile(r"[0-9]*\.[0-9]+ MB", re.IGNORECASE)
+        # Readings are collected from the JSON output of every client in the
+        # background; get_reading only looks up the latest one
+        self.collector = IperfCollector()
         self.namespcaces = namespaces
         for namespace in self.namespcaces:
             namespace_to_port = {"ue1": "5006", "ue2": "5020", "ue3": "5030"}
@@ -176,20 +213,21 @@ class IperfInterface:
                 "-R",
                 "-b",
                 namespace_to_bandwidth[namespace],
+                "--json-stream",
             ]
             self.commands[namespace] = command
 
     def get_reading(self, namespace):
-        print(f"Getting Iperf of {namespace}: ", end="")
-        reading = None
-        while reading is None:
-            if self.processes[namespace].stderr:
-                print(self.processes[namespace].stderr)
-            for line in self.processes[namespace].stdout:
-                reading = self.pattern.search(line.decode("utf-8").strip())
-                if reading:
-                    break
-        return float(reading.group().split(" ")[0])
+        # MBytes received in the latest one second interval
+        self.collector.wait_for_readings([namespace])
+        reading = self.collector.reading(namespace)
+        print(f"Iperf of {namespace}: {reading}")
+        return reading
+
+    def get_readings(self):
+        # Latest reading of every namespace, in order
+        self.collector.wait_for_readings(self.namespcaces)
+        return [self.collector.reading(namespace) for namespace in self.namespcaces]
 
     def start(self):
         for namespace in self.namespcaces:
@@ -200,6 +238,13 @@ class IperfInterface:
                 self.commands[namespace], stdout=subprocess.PIPE, stderr=subprocess.PIPE
             )
             self.processes[namespace] = new_process
+            self.collector.watch(namespace, new_process.stdout)
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+            process.wait()
+        self.processes = dict()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+# # `parallel_training.py` -- Multi-actor experience collection for the DQN, DDQN and Dueling DQN agents
+#
+# `run_dqn`, `run_ddqn` and `run_dueling` step the environment, choose actions
+# and learn on a single thread. `run_parallel` splits that work across
+# processes in the style of Ape-X (Horgan et al., 2018):
+#
+# - **Actors** each run a VectorSliceEnv with their own exploration rate. They
+#   choose actions with a local copy of the Q-network and write every
+#   transition into a ring of rows in shared memory.
+# - **The learner** (the calling process) drains the actor rings into the
+#   agent's replay buffer, calls `learn()` continuously and periodically
+#   publishes the flattened weights of `qnetwork_local` to a shared-memory
+#   block that the actors copy from. The block is guarded by a seqlock: the
+#   learner makes the weights version odd while it writes and even again
+#   afterwards, and an actor keeps a copy only if the version was the same
+#   even number before and after copying, so it never loads half-written
+#   weights.
+#
+# Actor `i` of `N` explores with $\\epsilon_i = \\epsilon^{1 + \\alpha i / (N -
+# 1)}$, so some actors explore heavily while others mostly exploit. An actor
+# waits if its ring is full, i.e. if it gets more than `ring_size` transitions
+# ahead of the learner.
+
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import torch
+from torch.nn.utils import parameters_to_vector, vector_to_parameters
+
+from common import VectorSliceEnv
+
+# Columns of a transition row in an actor's ring:
+# state (3), action, reward, next_state (3), done
+STATE_LEN = 3
+ROW_LEN = 2 * STATE_LEN + 3
+
+
+# ### **Shared Array**
+#
+# A NumPy array backed by `multiprocessing.shared_memory`. The creating
+# process owns the block and unlinks it on `close`; when the array is passed
+# to a child process it is re-attached by name.
+class SharedArray:
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        if self.owner:
+            self.array.fill(0)
+
+    def __reduce__(self):
+        return (SharedArray, (self.shape, self.dtype.str, self.shm.name))
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ### **Weights Seqlock**
+def publish_weights(shared_weights, weights_version, weights):
+    with weights_version.get_lock():
+        weights_version.value += 1
+    shared_weights.array[:] = weights
+    with weights_version.get_lock():
+        weights_version.value += 1
+
+
+def read_weights(shared_weights, weights_version, stop_event):
+    # Consistent copy of the shared weights and their version, or (None, None)
+    # if the actor is stopped while waiting for the learner to finish a write
+    while not stop_event.is_set():
+        version = weights_version.value
+        if version % 2 == 0:
+            weights = shared_weights.array.copy()
+            if weights_version.value == version:
+                return weights, version
+        time.sleep(0)
+    return None, None
+
+
+def actor_eps(actor_id, num_actors, eps_base=0.4, eps_alpha=7.0):
+    # Ape-X exploration schedule
+    if num_actors == 1:
+        return eps_base
+    return eps_base ** (1 + eps_alpha * actor_id / (num_actors - 1))
+
+
+def run_actor(
+    actor_id,
+    num_actors,
+    network_class,
+    action_len,
+    shared_weights,
+    weights_version,
+    ring,
+    write_count,
+    read_count,
+    episode_count,
+    stop_event,
+    num_envs,
+    max_t,
+    malicious_chance,
+    malicious_chance_increase,
+    sync_every,
+):
+    # Actor process: step the environment and push transitions to the ring
+    torch.set_num_threads(1)
+    network = network_class(STATE_LEN, action_len, seed=actor_id)
+    network.eval()
+    ring_size = len(ring.array)
+    local_version = -1
+
+    eps = actor_eps(actor_id, num_actors)
+    rng = np.random.default_rng(actor_id)
+    env = VectorSliceEnv(
+        num_envs,
+        max_t=max_t,
+        malicious_chance=malicious_chance,
+        malicious_chance_increase=malicious_chance_increase,
+        seed=actor_id,
+    )
+
+    step = 0
+    while not stop_event.is_set():
+        # Pick up fresh weights from the learner
+        if step % sync_every == 0 and weights_version.value != local_version:
+            weights, local_version = read_weights(
+                shared_weights, weights_version, stop_event
+            )
+            if weights is None:
+                return
+            vector_to_parameters(torch.from_numpy(weights), network.parameters())
+        step += 1
+
+        states = env.states.copy()
+        with torch.inference_mode():
+            q_values = network(torch.from_numpy(states.astype(np.float32)))
+        actions = q_values.argmax(1).numpy()
+        explore = rng.random(num_envs) < eps
+        actions[explore] = rng.integers(0, action_len, size=np.count_nonzero(explore))
+
+        next_states, rewards, dones, finished = env.step(actions)
+
+        # Wait for the learner if the ring is full
+        while write_count.value + num_envs - read_count.value > ring_size:
+            if stop_event.is_set():
+                return
+            time.sleep(0.001)
+
+        rows = (write_count.value + np.arange(num_envs)) % ring_size
+        ring.array[rows, :STATE_LEN] = states
+        ring.array[rows, STATE_LEN] = actions
+        ring.array[rows, STATE_LEN + 1] = rewards
+        ring.array[rows, STATE_LEN + 2 : 2 * STATE_LEN + 2] = next_states
+        ring.array[rows, -1] = dones
+        with write_count.get_lock():
+            write_count.value += num_envs
+        with episode_count.get_lock():
+            episode_count.value += int(np.count_nonzero(finished))
+
+
+def drain_ring(ring, write_count, read_count, memory):
+    # Move an actor's new transitions into the replay buffer and return their
+    # rewards
+    start, end = read_count.value, write_count.value
+    if start == end:
+        return np.empty(0)
+    batch = ring.array[np.arange(start, end) % len(ring.array)]
+    memory.add_batch(
+        batch[:, :STATE_LEN],
+        batch[:, STATE_LEN],
+        batch[:, STATE_LEN + 1],
+        batch[:, STATE_LEN + 2 : 2 * STATE_LEN + 2],
+        batch[:, -1],
+    )
+    with read_count.get_lock():
+        read_count.value = end
+    return batch[:, STATE_LEN + 1]
+
+
+def run_parallel(
+    agent,
+    n_episodes=1500,
+    max_t=4,
+    pth_file="checkpoint.pth",
+    malicious_chance=1000,
+    malicious_chance_increase=0.0,
+    num_actors=4,
+    envs_per_actor=8,
+    ring_size=65536,
+    broadcast_every=50,
+    sync_every=10,
+    gamma=0.99,
+):
+    """
+    Train `agent` with `num_actors` actor processes feeding its replay buffer
+    until the actors have finished `n_episodes` episodes. Returns the reward of
+    every collected transition and (correct, total), like `run_dqn`.
+    """
+    ctx = mp.get_context("spawn")
+
+    # Flattened policy weights the actors copy from
+    weights = parameters_to_vector(agent.qnetwork_local.parameters()).detach().cpu()
+    shared_weights = SharedArray(weights.shape, np.float32)
+    shared_weights.array[:] = weights.numpy()
+    weights_version = ctx.Value("q", 0)
+
+    episode_count = ctx.Value("q", 0)
+    stop_event = ctx.Event()
+    rings = []
+    workers = []
+    for actor_id in range(num_actors):
+        ring = SharedArray((ring_size, ROW_LEN), np.float64)
+        write_count = ctx.Value("q", 0)
+        read_count = ctx.Value("q", 0)
+        rings.append((ring, write_count, read_count))
+        worker = ctx.Process(
+            target=run_actor,
+            args=(
+                actor_id,
+                num_actors,
+                type(agent.qnetwork_local),
+                agent.action_len,
+                shared_weights,
+                weights_version,
+                ring,
+                write_count,
+                read_count,
+                episode_count,
+                stop_event,
+                envs_per_actor,
+                max_t,
+                malicious_chance,
+                malicious_chance_increase,
+                sync_every,
+            ),
+            daemon=True,
+        )
+        worker.start()
+        workers.append(worker)
+
+    rewards = []
+    learn_steps = 0
+    try:
+        while episode_count.value < n_episodes:
+            if not any(worker.is_alive() for worker in workers):
+                raise RuntimeError("All actor processes exited")
+
+            drained = 0
+            for ring, write_count, read_count in rings:
+                new_rewards = drain_ring(ring, write_count, read_count, agent.memory)
+                rewards.extend(new_rewards.tolist())
+                drained += len(new_rewards)
+
+            if len(agent.memory) <= agent.memory.batch_size:
+                if not drained:
+                    time.sleep(0.001)
+                continue
+
+            agent.learn(agent.memory.sample(), gamma)
+            learn_steps += 1
+
+            # Publish fresh weights to the actors
+            if learn_steps % broadcast_every == 0:
+                weights = parameters_to_vector(agent.qnetwork_local.parameters())
+                publish_weights(
+                    shared_weights, weights_version, weights.detach().cpu().numpy()
+                )
+
+            if learn_steps % 1000 == 0:
+                avg_reward = sum(rewards[-1000:]) / 1000
+                print(
+                    f"\rEpisode {episode_count.value}\tAverage Score: {avg_reward:.2f}",
+                    end="",
+                )
+    finally:
+        stop_event.set()
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        for ring, _, _ in rings:
+            ring.close()
+        shared_weights.close()
+
+    # Save the model checkpoint
+    torch.save(agent.qnetwork_local.state_dict(), pth_file)
+    print(f"\nModel saved to {pth_file}")
+
+    correct = sum(1 for reward in rewards if reward > 0)
+    return rewards, (correct, len(rewards))
@@ -0,0 +1,279 @@
+# # `policy_runtime.py` -- Low-latency CPU backends for the trained Q-networks
+#
+# The live xApp path scores one state per decision, so the cost of a decision
+# is dominated by per-call overhead rather than by the few matmuls of the
+# network. Besides the eager `nn.Module` of `networks.py`, every model can be
+# served from the artifacts written by `export_models.py`:
+#
+# - `torchscript`: a scripted, frozen and inference-optimized module
+#   (`export/<model>.pt`). It skips the Python `forward` and autograd
+#   bookkeeping of the eager module.
+# - `onnx`: an ONNX graph (`export/<model>.onnx`) run by onnxruntime, which
+#   does not go through the torch dispatcher at all. Only available when
+#   onnxruntime is installed.
+# - `numpy`: the flat weights in `export/<model>.npz`, run by the NumPy forward
+#   pass of `numpy_policy.py`. A serving process that only needs this backend
+#   can import `numpy_policy` directly and never load torch.
+# - `int8`: the network with every `nn.Linear` dynamically quantized to int8
+#   (`export/<model>_int8.pth`, written by `inference.py --quantize` once it
+#   has passed the accuracy gate).
+#
+# Every backend is wrapped in a `Policy` with the same interface: `q_values`
+# scores a (num_states, 3) matrix and calling the policy with one state
+# returns its greedy action. With `per_state=True` a state's Q-values do not
+# depend on the other states it is scored with: the Dueling network takes its
+# mean advantage per state instead of over the whole batch, which the frozen
+# `torchscript` and `onnx` graphs cannot do, and `int8` is ruled out because
+# it picks its activation scale per batch. `load_policy(..., backend="auto")`
+# loads every backend that is available for a model, times a few decisions
+# with each and keeps the fastest.
+
+import os
+import time
+import warnings
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from model_registry import get_model
+from networks import NETWORKS, Dueling_QNetwork
+from numpy_policy import NumpyPolicy
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+EXPORT_DIR = "export"
+BACKENDS = ("onnx", "numpy", "torchscript", "int8", "eager")
+# Backends whose Q-values of a state do not depend on the rest of the batch
+PER_STATE_BACKENDS = ("onnx", "numpy", "torchscript", "eager")
+PER_STATE_DUELING_BACKENDS = ("numpy", "eager")
+INPUT_NAME = "state"
+OUTPUT_NAME = "q_values"
+
+
+def export_paths(model_type, export_dir=EXPORT_DIR):
+    # Artifact of every exported backend of `model_type`
+    return {
+        "torchscript": os.path.join(export_dir, f"{model_type}.pt"),
+        "onnx": os.path.join(export_dir, f"{model_type}.onnx"),
+        "numpy": os.path.join(export_dir, f"{model_type}.npz"),
+        "int8": os.path.join(export_dir, f"{model_type}_int8.pth"),
+    }
+
+
+# ### **Policies**
+#
+# `q_values` takes any array-like of states and returns a float32 NumPy array
+# of Q-values; `__call__` takes a single state and returns the greedy action
+# as an int.
+class Policy:
+
+    backend = None
+
+    def __init__(self, model_type):
+        self.model_type = model_type
+
+    def q_values(self, states):
+        raise NotImplementedError
+
+    def __call__(self, state):
+        return int(self.q_values(np.reshape(state, (1, -1)))[0].argmax())
+
+
+class TorchPolicy(Policy):
+
+    backend = "eager"
+
+    def __init__(self, model_type, module):
+        super().__init__(model_type)
+        self.module = module
+
+    def q_values(self, states):
+        states = torch.from_numpy(np.asarray(states, dtype=np.float32))
+        with torch.inference_mode():
+            return self.module(states).numpy()
+
+
+class TorchScriptPolicy(TorchPolicy):
+
+    backend = "torchscript"
+
+
+class Int8Policy(TorchPolicy):
+
+    backend = "int8"
+
+
+class OnnxPolicy(Policy):
+
+    backend = "onnx"
+
+    def __init__(self, model_type, onnx_file, threads=1):
+        super().__init__(model_type)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        self.session = onnxruntime.InferenceSession(
+            onnx_file, options, providers=["CPUExecutionProvider"]
+        )
+
+    def q_values(self, states):
+        states = np.asarray(states, dtype=np.float32)
+        return self.session.run([OUTPUT_NAME], {INPUT_NAME: states})[0]
+
+
+class RowMeanDueling(torch.nn.Module):
+    # Dueling_QNetwork (float32 or quantized) with the mean advantage taken
+    # per state
+
+    def __init__(self, network):
+        super().__init__()
+        self.network = network
+
+    def forward(self, input_state):
+        x = F.relu(self.network.l1(input_state))
+        x = F.relu(self.network.l2(x))
+        value = self.network.value_stream(x)
+        advantage = self.network.advantage_stream(x)
+        return value + (advantage - advantage.mean(1, keepdim=True))
+
+
+def per_state_backends(model_type):
+    if NETWORKS[model_type] is Dueling_QNetwork:
+        return PER_STATE_DUELING_BACKENDS
+    return PER_STATE_BACKENDS
+
+
+def load_torchscript(ts_file):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        module = torch.jit.load(ts_file, map_location="cpu")
+    module.eval()
+    return module
+
+
+# ### **Dynamic Quantization**
+#
+# The weights of every `nn.Linear` are stored as int8 and its activations are
+# quantized on the fly, per batch, so no calibration data is needed. The
+# quantized kernels only run on the CPU. A quantized state_dict can only be
+# loaded into a network that was quantized the same way, so
+# `load_quantized` quantizes a freshly built network before loading it.
+def quantize_network(network):
+    return torch.ao.quantization.quantize_dynamic(
+        network, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def load_quantized(model_type, pth_file, state_size=3, action_size=4):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        network = quantize_network(NETWORKS[model_type](state_size, action_size, 0))
+        network.load_state_dict(torch.load(pth_file, map_location="cpu"))
+    network.eval()
+    return network
+
+
+def available_backends(model_type, export_dir=EXPORT_DIR, per_state=False):
+    # Backends of `model_type` that can be loaded, in order of preference
+    if per_state:
+        backends = available_backends(model_type, export_dir)
+        return [b for b in backends if b in per_state_backends(model_type)]
+    paths = export_paths(model_type, export_dir)
+    backends = list()
+    if onnxruntime is not None and os.path.exists(paths["onnx"]):
+        backends.append("onnx")
+    if os.path.exists(paths["numpy"]):
+        backends.append("numpy")
+    if os.path.exists(paths["torchscript"]):
+        backends.append("torchscript")
+    if os.path.exists(paths["int8"]):
+        backends.append("int8")
+    backends.append("eager")
+    return backends
+
+
+def build_policy(
+    model_type,
+    backend,
+    export_dir=EXPORT_DIR,
+    pth_file=None,
+    threads=1,
+    per_state=False,
+):
+    paths = export_paths(model_type, export_dir)
+    if per_state and backend not in per_state_backends(model_type):
+        raise ValueError(
+            f"The {backend} backend cannot score {model_type} states one by one, "
+            f"use one of {', '.join(per_state_backends(model_type))}"
+        )
+    row_mean = per_state and NETWORKS[model_type] is Dueling_QNetwork
+    if backend == "eager":
+        module = get_model(model_type, "cpu", pth_file)
+        return TorchPolicy(model_type, RowMeanDueling(module) if row_mean else module)
+    if backend == "torchscript":
+        return TorchScriptPolicy(model_type, load_torchscript(paths["torchscript"]))
+    if backend == "int8":
+        module = load_quantized(model_type, paths["int8"])
+        return Int8Policy(model_type, RowMeanDueling(module) if row_mean else module)
+    if backend == "onnx":
+        if onnxruntime is None:
+            raise ImportError("The onnx backend needs onnxruntime")
+        return OnnxPolicy(model_type, paths["onnx"], threads)
+    if backend == "numpy":
+        return NumpyPolicy(model_type, paths["numpy"], row_mean=row_mean)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+# ### **Latency**
+#
+# Per-decision latency of `policy`, in seconds: the policy is called with one
+# state `repeats` times after `warmup` untimed calls.
+def decision_latencies(policy, state=None, repeats=1000, warmup=50):
+    if state is None:
+        state = np.array([6877 * 2897, 6877 * 965, 6877 * 91], dtype=np.float32)
+    for _ in range(warmup):
+        policy(state)
+    latencies = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        policy(state)
+        latencies[i] = time.perf_counter() - start
+    return latencies
+
+
+def load_policy(
+    model_type,
+    backend="auto",
+    export_dir=EXPORT_DIR,
+    pth_file=None,
+    threads=1,
+    repeats=200,
+    per_state=False,
+):
+    # Load `model_type` on `backend`. With "auto" every available backend is
+    # loaded and the one with the lowest median decision latency is returned.
+    if backend != "auto":
+        return build_policy(
+            model_type, backend, export_dir, pth_file, threads, per_state
+        )
+
+    best, best_latency = None, None
+    for name in available_backends(model_type, export_dir, per_state):
+        try:
+            policy = build_policy(
+                model_type, name, export_dir, pth_file, threads, per_state
+            )
+        except (OSError, RuntimeError) as e:
+            print(f"Skipping {name} backend of {model_type}: {e}")
+            continue
+        latency = float(np.median(decision_latencies(policy, repeats=repeats)))
+        if best_latency is None or latency < best_latency:
+            best, best_latency = policy, latency
+    return best
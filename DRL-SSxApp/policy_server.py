@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+
+# # `policy_server.py` -- Micro-batching policy server for many cells and UEs
+#
+# `get_action` scores one state per call and the live loop serves one cell,
+# but in production many E2 nodes and UEs report at once. This server loads a
+# policy once (any backend of `policy_runtime.py`) and answers decision
+# requests from any number of clients over a UNIX socket (`--socket`) or TCP.
+#
+# The protocol is newline-delimited JSON, like the KPM reports. A request
+# holds one state or several:
+#
+# ```
+# {"id": 7, "state": [19922669, 6636805, 625807]}
+# {"id": 8, "states": [[...], [...]]}
+# ```
+#
+# At most `--max_request_states` states are accepted per request. The
+# response holds the greedy action and the Q-values of each state, in the
+# same order: `{"id": 7, "actions": [2], "q_values": [[...]]}`. A client may
+# send more requests before the first response arrives; responses carry the
+# request's `id` and can come back out of order.
+#
+# Requests are not scored one by one. The first request that arrives opens a
+# micro-batch, which then collects every request that arrives until it holds
+# `--max_batch` states or `--max_wait_ms` have passed, and the whole batch is
+# scored with one forward pass. The forward pass runs on a worker thread, so
+# the event loop keeps reading requests meanwhile and they form the next
+# batch. Under light load a request therefore waits at most `--max_wait_ms`
+# before it is scored; under heavy load batches grow up to `--max_batch` and
+# the per-request cost of the forward pass shrinks with them. With
+# `--max_wait_ms 0` a batch never waits: it holds whatever arrived while the
+# previous batch was being scored, which gives the lowest latency at light
+# load.
+#
+# A state's Q-values must not depend on other clients' states in the same
+# batch, so the policy is loaded with `per_state`: Dueling_QNetwork takes its
+# mean advantage per state instead of over the whole batch, which rules out
+# the `torchscript` and `onnx` backends for Dueling, and the `int8` backend,
+# whose activation scale is picked per batch, is not used for any model.
+#
+# With `--benchmark` the server is started on a temporary socket and
+# `--clients` concurrent clients each send `--requests` requests, one at a
+# time, after which throughput, latency and batch sizes are reported.
+#
+# Example:
+#
+# ```bash
+# python3 policy_server.py --model_type DDQN --backend numpy --socket /tmp/policy.sock
+# python3 policy_server.py --model_type DDQN --benchmark --clients 64 --max_wait_ms 1
+# ```
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from numpy_policy import NumpyPolicy
+
+# Kept in step with networks.NETWORKS and policy_runtime, which import torch
+MODEL_TYPES = ("DQN", "DDQN", "Dueling")
+BACKENDS = ("onnx", "numpy", "torchscript", "int8", "eager")
+EXPORT_DIR = "export"
+STATE_SIZE = 3
+# Pending connections, enough for every client of a cell site to connect at once
+BACKLOG = 1024
+# Longest request line, comfortably above --max_request_states states
+LINE_LIMIT = 1 << 23
+
+
+def parse():
+    """
+    Reads in CLI arguments
+    Returns argparse arguments object
+    """
+    parser = argparse.ArgumentParser(
+        description="Serve DQN, DDQN and Dueling DQN decisions to many clients in micro-batches")
+    parser.add_argument(
+        "--model_type",
+        type=str,
+        default="DQN",
+        help="Type of model to use. Options: DQN, DDQN, Dueling")
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="auto",
+        help=f"Backend of the policy. Options: auto, {', '.join(BACKENDS)}")
+    parser.add_argument(
+        "--export_dir",
+        type=str,
+        default=EXPORT_DIR,
+        help="Directory of the exported models")
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=None,
+        help="UNIX socket to listen on instead of TCP")
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address to listen on")
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=5000,
+        help="TCP port to listen on")
+    parser.add_argument(
+        "--max_batch",
+        type=int,
+        default=256,
+        help="Largest number of states scored in one forward pass")
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=1.0,
+        help="Longest time a micro-batch waits for more requests")
+    parser.add_argument(
+        "--max_request_states",
+        type=int,
+        default=65536,
+        help="Largest number of states one request may hold")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of threads the forward pass may use")
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Load-test the server with concurrent clients and report its latency")
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=32,
+        help="Number of concurrent clients of the benchmark")
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=1000,
+        help="Number of requests every benchmark client sends")
+    return parser.parse_args()
+
+
+# ### **Micro-Batcher**
+#
+# `submit` queues a (num_states, 3) array and returns a future that resolves
+# to its (actions, Q-values). `run` forms the micro-batches: it waits for the
+# first request, takes whatever else is already queued, then keeps waiting
+# for more until the batch is full or its deadline passes. A request is never
+# split across batches, so a batch can exceed `max_batch` by one request.
+class MicroBatcher:
+
+    def __init__(self, policy, max_batch=256, max_wait=0.001, history=100000):
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.counts = {"requests": 0, "states": 0, "batches": 0, "errors": 0}
+        self.batch_sizes = deque(maxlen=history)
+        self.latency = deque(maxlen=history)
+
+    def submit(self, states):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((states, future, time.perf_counter()))
+        return future
+
+    async def next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        rows = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while rows < self.max_batch:
+            if self.queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self.queue.get_nowait()
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            states = np.concatenate([states for states, _, _ in batch])
+            try:
+                q_values = await loop.run_in_executor(
+                    self.executor, self.policy.q_values, states)
+            except Exception as e:
+                self.counts["errors"] += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            actions = q_values.argmax(1)
+
+            now = time.perf_counter()
+            start = 0
+            for request_states, future, submitted in batch:
+                end = start + len(request_states)
+                if not future.done():
+                    future.set_result((actions[start:end], q_values[start:end]))
+                self.latency.append(now - submitted)
+                start = end
+            self.counts["requests"] += len(batch)
+            self.counts["states"] += len(states)
+            self.counts["batches"] += 1
+            self.batch_sizes.append(len(states))
+
+    def stats(self):
+        # Request counts, batch sizes and request latency in milliseconds
+        summary = dict(self.counts)
+        if self.batch_sizes:
+            summary["mean_batch"] = float(np.mean(self.batch_sizes))
+            summary["max_batch"] = int(np.max(self.batch_sizes))
+        if self.latency:
+            ms = np.asarray(self.latency) * 1e3
+            summary["latency"] = {
+                "p50": float(np.percentile(ms, 50)),
+                "p99": float(np.percentile(ms, 99)),
+                "max": float(ms.max()),
+            }
+        return summary
+
+
+# ### **Connections**
+#
+# Every request line is answered by its own task, so a client can pipeline
+# requests and one slow batch does not hold up its other requests. A request
+# line longer than LINE_LIMIT is skipped up to and including its newline,
+# and no further, and answered with an error. Lines are read with
+# `readuntil` rather than `readline`, which drops an overlong line that is
+# already buffered before raising, so the skip would also eat the next
+# request.
+def request_states(request, max_states):
+    if "states" in request:
+        states = np.asarray(request["states"], dtype=np.float32)
+    else:
+        states = np.asarray([request["state"]], dtype=np.float32)
+    if states.ndim != 2 or states.shape[1] != STATE_SIZE or len(states) == 0:
+        raise ValueError(f"Expected states of length {STATE_SIZE}")
+    if len(states) > max_states:
+        raise ValueError(f"At most {max_states} states per request")
+    return states
+
+
+async def answer(batcher, writer, request_id, states):
+    try:
+        actions, q_values = await batcher.submit(states)
+        response = {"id": request_id, "actions": actions.tolist(),
+                    "q_values": q_values.tolist()}
+    except Exception as e:
+        write_error(writer, request_id, str(e))
+        return
+    writer.write(json.dumps(response).encode() + b"\n")
+
+
+async def skip_line(reader, consumed):
+    # Discard an overlong line whose readuntil raised LimitOverrunError after
+    # scanning `consumed` bytes; False if the connection ended. When the
+    # newline is already buffered it sits right after those bytes, otherwise
+    # the rest of the line is discarded as it arrives.
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b"\n")
+            return True
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+        except asyncio.IncompleteReadError:
+            return False
+
+
+def write_error(writer, request_id, message):
+    writer.write(json.dumps({"id": request_id, "error": message}).encode() + b"\n")
+
+
+async def handle_connection(batcher, reader, writer, max_states):
+    tasks = set()
+    try:
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                # A last line without a newline, or b"" at the end
+                line = e.partial
+            except asyncio.LimitOverrunError as e:
+                write_error(writer, None, f"Bad request: longer than {LINE_LIMIT} bytes")
+                if not await skip_line(reader, e.consumed):
+                    break
+                continue
+            if not line:
+                break
+            request_id = None
+            try:
+                request = json.loads(line)
+                request_id = request.get("id")
+                states = request_states(request, max_states)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                write_error(writer, request_id, f"Bad request: {e}")
+                continue
+            task = asyncio.ensure_future(answer(batcher, writer, request_id, states))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if writer.transport.get_write_buffer_size() > 1 << 20:
+                await writer.drain()
+        if tasks:
+            await asyncio.gather(*tasks)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(batcher, args):
+    def handler(reader, writer):
+        return handle_connection(batcher, reader, writer, args.max_request_states)
+
+    if args.socket is not None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        return await asyncio.start_unix_server(handler, path=args.socket, backlog=BACKLOG,
+                                               limit=LINE_LIMIT)
+    return await asyncio.start_server(handler, args.host, args.port, backlog=BACKLOG,
+                                      limit=LINE_LIMIT)
+
+
+# ### **Client**
+#
+# Blocking client for callers such as the control loop; `act` sends one state
+# and returns its action and Q-values.
+class PolicyClient:
+
+    def __init__(self, path=None, host="127.0.0.1", port=5000, timeout=5.0):
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.stream = self.sock.makefile("rb")
+        self.next_id = 0
+
+    def act(self, state):
+        self.next_id += 1
+        request = {"id": self.next_id, "state": [float(value) for value in state]}
+        self.sock.sendall(json.dumps(request).encode() + b"\n")
+        response = json.loads(self.stream.readline())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["actions"][0], response["q_values"][0]
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+
+# ### **Benchmark**
+#
+# Closed-loop load test: every client keeps exactly one request in flight,
+# with a state drawn from the inference scenarios, for `num_requests`
+# requests. The clients share the server's event loop.
+async def run_client(args, num_requests, seed):
+    rng = np.random.default_rng(seed)
+    states = 6877 * np.power(10.0, rng.integers(0, 3, size=(num_requests, 3))) * [2897, 965, 91]
+    if args.socket is not None:
+        reader, writer = await asyncio.open_unix_connection(args.socket)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    latencies = np.empty(num_requests)
+    for i in range(num_requests):
+        start = time.perf_counter()
+        writer.write(json.dumps({"id": i, "state": states[i].tolist()}).encode() + b"\n")
+        response = json.loads(await reader.readline())
+        latencies[i] = time.perf_counter() - start
+        if "error" in response:
+            raise RuntimeError(response["error"])
+    writer.close()
+    return latencies
+
+
+async def benchmark(batcher, args):
+    start = time.perf_counter()
+    latencies = await asyncio.gather(
+        *[run_client(args, args.requests, seed) for seed in range(args.clients)])
+    elapsed = time.perf_counter() - start
+    ms = np.concatenate(latencies) * 1e3
+    stats = batcher.stats()
+    print(f"{args.clients} clients x {args.requests} requests in {elapsed:.2f}s: "
+          f"{len(ms) / elapsed:.0f} decisions/s")
+    print(f"Round trip p50 {np.percentile(ms, 50):.2f} ms, p99 {np.percentile(ms, 99):.2f} ms, "
+          f"max {ms.max():.2f} ms")
+    print(f"{stats['batches']} batches, mean size {stats['mean_batch']:.1f}, "
+          f"largest {stats['max_batch']}")
+
+
+def load_server_policy(args):
+    # The numpy backend is loaded without importing torch, which keeps a
+    # NumPy-only server small and quick to start
+    if args.backend == "numpy":
+        npz_file = os.path.join(args.export_dir, f"{args.model_type}.npz")
+        return NumpyPolicy(args.model_type, npz_file, row_mean=True)
+
+    import torch
+
+    from policy_runtime import load_policy
+
+    torch.set_num_threads(args.threads)
+    return load_policy(args.model_type, args.backend, args.export_dir,
+                       threads=args.threads, per_state=True)
+
+
+async def serve(args):
+    policy = load_server_policy(args)
+    batcher = MicroBatcher(policy, args.max_batch, args.max_wait_ms / 1e3)
+    batcher_task = asyncio.ensure_future(batcher.run())
+    server = await start_server(batcher, args)
+    address = args.socket if args.socket is not None else f"{args.host}:{args.port}"
+    print(f"Serving {args.model_type} ({policy.backend} backend) on {address}")
+
+    try:
+        if args.benchmark:
+            await benchmark(batcher, args)
+        else:
+            await server.serve_forever()
+    finally:
+        server.close()
+        batcher_task.cancel()
+        batcher.executor.shutdown(wait=False)
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+def main():
+
+    args = parse()
+    if args.model_type not in MODEL_TYPES:
+        raise ValueError(f"Unknown model type: {args.model_type}")
+    if args.benchmark and args.socket is None:
+        args.socket = os.path.join(tempfile.mkdtemp(), "policy.sock")
+    try:
+        return asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    rc = main()
+    sys.exit(rc)
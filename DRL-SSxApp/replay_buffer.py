@@ -0,0 +1,252 @@
+import os
+
+import numpy as np
+import torch
+
+
+# ### **Replay Buffer**
+#
+# ReplayBuffer stores experiences for the DQN, DDQN and Dueling DQN agents in
+# preallocated, contiguous NumPy arrays (one per field) instead of a deque of
+# namedtuples. New experiences are written at a cursor that wraps around once
+# the buffer is full, overwriting the oldest entries just like
+# `deque(maxlen=buffer_size)` did.
+#
+# Sampling draws `batch_size` distinct indices and gathers every field with a
+# single fancy-index operation, followed by one `torch.from_numpy` per field.
+#
+# init: Preallocates the state, action, reward, next state and done arrays.
+# add: Writes one experience at the cursor.
+# add_batch: Writes a batch of experiences, e.g. from a VectorSliceEnv step.
+# sample: Samples a batch of experiences and converts them into torch tensors.
+# len: Returns the number of experiences in the buffer.
+# state_dict / load_state_dict: The cursor, size and sampling RNG state.
+# save / load: Write the arrays to one `.npy` file each in a directory and read
+# them back through a memory map, for checkpoints of long runs.
+class ReplayBuffer:
+
+    # Replay Buffer for storing and sampling experiences.
+
+    def __init__(self, state_len, buffer_size, batch_size, device, seed=None):
+        self.buffer_size = int(buffer_size)
+        self.batch_size = batch_size
+        self.device = device
+        self.rng = np.random.default_rng(seed)
+
+        self.states = np.zeros((self.buffer_size, state_len), dtype=np.float32)
+        self.actions = np.zeros((self.buffer_size, 1), dtype=np.int64)
+        self.rewards = np.zeros((self.buffer_size, 1), dtype=np.float32)
+        self.next_states = np.zeros((self.buffer_size, state_len), dtype=np.float32)
+        self.dones = np.zeros((self.buffer_size, 1), dtype=np.float32)
+
+        self.cursor = 0
+        self.size = 0
+
+    def add(self, state, action, reward, next_state, done):
+        # Add experience to the buffer
+        i = self.cursor
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+
+        self.cursor = (i + 1) % self.buffer_size
+        self.size = min(self.size + 1, self.buffer_size)
+        return i
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        # Add a batch of experiences to the buffer, wrapping around the end.
+        # Of a batch larger than the buffer only the last buffer_size rows
+        # survive, so only they are written, each to the slot it would have
+        # ended up in; writing a slot twice in one fancy-index assignment
+        # leaves it undefined which row wins.
+        n = len(states)
+        skip = max(0, n - self.buffer_size)
+        idx = (self.cursor + np.arange(skip, n)) % self.buffer_size
+        self.states[idx] = np.asarray(states)[skip:]
+        self.actions[idx, 0] = np.asarray(actions)[skip:]
+        self.rewards[idx, 0] = np.asarray(rewards)[skip:]
+        self.next_states[idx] = np.asarray(next_states)[skip:]
+        self.dones[idx, 0] = np.asarray(dones)[skip:]
+
+        self.cursor = int((self.cursor + n) % self.buffer_size)
+        self.size = min(self.size + n, self.buffer_size)
+        return idx
+
+    def _to_tensors(self, idx):
+        return (
+            torch.from_numpy(self.states[idx]).to(self.device),
+            torch.from_numpy(self.actions[idx]).to(self.device),
+            torch.from_numpy(self.rewards[idx]).to(self.device),
+            torch.from_numpy(self.next_states[idx]).to(self.device),
+            torch.from_numpy(self.dones[idx]).to(self.device),
+        )
+
+    def sample(self):
+        # Sample a batch of experiences from the buffer
+        idx = self.rng.choice(self.size, size=self.batch_size, replace=False)
+        return self._to_tensors(idx)
+
+    def __len__(self):
+        return self.size
+
+    def _arrays(self):
+        return {
+            "states": self.states,
+            "actions": self.actions,
+            "rewards": self.rewards,
+            "next_states": self.next_states,
+            "dones": self.dones,
+        }
+
+    def state_dict(self):
+        return {
+            "cursor": self.cursor,
+            "size": self.size,
+            "rng": self.rng.bit_generator.state,
+        }
+
+    def load_state_dict(self, state):
+        self.cursor = state["cursor"]
+        self.size = state["size"]
+        self.rng.bit_generator.state = state["rng"]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self._arrays().items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+
+    def load(self, directory):
+        for name, array in self._arrays().items():
+            path = os.path.join(directory, f"{name}.npy")
+            np.copyto(array, np.load(path, mmap_mode="r"))
+
+
+# ### **Sum Tree**
+#
+# A binary tree whose leaves hold the priority of each slot in the replay
+# buffer and whose internal nodes hold the sum of their children, so the root
+# is the total priority. Updating a priority and finding the slot that owns a
+# given prefix sum both walk a single root-to-leaf path, i.e. O(log n). The
+# capacity is rounded up to a power of two so that the tree is stored as a flat
+# array (root at index 1, children of node k at 2k and 2k + 1) and a whole
+# batch of updates or lookups can descend the tree together in NumPy.
+class SumTree:
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.depth = max(1, int(np.ceil(np.log2(self.capacity))))
+        self.leaf_offset = 1 << self.depth
+        self.tree = np.zeros(2 * self.leaf_offset, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, idx):
+        return self.tree[self.leaf_offset + np.asarray(idx)]
+
+    def update(self, idx, priorities):
+        # Set the priorities of slots `idx` and refresh their ancestors
+        nodes = self.leaf_offset + np.atleast_1d(idx)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        # Return the slots whose cumulative priority range contains `values`
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(values.shape, dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values = np.where(go_right, values - left_sum, values)
+            nodes = np.where(go_right, left + 1, left)
+        return np.minimum(nodes - self.leaf_offset, self.capacity - 1)
+
+
+# ### **Prioritized Replay Buffer**
+#
+# Proportional prioritized experience replay (Schaul et al., 2016). Each
+# experience is sampled with probability $P(i) = p_i^\\alpha / \\sum_k
+# p_k^\\alpha$, where $p_i = |\\delta_i| + \\epsilon$ is its last TD error.
+# New experiences get the largest priority seen so far so that they are
+# replayed at least once. This makes rare events, such as a slice turning
+# malicious, show up in far more mini-batches than uniform sampling would.
+#
+# The bias introduced by non-uniform sampling is corrected with importance
+# sampling weights $w_i = (N \\cdot P(i))^{-\\beta} / \\max_j w_j$, where
+# $\\beta$ is annealed towards 1 over the course of training.
+#
+# sample: Returns the usual five tensors plus the weights and the sampled
+# slots. update_priorities: Stores the new TD errors of the sampled slots.
+class PrioritizedReplayBuffer(ReplayBuffer):
+
+    def __init__(
+        self,
+        state_len,
+        buffer_size,
+        batch_size,
+        device,
+        seed=None,
+        alpha=0.6,
+        beta=0.4,
+        beta_increment=2e-6,
+        eps=1e-6,
+    ):
+        super().__init__(state_len, buffer_size, batch_size, device, seed)
+        self.tree = SumTree(self.buffer_size)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0
+
+    def add(self, state, action, reward, next_state, done):
+        i = super().add(state, action, reward, next_state, done)
+        self.tree.update(i, self.max_priority**self.alpha)
+        return i
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        idx = super().add_batch(states, actions, rewards, next_states, dones)
+        self.tree.update(idx, self.max_priority**self.alpha)
+        return idx
+
+    def sample(self):
+        # Draw one prefix sum from each of batch_size equal segments
+        total = self.tree.total()
+        segment = total / self.batch_size
+        offsets = np.arange(self.batch_size) + self.rng.random(self.batch_size)
+        values = offsets * segment
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+
+        probs = self.tree.get(idx) / total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        weights = torch.from_numpy(weights.astype(np.float32)).unsqueeze(1)
+        return self._to_tensors(idx) + (weights.to(self.device), idx)
+
+    def _arrays(self):
+        arrays = super()._arrays()
+        arrays["priorities"] = self.tree.tree
+        return arrays
+
+    def state_dict(self):
+        state = super().state_dict()
+        state["beta"] = self.beta
+        state["max_priority"] = self.max_priority
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.beta = state["beta"]
+        self.max_priority = state["max_priority"]
+
+    def update_priorities(self, idx, td_errors):
+        priorities = np.abs(np.ravel(td_errors)) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idx, priorities**self.alpha)
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+
+# # `ric_emulator.py` -- Local stand-in for the xApp's northbound API and KPM socket
+#
+# The live agent in `old_scripts/agent.py` talks to two services of the
+# secure slicing xApp: the northbound REST API on port 8000
+# (`etc/northbound-openapi.json`) and the KPM reports that `ue_data_to_DRL` in
+# `src/nexran.cc` sends on port 3000. Both normally need a Kubernetes RIC and
+# srsRAN. This script serves both from one process so that the agent loop can
+# be benchmarked and load-tested on a plain Linux box:
+#
+# - **REST API**: `/v1/nodebs`, `/v1/slices`, `/v1/ues`, their bindings,
+#   `/v1/version` and `/v1/appconfig`, with the status codes and error bodies
+#   of `src/restserver.cc`. State lives in memory and starts with one eNB, the
+#   slices `fast` and `secure_slice` and three UEs bound to `fast`, as
+#   `KpiEvm` expects.
+# - **KPM reports**: every `--kpm_interval` seconds each UE sends one report,
+#   `{"<ue>": {"dl_bytes": "...", ...}}` with the 19 fields of nexran.cc in
+#   key order. The values are replayed from one capture in `Slicing_UE_Data`
+#   per UE (eMBB, Medium and URLLC for the three UEs) through the slice data
+#   cache. `dl_bytes` scales with the share of the UE's slice, so PRB
+#   reallocations and UE moves show up in the next reports, and with
+#   `--malicious_chance` a UE's traffic grows tenfold for a report as in the
+#   training environment.
+#
+# By default every report is sent the way nexran.cc does it: the emulator
+# accepts one connection, sends the JSON object, waits for the ACK and closes
+# the connection. `--kpm_stream` instead keeps one connection open and sends
+# newline-framed reports on it.
+#
+# Example:
+#
+# ```bash
+# python3 ric_emulator.py --rest_port 8000 --kpm_port 3000 --kpm_interval 0.1
+# ```
+
+import argparse
+import copy
+import json
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from slice_data import UE_DATA_DIR, load_ue_data
+
+# Fields of a KPM report, as sent by ue_data_to_DRL (std::map key order)
+KPM_FIELDS = sorted([
+    "dl_bytes", "ul_bytes", "dl_prbs", "ul_prbs", "tx_pkts", "tx_errors",
+    "tx_brate", "rx_pkts", "rx_errors", "rx_brate", "dl_cqi", "dl_ri",
+    "dl_pmi", "ul_phr", "ul_sinr", "ul_mcs", "ul_samples", "dl_mcs",
+    "dl_samples",
+])
+
+# Initial topology: UE IMSI and the capture slice type it replays
+DEFAULT_UES = {
+    "001010123456789": 0,  # ue1, eMBB
+    "001010123456780": 1,  # ue2, Medium
+    "001010123456781": 2,  # ue3, URLLC
+}
+DEFAULT_SLICE = "fast"
+SECURE_SLICE = "secure_slice"
+DEFAULT_NODEB = "enB_macro_001_001_0019b0"
+DEFAULT_SHARE = 1024
+
+# Number of recent ACK latencies the progress line summarizes
+ACK_HISTORY = 1000
+
+VERSION = {"major": 0, "minor": 1, "patch": 0, "version": "0.1.0-emulator"}
+
+
+def parse():
+    """
+    Reads in CLI arguments
+    Returns argparse arguments object
+    """
+    parser = argparse.ArgumentParser(
+        description="Emulate the secure slicing xApp's northbound API and KPM reports")
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address both servers listen on")
+    parser.add_argument(
+        "--rest_port",
+        type=int,
+        default=8000,
+        help="Port of the northbound REST API")
+    parser.add_argument(
+        "--kpm_port",
+        type=int,
+        default=3000,
+        help="Port KPM reports are sent on")
+    parser.add_argument(
+        "--kpm_interval",
+        type=float,
+        default=1.024,
+        help="Seconds between two rounds of KPM reports")
+    parser.add_argument(
+        "--kpm_stream",
+        action="store_true",
+        help="Send newline-framed reports on one connection instead of one connection per report")
+    parser.add_argument(
+        "--malicious_chance",
+        type=int,
+        default=0,
+        help="Each report has a 1 in malicious_chance + 1 chance of tenfold traffic (0 disables)")
+    parser.add_argument(
+        "--rest_latency",
+        type=float,
+        default=0.0,
+        help="Extra seconds added to every REST response")
+    parser.add_argument(
+        "--data_root",
+        type=str,
+        default=UE_DATA_DIR,
+        help="Directory of the per-slice UE captures")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the capture and malicious event draws")
+    return parser.parse_args()
+
+
+class AppError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ### **RIC State**
+#
+# The NodeBs, slices and UEs of the emulated xApp. All methods take the same
+# lock, since the REST server handles requests on several threads and the KPM
+# sender reads the slice shares concurrently.
+class RicState:
+
+    def __init__(self, ues=DEFAULT_UES):
+        self.lock = threading.Lock()
+        self.appconfig = {"kpm_interval_index": 12}
+        self.nodebs = {
+            DEFAULT_NODEB: {
+                "name": DEFAULT_NODEB, "type": "eNB", "mcc": "001", "mnc": "001",
+                "id": 411, "id_len": 20, "config": {"total_prb": 50},
+                "status": {"connected": True}, "slices": [DEFAULT_SLICE, SECURE_SLICE],
+            }
+        }
+        self.slices = {}
+        for name in (DEFAULT_SLICE, SECURE_SLICE):
+            self.slices[name] = {
+                "name": name,
+                "allocation_policy": {"type": "proportional", "share": DEFAULT_SHARE},
+                "ues": [],
+            }
+        self.ues = {}
+        for imsi in ues:
+            self.ues[imsi] = {"imsi": imsi, "tmsi": "", "crnti": "",
+                              "status": {"connected": True}}
+            self.slices[DEFAULT_SLICE]["ues"].append(imsi)
+
+    def _get(self, table, kind, name):
+        if name not in table:
+            raise AppError(404, f"{kind} {name} not found")
+        return table[name]
+
+    def list(self, kind):
+        with self.lock:
+            table = getattr(self, kind)
+            return {kind: [copy.deepcopy(item) for item in table.values()]}
+
+    def get(self, kind, name):
+        with self.lock:
+            return copy.deepcopy(self._get(getattr(self, kind), kind, name))
+
+    def create(self, kind, body):
+        key = "imsi" if kind == "ues" else "name"
+        if not isinstance(body, dict) or key not in body:
+            raise AppError(400, f"missing {key}")
+        with self.lock:
+            table = getattr(self, kind)
+            if body[key] in table:
+                raise AppError(403, f"{body[key]} already exists")
+            item = dict(body)
+            if kind == "slices":
+                item.setdefault("allocation_policy",
+                                {"type": "proportional", "share": DEFAULT_SHARE})
+                item["ues"] = []
+            elif kind == "nodebs":
+                item["slices"] = []
+            table[body[key]] = item
+            return copy.deepcopy(item)
+
+    def update(self, kind, name, body):
+        if not isinstance(body, dict):
+            raise AppError(400, "invalid body")
+        with self.lock:
+            item = self._get(getattr(self, kind), kind, name)
+            if kind == "slices" and "allocation_policy" in body:
+                policy = dict(body["allocation_policy"])
+                if "share" in policy:
+                    share = int(policy["share"])
+                    if not 0 <= share <= 1024:
+                        raise AppError(400, "share must be between 0 and 1024")
+                    policy["share"] = share
+                item["allocation_policy"] = policy
+            for field, value in body.items():
+                if field not in ("name", "imsi", "ues", "slices", "allocation_policy"):
+                    item[field] = value
+
+    def delete(self, kind, name):
+        with self.lock:
+            self._get(getattr(self, kind), kind, name)
+            del getattr(self, kind)[name]
+            if kind == "ues":
+                for item in self.slices.values():
+                    if name in item["ues"]:
+                        item["ues"].remove(name)
+
+    def bind(self, parent_kind, parent, kind, name, bound=True):
+        with self.lock:
+            item = self._get(getattr(self, parent_kind), parent_kind, parent)
+            self._get(getattr(self, kind), kind, name)
+            members = item[kind]
+            if bound:
+                if kind == "ues":
+                    # A UE is bound to one slice at a time
+                    for other in self.slices.values():
+                        if name in other["ues"]:
+                            raise AppError(403, f"{name} is bound to {other['name']}")
+                if name not in members:
+                    members.append(name)
+            elif name in members:
+                members.remove(name)
+            else:
+                raise AppError(404, f"{name} is not bound to {parent}")
+
+    def ue_shares(self):
+        # {imsi: share of the slice it is bound to, relative to the default}
+        with self.lock:
+            shares = {}
+            for item in self.slices.values():
+                share = item.get("allocation_policy", {}).get("share", DEFAULT_SHARE)
+                for imsi in item["ues"]:
+                    shares[imsi] = float(share) / DEFAULT_SHARE
+            return shares
+
+
+# ### **REST API**
+#
+# `route` maps one request onto the state and returns (status, body), with
+# body None for an empty response. Paths follow etc/northbound-openapi.json.
+COLLECTIONS = ("nodebs", "slices", "ues")
+BINDINGS = (("nodebs", "slices"), ("slices", "ues"))
+
+
+def route(state, method, path, body):
+    parts = path.strip("/").split("/")
+    if parts[0] != "v1":
+        raise AppError(404, f"no route for {path}")
+    parts = parts[1:]
+
+    if parts == ["version"] and method == "GET":
+        return 200, VERSION
+    if parts == ["appconfig"] and method == "GET":
+        return 200, state.appconfig
+    if parts == ["appconfig"] and method == "PUT":
+        state.appconfig.update(body or {})
+        return 200, None
+
+    if len(parts) == 4 and (parts[0], parts[2]) in BINDINGS:
+        if method in ("POST", "DELETE"):
+            state.bind(parts[0], parts[1], parts[2], parts[3], method == "POST")
+            return 200, None
+
+    if parts[0] in COLLECTIONS and len(parts) == 1:
+        if method == "GET":
+            return 200, state.list(parts[0])
+        if method == "POST":
+            return 201, state.create(parts[0], body)
+
+    if parts[0] in COLLECTIONS and len(parts) == 2:
+        if method == "GET":
+            return 200, state.get(parts[0], parts[1])
+        if method == "PUT":
+            state.update(parts[0], parts[1], body)
+            return 200, None
+        if method == "DELETE":
+            state.delete(parts[0], parts[1])
+            return 200, None
+
+    raise AppError(404, f"no route for {method} {path}")
+
+
+class RestHandler(BaseHTTPRequestHandler):
+    # Keep connections alive, like Pistache
+    protocol_version = "HTTP/1.1"
+    state = None
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split("?", 1)[0]
+        try:
+            payload = json.loads(raw) if raw else None
+            status, body = route(self.state, self.command, path, payload)
+        except AppError as ae:
+            status, body = ae.status, {"errors": [str(ae)]}
+        except (ValueError, TypeError) as e:
+            status, body = 400, {"errors": [str(e)]}
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+
+# ### **KPM Reports**
+#
+# Each UE replays one capture of its slice type, starting at a random row and
+# wrapping around at its end.
+class KpmSource:
+
+    def __init__(self, ues=DEFAULT_UES, data_root=UE_DATA_DIR, malicious_chance=0, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.malicious_chance = malicious_chance
+        data = load_ue_data(data_root)
+        self.traces = {}
+        self.cursors = {}
+        for imsi, slice_idx in ues.items():
+            slice_data = data[slice_idx]
+            lengths = np.array(slice_data.file_lengths)
+            file_idx = int(self.rng.choice(np.flatnonzero(lengths)))
+            rows = slice_data.rows(file_idx)
+            columns = [slice_data.columns.index(field) if field in slice_data.columns else None
+                       for field in KPM_FIELDS]
+            trace = np.zeros((len(rows), len(KPM_FIELDS)), dtype=np.int64)
+            for i, column in enumerate(columns):
+                if column is not None:
+                    trace[:, i] = np.nan_to_num(rows[:, column])
+            self.traces[imsi] = trace
+            self.cursors[imsi] = int(self.rng.integers(len(rows)))
+
+    def next_report(self, imsi, share=1.0):
+        trace = self.traces[imsi]
+        row = trace[self.cursors[imsi]].copy()
+        self.cursors[imsi] = (self.cursors[imsi] + 1) % len(trace)
+        scale = share
+        if self.malicious_chance and \
+                self.rng.integers(0, self.malicious_chance + 1) == self.malicious_chance:
+            scale *= 10
+        dl_bytes = KPM_FIELDS.index("dl_bytes")
+        row[dl_bytes] = int(row[dl_bytes] * scale)
+        return {imsi: {field: str(int(value)) for field, value in zip(KPM_FIELDS, row)}}
+
+
+def send_report(server, message, stats):
+    # One report the way ue_data_to_DRL sends it: accept, send, wait for the
+    # ACK, close
+    conn, _ = server.accept()
+    with conn:
+        start = time.perf_counter()
+        try:
+            conn.sendall(message)
+            conn.recv(1024)
+        except OSError:
+            # The client went away before it ACKed; the report is lost
+            stats["lost"] += 1
+            return
+        stats["ack_latency"].append(time.perf_counter() - start)
+
+
+def drain_acks(conn):
+    # The client ACKs every streamed report; read the ACKs so that neither
+    # side's socket buffer fills up and blocks the other
+    try:
+        while conn.recv(65536):
+            pass
+    except OSError:
+        pass
+
+
+def accept_stream(server):
+    stream, _ = server.accept()
+    threading.Thread(target=drain_acks, args=(stream,), daemon=True).start()
+    return stream
+
+
+def run_kpm(args, state, source, stats, stop):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((args.host, args.kpm_port))
+    server.listen(3)
+    stream = None
+    if args.kpm_stream:
+        stream = accept_stream(server)
+
+    next_round = time.monotonic()
+    while not stop.is_set():
+        shares = state.ue_shares()
+        for imsi in source.traces:
+            message = json.dumps(source.next_report(imsi, shares.get(imsi, 0.0)),
+                                 separators=(",", ":")).encode()
+            if stream is not None:
+                try:
+                    stream.sendall(message + b"\n")
+                except OSError:
+                    # The client went away; wait for it to reconnect
+                    stream.close()
+                    stream = accept_stream(server)
+                    continue
+            else:
+                send_report(server, message, stats)
+            stats["reports"] += 1
+        # Rounds missed while waiting for a client are skipped, not replayed
+        next_round = max(next_round + args.kpm_interval, time.monotonic())
+        stop.wait(max(0.0, next_round - time.monotonic()))
+
+
+def emulate(args):
+    state = RicState()
+    source = KpmSource(data_root=args.data_root, malicious_chance=args.malicious_chance,
+                       seed=args.seed)
+
+    RestHandler.state = state
+    RestHandler.latency = args.rest_latency
+    rest = ThreadingHTTPServer((args.host, args.rest_port), RestHandler)
+    rest.daemon_threads = True
+    threading.Thread(target=rest.serve_forever, daemon=True).start()
+    print(f"Northbound API on http://{args.host}:{args.rest_port}/v1")
+
+    stats = {"reports": 0, "lost": 0, "ack_latency": deque(maxlen=ACK_HISTORY)}
+    stop = threading.Event()
+    kpm = threading.Thread(target=run_kpm, args=(args, state, source, stats, stop),
+                           daemon=True)
+    kpm.start()
+    print(f"KPM reports on {args.host}:{args.kpm_port} every {args.kpm_interval}s")
+
+    try:
+        while kpm.is_alive():
+            kpm.join(timeout=10)
+            if stats["ack_latency"]:
+                latency = np.array(stats["ack_latency"]) * 1e3
+                print(f"\rReports sent: {stats['reports']}\tACK latency p50 "
+                      f"{np.median(latency):.2f} ms, p99 {np.percentile(latency, 99):.2f} ms",
+                      end="")
+    except KeyboardInterrupt:
+        print()
+    finally:
+        stop.set()
+        rest.shutdown()
+    return 0
+
+
+def main():
+
+    args = parse()
+    return emulate(args)
+
+
+if __name__ == "__main__":
+    rc = main()
+    sys.exit(rc)
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# ### **Slice Data Cache**
+#
+# The captured KPM traces in `Slicing_UE_Data/{Embb,Medium,Urllc}` and
+# `Slicing_Raw_Data` are many small CSV files. Parsing them with
+# `pd.read_csv` on every run is slow, and every parallel worker ends up with
+# its own copy of the same frames.
+#
+# `load_csv_dir` converts a directory of CSV files into a columnar cache
+# once. The cache is one float64 `.npy` matrix per directory, with the rows of
+# all files stacked in file-name order. Each column of the matrix is a CSV
+# header seen in any of the files, and files without that column hold NaN
+# there. A `.json` index next to it stores the column names, the file names,
+# each file's row offsets and the columns each file had, in its own order. Later runs memory-map the matrix, so
+# trainers and workers on the same host share the same pages instead of
+# reparsing the CSVs.
+#
+# The index also records the size, mtime and SHA-1 of every source file. A
+# file whose mtime changed is re-hashed and the cache is only rebuilt if its
+# contents changed too. Adding or removing a file also triggers a rebuild.
+# Each build writes its matrix to a new file named after the source hashes.
+# The index is then swapped in atomically, so readers never pair an index
+# with the wrong matrix.
+#
+# Caches live in `.slice_cache/` inside the data directory unless another
+# `cache_dir` is given.
+UE_DATA_DIR = "Slicing_UE_Data"
+RAW_DATA_DIR = "Slicing_Raw_Data"
+SLICES = ["Embb", "Medium", "Urllc"]
+CACHE_DIR_NAME = ".slice_cache"
+CACHE_VERSION = 1
+
+
+class SliceData:
+    # A memory-mapped cache of one directory of CSV files
+
+    def __init__(self, data, columns, files, offsets, file_columns):
+        self.data = data
+        self.columns = list(columns)
+        self.files = list(files)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.file_columns = [list(c) for c in file_columns]
+        self._column_index = {name: i for i, name in enumerate(self.columns)}
+
+    def __len__(self):
+        # Number of source files
+        return len(self.files)
+
+    @property
+    def file_lengths(self):
+        return np.diff(self.offsets).tolist()
+
+    def rows(self, file_idx):
+        # All rows of one source file, as a view into the cache
+        return self.data[self.offsets[file_idx] : self.offsets[file_idx + 1]]
+
+    def column(self, name, file_idx=None):
+        # One column, either across all files or for a single file
+        values = self.data[:, self._column_index[name]]
+        if file_idx is None:
+            return values
+        return values[self.offsets[file_idx] : self.offsets[file_idx + 1]]
+
+    def to_frames(self):
+        # One DataFrame per source file, with the columns that file had
+        import pandas as pd
+
+        frames = []
+        for i, file_columns in enumerate(self.file_columns):
+            columns = [self.columns[c] for c in file_columns]
+            frames.append(pd.DataFrame(self.rows(i)[:, file_columns], columns=columns))
+        return frames
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".csv"))
+
+
+def _cache_paths(directory, cache_dir):
+    # Cache directory and index file of `directory`
+    if cache_dir is None:
+        cache_dir = os.path.join(directory, CACHE_DIR_NAME)
+    name = os.path.basename(os.path.normpath(directory))
+    return cache_dir, os.path.join(cache_dir, f"{name}.json")
+
+
+def _write_atomic(path, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _write_index(index_path, index):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=1)
+
+    _write_atomic(index_path, write)
+
+
+def _is_fresh(directory, files, index, index_path):
+    # Check the cache against the source files, re-hashing only files whose
+    # mtime or size changed
+    if index.get("version") != CACHE_VERSION or index.get("files") != files:
+        return False
+    touched = False
+    for name, source in zip(files, index["sources"]):
+        stat = os.stat(os.path.join(directory, name))
+        if stat.st_size != source["size"]:
+            return False
+        if stat.st_mtime_ns != source["mtime_ns"]:
+            if _file_hash(os.path.join(directory, name)) != source["sha1"]:
+                return False
+            source["mtime_ns"] = stat.st_mtime_ns
+            touched = True
+    if touched:
+        # Contents unchanged: remember the new mtimes to skip re-hashing
+        _write_index(index_path, index)
+    return True
+
+
+def build_cache(directory, cache_dir=None):
+    # Parse every CSV file in `directory` and write its cache
+    import pandas as pd
+
+    cache_dir, index_path = _cache_paths(directory, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    files = _source_files(directory)
+    frames = []
+    sources = []
+    for name in files:
+        path = os.path.join(directory, name)
+        stat = os.stat(path)
+        frames.append(pd.read_csv(path, encoding="utf-8-sig"))
+        sources.append(
+            {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha1": _file_hash(path),
+            }
+        )
+
+    columns = []
+    for frame in frames:
+        columns.extend(c for c in frame.columns if c not in columns)
+    file_columns = [[columns.index(c) for c in frame.columns] for frame in frames]
+    offsets = np.concatenate(([0], np.cumsum([len(frame) for frame in frames])))
+    data = np.full((offsets[-1], len(columns)), np.nan)
+    for frame, cols, start, end in zip(frames, file_columns, offsets[:-1], offsets[1:]):
+        data[start:end, cols] = frame.to_numpy(dtype=np.float64)
+
+    # Write the matrix under a name unique to these sources, then publish it
+    # by replacing the index
+    key = hashlib.sha1("".join(source["sha1"] for source in sources).encode())
+    prefix = os.path.basename(index_path)[: -len(".json")]
+    data_file = f"{prefix}.{key.hexdigest()[:16]}.npy"
+
+    def write_data(tmp):
+        with open(tmp, "wb") as f:
+            np.save(f, data)
+
+    _write_atomic(os.path.join(cache_dir, data_file), write_data)
+    index = {
+        "version": CACHE_VERSION,
+        "data": data_file,
+        "columns": columns,
+        "files": files,
+        "offsets": offsets.tolist(),
+        "file_columns": file_columns,
+        "sources": sources,
+    }
+    _write_index(index_path, index)
+
+    # Drop matrices of earlier builds; processes that still map them keep
+    # their pages until they exit
+    for name in os.listdir(cache_dir):
+        if (
+            name.startswith(f"{prefix}.")
+            and name.endswith(".npy")
+            and name != data_file
+        ):
+            os.remove(os.path.join(cache_dir, name))
+    return SliceData(data, columns, files, offsets, file_columns)
+
+
+def load_csv_dir(directory, cache_dir=None, rebuild=False):
+    # Load a directory of CSV files through its cache, building it if needed
+    cache_path, index_path = _cache_paths(directory, cache_dir)
+    if not rebuild and os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        data_path = os.path.join(cache_path, index.get("data", ""))
+        if os.path.isfile(data_path) and _is_fresh(
+            directory, _source_files(directory), index, index_path
+        ):
+            data = np.load(data_path, mmap_mode="r")
+            return SliceData(
+                data,
+                index["columns"],
+                index["files"],
+                index["offsets"],
+                index["file_columns"],
+            )
+    return build_cache(directory, cache_dir)
+
+
+def load_ue_data(root=UE_DATA_DIR, cache_dir=None):
+    # SliceData of the eMBB, Medium and URLLC captures, in that order
+    return [load_csv_dir(os.path.join(root, name), cache_dir) for name in SLICES]
+
+
+def load_raw_data(root=RAW_DATA_DIR, cache_dir=None):
+    return load_csv_dir(root, cache_dir)
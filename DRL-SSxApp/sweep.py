@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# # `sweep.py` -- Parallel malicious-chance sweeps over the DQN, DDQN and Dueling DQN models
+#
+# Runs the attack scenarios of `model_inference_all_slices_proportional_attack.py`
+# and `model_inference_single_slice_targeted_attack.py` over the full
+# (model_type x malicious_chance x seed) grid on a process pool:
+#
+# - Every checkpoint is read from disk once, in the parent process, and handed
+#   to each worker when the pool starts, so no scenario calls `torch.load`.
+# - Each worker limits itself to `--threads_per_worker` torch threads so that
+#   the workers do not oversubscribe the cores.
+# - Each grid point draws from its own RNG stream, derived from `--seed` and
+#   the grid point with `np.random.SeedSequence`, so results do not depend on
+#   the number of workers or on scheduling order.
+# - The results of all workers are merged into one CSV.
+#
+# Example:
+#
+# ```bash
+# python3 sweep.py --scenario proportional --model_types DQN DDQN Dueling \
+#     --num_seeds 5 --num_episodes 300000 --workers 32
+# ```
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import torch
+
+from model_registry import get_model
+from networks import NETWORKS
+
+# Model types in a fixed order, used to derive each grid point's RNG stream
+MODELS = list(NETWORKS)
+
+SCENARIOS = {
+    "proportional": "model_inference_all_slices_proportional_attack",
+    "targeted": "model_inference_single_slice_targeted_attack",
+}
+
+RESULT_COLUMNS = [
+    "Model",
+    "Scenario",
+    "Malicious Chance",
+    "Seed",
+    "Num Episodes",
+    "Average Throughput",
+    "Accuracy",
+]
+
+# Per-worker state, filled in by init_worker
+_agents = {}
+_scenario = None
+
+
+def parse():
+    """
+    Reads in CLI arguments
+    Returns argparse arguments object
+    """
+    parser = argparse.ArgumentParser(
+        description="Run malicious-chance sweeps for the DQN, DDQN and Dueling DQN models in parallel")
+    parser.add_argument(
+        "--scenario",
+        type=str,
+        default="proportional",
+        help="Attack scenario to run. Options: proportional | targeted")
+    parser.add_argument(
+        "--model_types",
+        type=str,
+        nargs="+",
+        default=["DQN", "DDQN", "Dueling"],
+        help="Types of model to sweep. Options: DQN, DDQN, Dueling")
+    parser.add_argument(
+        "--malicious_chances",
+        type=int,
+        nargs="+",
+        default=list(range(0, 101, 10)),
+        help="Percentages of malicious episodes to run")
+    parser.add_argument(
+        "--num_seeds",
+        type=int,
+        default=1,
+        help="The number of seeds to run for every model and malicious chance")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Base seed from which every grid point's RNG stream is derived")
+    parser.add_argument(
+        "--num_episodes",
+        type=int,
+        default=300000,
+        help="The number of episodes to run")
+    parser.add_argument(
+        "--target_slice",
+        type=int,
+        default=0,
+        help="Slice attacked in the targeted scenario")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes")
+    parser.add_argument(
+        "--threads_per_worker",
+        type=int,
+        default=1,
+        help="Number of torch threads each worker may use")
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="sweep_results.csv",
+        help="CSV file the merged results are written to")
+    return parser.parse_args()
+
+
+def load_state_dicts(model_types):
+    # Read every requested checkpoint once
+    return {
+        model_type: get_model(model_type).state_dict()
+        for model_type in model_types
+    }
+
+
+def init_worker(state_dicts, scenario, threads_per_worker):
+    # Build each model once per worker process
+    global _scenario
+    torch.set_num_threads(threads_per_worker)
+    for model_type, state_dict in state_dicts.items():
+        agent = NETWORKS[model_type](3, 4, seed=0)
+        agent.load_state_dict(state_dict)
+        agent.eval()
+        _agents[model_type] = agent
+    _scenario = __import__(SCENARIOS[scenario])
+
+
+def run_grid_point(model_type, malicious_chance, seed, num_episodes, base_seed, target_slice):
+    # Derive an independent RNG stream from the base seed and the grid point
+    model_idx = MODELS.index(model_type)
+    stream = np.random.SeedSequence([base_seed, model_idx, malicious_chance, seed])
+    rng_seed = int(stream.generate_state(1)[0])
+
+    agent = _agents[model_type]
+    if _scenario.__name__ == SCENARIOS["targeted"]:
+        accuracy, avg_throughput = _scenario.run_inference_epoch_batched(
+            agent, num_episodes, malicious_chance, target_slice, seed=rng_seed)
+    else:
+        accuracy, avg_throughput, _ = _scenario.run_inference_epoch_batched(
+            agent, num_episodes, malicious_chance, seed=rng_seed)
+    return [model_type, malicious_chance, seed, num_episodes, avg_throughput, float(accuracy)]
+
+
+def sweep(args):
+    for model_type in args.model_types:
+        if model_type not in MODELS:
+            raise ValueError(f"Unknown model type: {model_type}")
+    if args.scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario: {args.scenario}")
+
+    state_dicts = load_state_dicts(args.model_types)
+    grid = [
+        (model_type, malicious_chance, seed)
+        for model_type in args.model_types
+        for malicious_chance in args.malicious_chances
+        for seed in range(args.num_seeds)
+    ]
+
+    start = time.time()
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=init_worker,
+        initargs=(state_dicts, args.scenario, args.threads_per_worker),
+    ) as pool:
+        futures = [
+            pool.submit(run_grid_point, model_type, malicious_chance, seed,
+                        args.num_episodes, args.seed, args.target_slice)
+            for model_type, malicious_chance, seed in grid
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            results.append(future.result())
+            print(f"\rCompleted {done}/{len(grid)} scenarios", end="")
+    print(f"\nSweep finished in {time.time() - start:.1f}s")
+
+    df_results = pd.DataFrame(
+        [[row[0], args.scenario] + row[1:] for row in results], columns=RESULT_COLUMNS)
+    df_results.sort_values(["Model", "Malicious Chance", "Seed"], inplace=True)
+    df_results.to_csv(args.output, index=False)
+    print(f"Results saved to {args.output}")
+
+    return 0
+
+
+def main():
+
+    args = parse()
+    return sweep(args)
+
+
+if __name__ == "__main__":
+    rc = main()
+    sys.exit(rc)
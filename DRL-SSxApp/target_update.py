@@ -0,0 +1,45 @@
+import torch
+
+
+# ### **Target Network Updates**
+#
+# TargetUpdater keeps the target Q-network of an agent in step with its local
+# Q-network after every `learn()` call, using one of two rules:
+#
+# - **Soft update** (default): every call moves the target parameters towards
+#   the local ones,
+#   $$ \\theta_{\\text{target}} \\leftarrow \\tau \\theta_{\\text{local}} +
+#   (1 - \\tau) \\theta_{\\text{target}}. $$
+#   All parameters are updated in place by a single multi-tensor (`foreach`)
+#   lerp over the flattened parameter lists, so no temporaries are allocated
+#   and no Python loop runs per parameter.
+# - **Hard update**: when `hard_update_every` is set, the target is left alone
+#   and every `hard_update_every` calls the local parameters are copied over,
+#   as in the original DQN.
+#
+# The parameter lists are collected once, when the updater is created.
+class TargetUpdater:
+
+    def __init__(self, local_model, target_model, tau, hard_update_every=None):
+        self.local_params = [p.data for p in local_model.parameters()]
+        self.target_params = [p.data for p in target_model.parameters()]
+        self.tau = tau
+        self.hard_update_every = hard_update_every
+        self.calls = 0
+
+    def update(self):
+        self.calls += 1
+        if self.hard_update_every:
+            if self.calls % self.hard_update_every == 0:
+                self.hard_update()
+        else:
+            self.soft_update(self.tau)
+
+    @torch.no_grad()
+    def soft_update(self, tau):
+        torch._foreach_lerp_(self.target_params, self.local_params, tau)
+
+    @torch.no_grad()
+    def hard_update(self):
+        for target_param, local_param in zip(self.target_params, self.local_params):
+            target_param.copy_(local_param)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The xApp modules are flat scripts in DRL-SSxApp/, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
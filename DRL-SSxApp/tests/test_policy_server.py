@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import json
+import os
+
+import numpy as np
+
+import policy_server
+from numpy_policy import NumpyPolicy, save_npz
+
+
+def small_policy(tmp_path):
+    rng = np.random.default_rng(0)
+    sizes = [(8, 3), (8, 8), (8, 8), (8, 8), (4, 8)]
+    state_dict = dict()
+    for i, shape in enumerate(sizes, 1):
+        state_dict[f"l{i}.weight"] = rng.normal(size=shape)
+        state_dict[f"l{i}.bias"] = rng.normal(size=shape[0])
+    npz_file = os.path.join(tmp_path, "small.npz")
+    save_npz(state_dict, npz_file)
+    return NumpyPolicy("DQN", npz_file)
+
+
+async def exchange(tmp_path, payload, num_replies, eof=False):
+    batcher = policy_server.MicroBatcher(small_policy(tmp_path), max_wait=0)
+    batcher_task = asyncio.ensure_future(batcher.run())
+    args = argparse.Namespace(socket=os.path.join(tmp_path, "policy.sock"),
+                              max_request_states=16)
+    server = await policy_server.start_server(batcher, args)
+    try:
+        reader, writer = await asyncio.open_unix_connection(args.socket)
+        writer.write(payload)
+        if eof:
+            writer.write_eof()
+        await writer.drain()
+        replies = [json.loads(await asyncio.wait_for(reader.readline(), 5))
+                   for _ in range(num_replies)]
+        writer.close()
+        return replies
+    finally:
+        server.close()
+        batcher_task.cancel()
+        batcher.executor.shutdown(wait=False)
+
+
+def request(request_id):
+    return json.dumps({"id": request_id, "state": [1.0, 2.0, 3.0]}).encode() + b"\n"
+
+
+def test_overlong_line_does_not_drop_next_request(tmp_path, monkeypatch):
+    # The overlong line and the requests after it arrive in one buffer
+    monkeypatch.setattr(policy_server, "LINE_LIMIT", 1000)
+    payload = b"x" * 3000 + b"\n" + request(2) + request(3)
+    replies = asyncio.run(exchange(tmp_path, payload, 3))
+    assert "error" in replies[0] and replies[0]["id"] is None
+    assert sorted(reply["id"] for reply in replies[1:]) == [2, 3]
+    assert all("actions" in reply for reply in replies[1:])
+
+
+def test_overlong_line_without_newline_yet(tmp_path, monkeypatch):
+    # The overlong line exceeds the limit before its newline is buffered
+    monkeypatch.setattr(policy_server, "LINE_LIMIT", 1000)
+    payload = b"x" * 100000 + b"\n" + request(2)
+    replies = asyncio.run(exchange(tmp_path, payload, 2))
+    assert "error" in replies[0]
+    assert replies[1]["id"] == 2 and "actions" in replies[1]
+
+
+def test_last_request_without_newline(tmp_path):
+    payload = request(1) + request(2).rstrip(b"\n")
+    replies = asyncio.run(exchange(tmp_path, payload, 2, eof=True))
+    assert sorted(reply["id"] for reply in replies) == [1, 2]
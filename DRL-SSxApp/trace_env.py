@@ -0,0 +1,146 @@
+import numpy as np
+
+from common import BASE_ACTION_PRBS, BASE_DL_BYTE_TO_PRB_RATES, VectorSliceEnv
+from slice_data import SLICES, UE_DATA_DIR, load_ue_data
+
+# ### **Trace-Replay Environment**
+#
+# VectorSliceEnv draws every state from a fixed DL-byte-to-PRB rate, so the
+# traffic of a slice is constant until a malicious event multiplies it.
+# TraceSliceEnv keeps the same actions, rewards and episode rules but replays
+# the `dl_bytes` captured per UE in `Slicing_UE_Data` instead.
+#
+# On every reset each environment picks, for each slice, one capture of that
+# slice type and a random starting row in it. Every state draw then reads the
+# next row of that capture, wrapping around at its end, and scales it by
+#
+# $$ s = \\text{dl\\_bytes}_{t} \\cdot \\frac{\\text{PRBs}}{\\text{base PRBs}}
+# \\cdot \\frac{\\text{rate}}{\\text{base rate}}, $$
+#
+# so a slice at its base allocation sees the captured traffic and a malicious
+# event still amplifies it tenfold. With `amplify=False` there are no
+# malicious events and the captured traffic is replayed as is.
+#
+# The synthetic DL_BYTES_THRESHOLD does not fit the captures: more than half
+# of the benign eMBB rows and a fifth of the Medium rows exceed it, so the
+# reward would pay the agent for securing benign traffic. Unless
+# `dl_bytes_threshold` is given, each slice's threshold is the
+# `threshold_percentile` percentile of its captured `dl_bytes`, which by
+# default leaves 1% of the benign rows above it.
+#
+# The `dl_bytes` columns of the three slice types are copied once into a
+# single contiguous array, and each (environment, slice) pair keeps the
+# position of its capture in that array, its length and a cursor. A state draw
+# for all environments is one fancy-indexing read, so stepping costs about the
+# same as stepping VectorSliceEnv.
+TRACE_COLUMN = "dl_bytes"
+
+
+class TraceSliceEnv(VectorSliceEnv):
+
+    def __init__(
+        self,
+        num_envs,
+        max_t=4,
+        malicious_chance=1000,
+        malicious_chance_increase=0.0,
+        dl_bytes_threshold=None,
+        seed=None,
+        data_root=UE_DATA_DIR,
+        cache_dir=None,
+        amplify=True,
+        threshold_percentile=99.0,
+    ):
+        traces = []
+        file_starts = []
+        file_lengths = []
+        num_files = []
+        base = 0
+        for data in load_ue_data(data_root, cache_dir):
+            trace = np.asarray(data.column(TRACE_COLUMN), dtype=np.float64)
+            lengths = np.diff(data.offsets)
+            keep = lengths > 0
+            traces.append(np.nan_to_num(trace))
+            file_starts.append(base + data.offsets[:-1][keep])
+            file_lengths.append(lengths[keep])
+            num_files.append(np.count_nonzero(keep))
+            base += len(trace)
+        for name, count in zip(SLICES, num_files):
+            if count == 0:
+                raise ValueError(f"No non-empty {name} capture in {data_root}")
+        self.trace = np.concatenate(traces)
+        if dl_bytes_threshold is None:
+            dl_bytes_threshold = [
+                np.percentile(trace, threshold_percentile) for trace in traces
+            ]
+
+        # Captures of all slice types in one table; slice s owns the entries
+        # from first_file[s] to first_file[s] + num_files[s]
+        self.file_starts = np.concatenate(file_starts)
+        self.file_lengths = np.concatenate(file_lengths)
+        self.num_files = np.asarray(num_files, dtype=np.float64)
+        self.first_file = np.concatenate(([0], np.cumsum(num_files)[:-1]))
+        self.amplify = amplify
+        self._scale = 1.0 / (
+            np.asarray(BASE_ACTION_PRBS, dtype=np.float64)
+            * np.asarray(BASE_DL_BYTE_TO_PRB_RATES, dtype=np.float64)
+        )
+
+        # Capture start, capture length and cursor of every (env, slice)
+        self.starts = np.zeros((num_envs, 3), dtype=np.int64)
+        self.lengths = np.ones((num_envs, 3), dtype=np.int64)
+        self.cursors = np.zeros((num_envs, 3), dtype=np.int64)
+
+        super().__init__(
+            num_envs,
+            max_t=max_t,
+            malicious_chance=malicious_chance,
+            malicious_chance_increase=malicious_chance_increase,
+            dl_bytes_threshold=dl_bytes_threshold,
+            seed=seed,
+        )
+
+    def reset(self, mask=None):
+        # Pick a fresh capture window per slice before drawing the initial
+        # states of the environments selected by `mask`.
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        rows = self._rows[mask]
+        draws = self.rng.random((2, rows.size, 3))
+        files = self.first_file + (draws[0] * self.num_files).astype(np.int64)
+        lengths = self.file_lengths[files]
+        self.starts[rows] = self.file_starts[files]
+        self.lengths[rows] = lengths
+        self.cursors[rows] = (draws[1] * lengths).astype(np.int64)
+        return super().reset(mask)
+
+    def state_dict(self):
+        state = super().state_dict()
+        state["starts"] = self.starts.copy()
+        state["lengths"] = self.lengths.copy()
+        state["cursors"] = self.cursors.copy()
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.starts[:] = state["starts"]
+        self.lengths[:] = state["lengths"]
+        self.cursors[:] = state["cursors"]
+
+    def _draw_malicious(self, rows):
+        if self.amplify:
+            super()._draw_malicious(rows)
+
+    def _observe(self, rows):
+        # Read the next captured row of every slice and advance the cursors.
+        # `step` draws for every environment, which needs no row gather.
+        if rows.size == self.num_envs:
+            rows = slice(None)
+        cursors = self.cursors[rows]
+        lengths = self.lengths[rows]
+        dl_bytes = self.trace[self.starts[rows] + cursors]
+        cursors += 1
+        cursors[cursors == lengths] = 0
+        self.cursors[rows] = cursors
+        scale = self.action_prbs[rows] * self.dl_byte_to_prb_rates[rows] * self._scale
+        return (dl_bytes * scale).astype(np.int64)